@@ -1,6 +1,5 @@
 import logging
-import os, re, yaml
-from multiprocessing import cpu_count;
+import os, json
 from .version import __version__
 
                                                                                
@@ -18,6 +17,8 @@ def _parseIDLStartup( startupFile, config ):
   Outputs:
       None. Sets/updates global variables
   """
+  import re
+
   IDLcomment = re.compile(r'^\s*\;')                                          # Pattern for comment line   
   IDLDefSysV = re.compile(r'(?:\,\s*[\'\"](\!?[^\'\"]+)[\'\"])')              # Pattern for extracting system variable and associated string; we ignore all system variables that are NOT strings 
   IDLDefLclV = re.compile(r'^\s*([\s\w\d\_]+=.+)')                            # Pattern for variable definition
@@ -56,7 +57,7 @@ os.environ['PYART_QUIET'] = '1';
 
 HOME        = os.path.expanduser('~');                                    # Get home directory of user running package
 
-NCPU         = cpu_count() // 2                                            # Set package wide CPU count to half the total number of CPUs
+NCPU         = (os.cpu_count() or 1) // 2                                  # Set package wide CPU count to half the total number of CPUs
 if NCPU > 6:                                                                    # If NCPU is greater than 6, force to 6 
   NCPU = 6
 elif NCPU < 1:                                                                  # Else, if less than 1, force to 1
@@ -82,30 +83,123 @@ def consoleLogger():
 # Define data directory for package
 DATADIR = os.path.join( os.path.dirname(__file__), 'data' )
 
-# Read in list of stations
+CACHEDIR = os.path.join(
+  os.environ.get( 'XDG_CACHE_HOME', os.path.join( HOME, '.cache' ) ),
+  'aws_atmo' )                                                                  # Directory for cached listings and parsed data files
+
 NEXRAD_STATION_ID_FILE = os.path.join(DATADIR, 'nexrad_station_id_list.yml' )
-with open(NEXRAD_STATION_ID_FILE, 'r') as fid:
-  NEXRAD_STATION_ID_LIST = yaml.load( fid, Loader=yaml.SafeLoader )
-NEXRAD_STATION_IDS = NEXRAD_STATION_ID_LIST['143']
-
-# Read in data path configure
-CONFIG   = os.path.join(HOME, '.{}rc'.format(__name__))
-if not os.path.isfile( CONFIG ):
-  CONFIG = os.path.join(DATADIR, 'configrc.yml')
-with open(CONFIG, 'r') as fid:
-  CONFIG = yaml.safe_load(fid)
-
-if CONFIG['defaults']['noaa_wct_batch_config'] == '':
-  CONFIG['defaults']['noaa_wct_batch_config'] = os.path.join( DATADIR, 'wctBatchConfig_GridRad.xml' )
-
-if 'version' not in CONFIG or not isinstance(CONFIG['version'], dict):
-  CONFIG['version'] = {'nexrad_level3_version'    : 'v' + '_'.join(__version__.split('.')),
-                       'nexrad_level3_3d_version' : 'v' + '_'.join(__version__.split('.')) }
-else:
-  if CONFIG['version'].get('nexrad_level3_version', '') == '' :
-    CONFIG['version']['nexrad_level3_version'] = 'v' + '_'.join(__version__.split('.'))
-  if CONFIG['version'].get('nexrad_level3_3d_version', '') == '':
-    CONFIG['version']['nexrad_level3_3d_version'] = 'v' + '_'.join(__version__.split('.'))
+
+def _parseYAML( path ):
+
+  import yaml
+  with open(path, 'r') as fid:
+    return yaml.safe_load(fid)
+
+def _cached( path, parse ):
+  """
+  Parse a data file, or get what it parsed to from the cache
+
+  Parsed data are kept as JSON in CACHEDIR and reused while the
+  modification time and size of the file are unchanged, so PyYAML is
+  only imported when a file has changed. Data that JSON can't hold
+  exactly (e.g., YAML dates) are not cached.
+
+  Arguments:
+    path (str) : File to parse
+    parse (callable) : Function that parses path
+
+  Returns:
+    Parsed data
+
+  """
+
+  path      = os.path.abspath( path )
+  info      = os.stat( path )
+  stamp     = [info.st_mtime_ns, info.st_size]
+  cacheFile = os.path.join( CACHEDIR, 'parsed.json' )
+  try:
+    with open(cacheFile, 'r') as fid:
+      cache = json.load( fid )
+  except (OSError, ValueError):
+    cache = {}
+  entry = cache.get( path, None )
+  if isinstance(entry, dict) and entry.get('stamp', None) == stamp:
+    return entry['data']
+
+  data = parse( path )
+  try:
+    if json.loads( json.dumps( data ) ) != data: return data                    # e.g., non-string keys, dates
+    cache[path] = {'stamp' : stamp, 'data' : data}
+    if not os.path.isdir( CACHEDIR ): os.makedirs( CACHEDIR )
+    tmp = f'{cacheFile}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as fid:
+      json.dump( cache, fid )
+    os.replace( tmp, cacheFile )                                                # Readers never see a partial file
+  except (OSError, TypeError, ValueError) as err:
+    LOG.debug( f'Could not cache parsed {path} : {err}' )
+  return data
+
+def getStationIDList():
+  """
+  Lists of NEXRAD station IDs, by number of stations
+
+  Read on first use; see NEXRAD_STATION_ID_LIST and NEXRAD_STATION_IDS
+
+  """
+
+  global NEXRAD_STATION_ID_LIST, NEXRAD_STATION_IDS
+  if 'NEXRAD_STATION_ID_LIST' not in globals():
+    NEXRAD_STATION_ID_LIST = _cached( NEXRAD_STATION_ID_FILE, _parseYAML )
+    NEXRAD_STATION_IDS     = NEXRAD_STATION_ID_LIST['143']
+  return NEXRAD_STATION_ID_LIST
+
+def getConfig():
+  """
+  Package configuration
+
+  Read on first use from ~/.aws_atmorc, or the default configrc.yml,
+  and updated from the IDL startup file if IDL_STARTUP is set; see
+  CONFIG
+
+  """
+
+  global CONFIG
+  if 'CONFIG' in globals(): return CONFIG
+
+  # Read in data path configure
+  config = os.path.join(HOME, '.{}rc'.format(__name__))
+  if not os.path.isfile( config ):
+    config = os.path.join(DATADIR, 'configrc.yml')
+  config = _cached( config, _parseYAML )
+
+  if config['defaults']['noaa_wct_batch_config'] == '':
+    config['defaults']['noaa_wct_batch_config'] = os.path.join( DATADIR, 'wctBatchConfig_GridRad.xml' )
+
+  if 'version' not in config or not isinstance(config['version'], dict):
+    config['version'] = {'nexrad_level3_version'    : 'v' + '_'.join(__version__.split('.')),
+                         'nexrad_level3_3d_version' : 'v' + '_'.join(__version__.split('.')) }
+  else:
+    if config['version'].get('nexrad_level3_version', '') == '' :
+      config['version']['nexrad_level3_version'] = 'v' + '_'.join(__version__.split('.'))
+    if config['version'].get('nexrad_level3_3d_version', '') == '':
+      config['version']['nexrad_level3_3d_version'] = 'v' + '_'.join(__version__.split('.'))
+
+  # If IDL startup file defined, then overwrite any variables using those values
+  if ('IDL_STARTUP' in os.environ):
+    config.update( _cached( os.environ.get('IDL_STARTUP'), lambda path : _parseIDLStartup( path, {} ) ) )
+
+  CONFIG = config
+  return CONFIG
+
+def __getattr__( name ):
+  """Read station lists and configuration the first time they are used"""
+
+  if name == 'CONFIG':
+    return getConfig()
+  if name in ('NEXRAD_STATION_ID_LIST', 'NEXRAD_STATION_IDS'):
+    getStationIDList()
+    return globals()[name]
+  raise AttributeError( f'module {__name__!r} has no attribute {name!r}' )
 
 # Test vars
 #root                   = '/Volumes/Free_Space'
@@ -134,12 +228,8 @@ else:
 
 #NOAA_WCT_EXPORT          = os.path.join('/', 'Users', 'kwodzicki', 'wct-4.3.1', 'wct-export')
 
-# If IDL startup file defined, then overwrite any variables using those values
-if ('IDL_STARTUP' in os.environ):
-    CONFIG = _parseIDLStartup( os.environ.get('IDL_STARTUP'), CONFIG )
-
 def setDefaults( kwargs = {} ):
-  for key, val in CONFIG['defaults'].items():
+  for key, val in getConfig()['defaults'].items():
     if key not in kwargs:
       kwargs[key] = val
   return kwargs
@@ -0,0 +1,403 @@
+"""
+Run downloads from a long-running service
+
+Every call to level2(), gfs() or hrrr() starts a scheduler, which
+imports boto3, opens the listing cache, spawns download processes and
+connects them to the bucket. For the small pulls a cron job makes, that
+start up takes longer than the download. A DownloadDaemon is started
+once and takes download jobs from clients over a local Unix socket, so
+that work is only done when the daemon starts.
+
+Clients send one line of JSON describing a job and read lines of JSON
+back until the job finishes:
+
+  request : {"kind" : "nexrad" or "nwp", "options" : {AWS_Scheduler
+            keywords}, "kwargs" : {keywords to the scheduler's download()}}
+  events  : {"event" : "queued", "job" : id, "ahead" : jobs before it}
+            {"event" : "started", "job" : id}
+            {"event" : "progress", "job" : id, "progress" : {...}}
+            {"event" : "done", "job" : id, "result" : [outdir, nSuccess,
+              nFail, size], "stats" : {...}}
+            {"event" : "error", "job" : id, "message" : str}
+
+Datetimes are sent as {"__datetime__" : ISO 8601 string}. Jobs run one
+at a time, in the order they arrive. Schedulers are kept running
+between jobs, so a job with the same options as an earlier one runs on
+download processes that are already started and connected.
+
+Example:
+  aws_atmo_daemon &
+  level2( date0, station = 'KHGX', outroot = outroot, daemon = True )
+
+"""
+import logging
+import os, json, signal, socket, tempfile, time
+from datetime import datetime
+from collections import OrderedDict
+from threading import Thread, Lock, Event as ThreadEvent
+from queue import Queue as ThreadQueue, Empty
+from socketserver import ThreadingUnixStreamServer, StreamRequestHandler
+
+from .downloader import TIMEOUT
+from .downloader.stats import QUANTILES
+from .downloader.progress import ProgressReporter, PROGRESS_INTERVAL, formatProgress
+
+SOCKET = os.path.join( os.environ.get( 'XDG_RUNTIME_DIR', tempfile.gettempdir() ),
+                       f'aws_atmo-{os.getuid()}.sock' )                         # Default socket; one per user
+KINDS  = ('nexrad', 'nwp')                                                      # Kinds of job a daemon runs
+WARM   = 4                                                                      # Most schedulers, with their download processes, kept between jobs
+
+def _schedulerClass( kind ):
+  """Scheduler class for a kind of job; imported here as those modules import this one"""
+
+  if kind == 'nexrad':
+    from .nexrad import NEXRAD_AWS_Scheduler
+    return NEXRAD_AWS_Scheduler
+  if kind == 'nwp':
+    from .nwp import NWP_AWS_Scheduler
+    return NWP_AWS_Scheduler
+  raise ValueError( f'Unknown kind of job : {kind}; must be one of {KINDS}' )
+
+def _encode( obj ):
+
+  if isinstance(obj, datetime): return {'__datetime__' : obj.isoformat()}
+  raise TypeError( f'Can not send {type(obj).__name__} to download daemon : {obj!r}' )
+
+def _decode( obj ):
+
+  if '__datetime__' in obj: return datetime.fromisoformat( obj['__datetime__'] )
+  return obj
+
+def _send( wfile, **message ):
+  """Write message as one line of JSON"""
+
+  wfile.write( (json.dumps( message, default = _encode ) + '\n').encode() )
+  wfile.flush()
+
+def _recv( rfile ):
+  """Read one line of JSON; None at end of stream"""
+
+  line = rfile.readline()
+  return json.loads( line, object_hook = _decode ) if line else None
+
+def summarize( stats, elapsed = None ):
+  """
+  Summarize download statistics of a job for its client
+
+  Arguments:
+    stats (StatsCollection) : Statistics from AWS_Scheduler.wait()
+
+  Keyword arguments:
+    elapsed (float) : Run time of the job; seconds
+
+  Returns:
+    dict : files, failed, bytes, retries, backoff and elapsed, plus
+      latency, ttfb and throughput quantiles; None if nothing was
+      transferred
+
+  """
+
+  nSuccess, nFail, size, dt = stats.totals()
+  nRetry, backoff           = stats.retries()
+  names                     = [f'p{100*q:g}' for q in QUANTILES]
+  quantiles                 = lambda hist : None if hist is None else dict( zip( names, hist.quantiles() ) )
+  latency, ttfb, throughput = stats.histograms()
+  return { 'files'      : nSuccess,
+           'failed'     : nFail,
+           'bytes'      : size,
+           'retries'    : nRetry,
+           'backoff'    : backoff,
+           'elapsed'    : elapsed,
+           'latency'    : quantiles( latency ),
+           'ttfb'       : quantiles( ttfb ),
+           'throughput' : quantiles( throughput ) }
+
+class Job( object ):
+  """
+  Download job waiting for, or running on, a DownloadDaemon
+
+  Events for the client are put on the events queue; the connection
+  handling the client writes them to the socket.
+
+  """
+
+  def __init__(self, jobID, kind, options = None, kwargs = None):
+    """
+    Arguments:
+      jobID (int) : Job number
+      kind (str) : Kind of job; one of KINDS
+
+    Keyword arguments:
+      options (dict) : Keywords for the scheduler
+      kwargs (dict) : Keywords for the scheduler's download() method
+
+    """
+
+    if kind not in KINDS:
+      raise ValueError( f'Unknown kind of job : {kind}; must be one of {KINDS}' )
+    self.id      = jobID
+    self.kind    = kind
+    self.options = options or {}
+    self.kwargs  = kwargs  or {}
+    self.events  = ThreadQueue()
+
+  def send(self, event, **kwargs):
+    """Queue event for the client"""
+
+    self.events.put( dict( event = event, job = self.id, **kwargs ) )
+
+class _JobReporter( ProgressReporter ):
+  """Stream progress of a running job to its client"""
+
+  def __init__(self, job, progress, interval):
+
+    super().__init__( progress, interval, log = False )
+    self.job = job
+
+  def report(self, log = None):
+
+    self.job.send( 'progress', progress = self.progress() )
+
+class _JobHandler( StreamRequestHandler ):
+  """Take a job from a client and stream its events back"""
+
+  def handle(self):
+
+    service = self.server.service
+    try:
+      request = _recv( self.rfile )
+      if request is None: return
+      job = service.submit( request.get('kind', None), request.get('options', None), request.get('kwargs', None) )
+    except Exception as err:
+      _send( self.wfile, event = 'error', job = None, message = f'Bad request : {err}' )
+      return
+
+    while True:
+      event = job.events.get()
+      try:
+        _send( self.wfile, **event )
+      except OSError:                                                           # Client went away; the job still runs
+        service.log.info( f'Client of job {job.id} disconnected' )
+        return
+      if event['event'] in ('done', 'error'): return
+
+class DownloadDaemon( object ):
+  """
+  Service that runs download jobs sent over a local Unix socket
+
+  Jobs are run one at a time in the main thread, as schedulers handle
+  SIGINT. SIGINT or SIGTERM cancels the running job and stops the
+  daemon; jobs still waiting are failed.
+
+  The scheduler of each job is kept, keyed by the job's kind and
+  options, and reused by later jobs with the same; the least recently
+  used are shut down once there are more than `warm`.
+
+  """
+
+  def __init__(self, path = SOCKET, interval = PROGRESS_INTERVAL, warm = WARM):
+    """
+    Keyword arguments:
+      path (str) : Unix socket to listen on
+      interval (float) : Seconds between progress events sent to the
+        client of a running job, unless the job sets its own progress
+        interval
+      warm (int) : Most schedulers to keep running between jobs
+
+    """
+
+    self.log       = logging.getLogger(__name__)
+    self.path      = path
+    self.interval  = interval
+    self._jobs     = ThreadQueue()                                              # Jobs waiting to run
+    self._nJobs    = 0
+    self._lock     = Lock()                                                     # Guards job numbers; clients connect from many threads
+    self.warm      = warm
+    self._warm     = OrderedDict()                                              # Schedulers by job kind and options; least recently used first
+    self._current  = None                                                       # Scheduler of the running job
+    self._finish   = ThreadEvent()
+    self._server   = None
+
+  def submit(self, kind, options = None, kwargs = None):
+    """
+    Queue a download job
+
+    Arguments:
+      kind (str) : Kind of job; one of KINDS
+
+    Keyword arguments:
+      options (dict) : Keywords for the scheduler
+      kwargs (dict) : Keywords for the scheduler's download() method
+
+    Returns:
+      Job : The queued job; read its events for progress and results
+
+    """
+
+    if self._finish.is_set():
+      raise RuntimeError( 'Download daemon is shutting down' )
+    with self._lock:
+      job   = Job( self._nJobs + 1, kind, options, kwargs )
+      self._nJobs += 1
+      ahead = self._jobs.qsize() + (self._current is not None)
+      self._jobs.put( job )
+    job.send( 'queued', ahead = ahead )
+    self.log.info( f'Queued job {job.id} ({kind}); {ahead} ahead' )
+    return job
+
+  def serve(self):
+    """Listen for jobs and run them until shutdown() is called"""
+
+    self._bind()
+    Thread( target = self._server.serve_forever, daemon = True ).start()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+      signal.signal( sig, self.shutdown )
+    self.log.info( f'Download daemon listening on {self.path}' )
+
+    try:
+      while not self._finish.is_set():
+        try:
+          job = self._jobs.get( True, TIMEOUT )
+        except Empty:
+          continue
+        self._run( job )
+    finally:
+      self._server.shutdown()
+      self._server.server_close()
+      if os.path.exists( self.path ): os.unlink( self.path )
+      while not self._jobs.empty():                                             # Fail jobs that never ran
+        self._jobs.get().send( 'error', message = 'Download daemon shut down' )
+      while len(self._warm) > 0:
+        self._warm.popitem()[1].shutdown()
+      self.log.info( 'Download daemon stopped' )
+
+  def shutdown(self, *args):
+    """Cancel the running job and stop the daemon"""
+
+    self.log.critical( 'Stopping download daemon' )
+    self._finish.set()
+    if self._current is not None: self._current.cancel()
+
+  def _bind(self):
+    """Create the server on the socket, replacing the socket if no daemon is using it"""
+
+    if os.path.exists( self.path ):
+      probe = socket.socket( socket.AF_UNIX, socket.SOCK_STREAM )
+      try:
+        probe.connect( self.path )
+      except OSError:                                                           # Left behind by a daemon that died
+        os.unlink( self.path )
+      else:
+        raise RuntimeError( f'Download daemon already running on {self.path}' )
+      finally:
+        probe.close()
+
+    self._server = ThreadingUnixStreamServer( self.path, _JobHandler )
+    self._server.daemon_threads = True
+    self._server.service        = self
+    os.chmod( self.path, 0o600 )                                                # Only this user may submit jobs
+
+  def _scheduler(self, job):
+    """
+    Get a running scheduler for a job, starting one if none has its options
+
+    Returns:
+      tuple : Key of the scheduler in the warm schedulers, scheduler
+
+    """
+
+    key       = (job.kind, json.dumps( job.options, sort_keys = True, default = _encode ))
+    scheduler = self._warm.pop( key, None )
+    if scheduler is None:
+      self.log.info( f'Starting scheduler for job {job.id}' )
+      handler   = signal.getsignal( signal.SIGINT )
+      scheduler = _schedulerClass( job.kind )( **job.options )
+      signal.signal( signal.SIGINT, handler )                                   # Scheduler takes SIGINT; the daemon handles it
+    self._warm[key] = scheduler                                                 # Most recently used
+    while len(self._warm) > max(self.warm, 1):
+      self._warm.popitem( last = False )[1].shutdown()
+    return key, scheduler
+
+  def _run(self, job):
+    """Run a job in the main thread, sending its events to the client"""
+
+    self.log.info( f'Starting job {job.id} ({job.kind})' )
+    job.send( 'started' )
+    key = scheduler = None
+    t0  = time.monotonic()
+    try:
+      key, scheduler = self._scheduler( job )
+      self._current  = scheduler
+      if self._finish.is_set(): scheduler.cancel()                              # Stopped while starting
+      reporter = _JobReporter( job, scheduler.progress, job.options.get('progress', None) or self.interval )
+      reporter.start()
+      try:
+        result = scheduler.download( **job.kwargs )
+      finally:
+        reporter.stop()
+      elapsed = time.monotonic() - t0
+      job.send( 'done', result = list(result), stats = summarize( scheduler.stats, elapsed ) )
+      self.log.info( f'Finished job {job.id} in {elapsed:0.1f} s' )
+    except Exception as err:
+      self.log.exception( f'Job {job.id} failed' )
+      job.send( 'error', message = f'{type(err).__name__} : {err}' )
+      if key in self._warm: self._warm.pop( key ).shutdown()                    # May have been left mid-batch
+    finally:
+      self._current = None
+      if scheduler is not None and scheduler.killEvent.is_set() and key in self._warm:
+        self._warm.pop( key ).shutdown()                                        # Cancelled schedulers can't run more batches
+
+def submit( kind, options, kwargs, path = SOCKET ):
+  """
+  Run a download job on a DownloadDaemon and wait for it to finish
+
+  If options sets progress, progress lines streamed from the daemon are
+  logged as they arrive.
+
+  Arguments:
+    kind (str) : Kind of job; one of KINDS
+    options (dict) : Keywords for the scheduler; must be JSON
+      serializable, so resource can't be a Backend and order can't be a
+      function
+    kwargs (dict) : Keywords for the scheduler's download() method
+
+  Keyword arguments:
+    path (str) : Unix socket of the daemon
+
+  Returns:
+    tuple : Output directory for data files, # successful downloads,
+      # failed downloads, total size of all downloaded files, and
+      summarize() of the job's statistics
+
+  Raises:
+    ConnectionError : If no daemon is listening on path, or it stopped
+      before the job finished
+    RuntimeError : If the job failed
+
+  """
+
+  log  = logging.getLogger(__name__)
+  sock = socket.socket( socket.AF_UNIX, socket.SOCK_STREAM )
+  try:
+    sock.connect( path )
+  except OSError as err:
+    sock.close()
+    raise ConnectionError( f'No download daemon on {path} : {err}' )
+
+  with sock, sock.makefile('rb') as rfile, sock.makefile('wb') as wfile:
+    _send( wfile, kind = kind, options = options, kwargs = kwargs )
+    while True:
+      event = _recv( rfile )
+      if event is None:
+        raise ConnectionError( f'Download daemon on {path} closed connection before job finished' )
+      name = event['event']
+      if name == 'queued':
+        log.info( f'Queued as job {event["job"]}; {event["ahead"]} jobs ahead' )
+      elif name == 'started':
+        log.info( f'Job {event["job"]} started' )
+      elif name == 'progress':
+        if options.get('progress', None): log.info( formatProgress( event['progress'] ) )
+      elif name == 'done':
+        return (*event['result'], event['stats'])
+      elif name == 'error':
+        raise RuntimeError( f'Download job {event["job"]} failed : {event["message"]}' )
@@ -1,19 +1,99 @@
 import logging
-from logging.handlers import QueueHandler
 
 import os, signal, glob, time
+from collections import namedtuple, deque
+from functools import wraps
 
-from threading import Thread
+from threading import Thread, Condition, Event as ThreadEvent
+from queue import Queue as ThreadQueue, Empty
+from concurrent.futures import ThreadPoolExecutor
 from multiprocessing import Process, Event, Queue
 
-import boto3
-
-from ..handlers import mpLogHandler
-from .utils import download
-from .stats import StatsCollection, humanReadable
+from ..handlers import mpLogHandler, shipLevel, BatchQueueHandler
+from .utils import download, MAX_GAP, RANGE_JOBS, BUFSIZE
+from .stats import StatsCollection, humanReadable, QUANTILES
+from .metadata import MetadataStore
+from .listCache import ListingCache
+from .backends import Backend, S3Backend, LocalBackend
+from .concurrency import AUTO, LiveCounters, TransferGate, AIMDController, RateLimiter
+from .retry import RetryPolicy, Throttled, BACKOFF, THROTTLE_BACKOFF
+from .ordering import ORDERS, PendingQueue
+from .progress import ProgressReporter, PROGRESS_INTERVAL
 
 TIMEOUT   = 1.0
- 
+POOLSIZE  = 10                                                                  # Minimum size of the client connection pool; botocore default
+ENGINES   = ('process', 'async')                                                # Download engines supported by AWS_Scheduler
+AUTO_JOBS = (1, 32)                                                             # Default bounds on transfers in flight when jobs='auto'
+TIMEOUTS  = (10.0, 60.0)                                                        # Default connect and read timeouts for S3 requests; seconds
+BATCH     = (32, 64 * 1024**2)                                                  # Most files, and bytes, in one batch put on the fileQueue
+LIST_JOBS = 8                                                                   # Prefixes listed concurrently by listMany(); within botocore's default pool size
+
+WorkItem  = namedtuple( 'WorkItem',
+  ['label', 'key', 'localFile', 'offsets', 'size', 'etag', 'clobber', 'time', 'fHour'],
+  defaults = (None, None, None, False, None, None) )
+WorkItem.__doc__ = """
+File to download; put on the fileQueue, in lists, by schedulers
+
+Fields:
+  label (str) : Label for download statistics; e.g., station ID
+  key (str) : Key of the object in the bucket
+  localFile (str) : Local file path to download to
+  offsets (list) : Byte ranges to download; None for whole object
+  size (int) : Size of the object from the bucket listing
+  etag (str) : ETag of the object from the bucket listing
+  clobber (bool) : Overwrite localFile even if it exists
+  time (datetime) : Volume time for radar data, initialization time
+    for model data; used to order downloads
+  fHour (int) : Forecast hour for model data; used to order downloads
+"""
+
+Outcome   = namedtuple( 'Outcome',
+  ['item', 'ok', 'size', 'dt', 'ttfb', 'retries', 'backoff'],
+  defaults = (0, 0.0, None, 0, 0.0) )
+Outcome.__doc__ = """
+What became of a WorkItem; put on the doneQueue, in lists, by download processes
+
+Fields:
+  item (WorkItem) : The file
+  ok (bool) : True if the file is known to be on local disk
+  size (int) : Bytes downloaded
+  dt (float) : Time taken to download; zero if nothing was downloaded
+  ttfb (float) : Time until the first response; None if not known
+  retries (int) : Failed attempts that were retried
+  backoff (float) : Time waited before retrying
+"""
+
+def expectedBytes( item ):
+  """
+  Number of bytes a work item is expected to download
+
+  The listed size of the object, or the total length of its byte
+  ranges; ranges running to the end of the object, and objects of
+  unknown size, count as zero.
+
+  """
+
+  if item.offsets is None: return item.size or 0
+  return sum( int(end) - int(start) + 1 for start, end in item.offsets if end not in ('', None) )
+
+def _shutdownOnError( download ):
+  """
+  Wrap a scheduler's download method so an exception shuts the scheduler down
+
+  Otherwise the download processes and threads, kept running between
+  batches, would keep the interpreter from exiting.
+
+  """
+
+  @wraps( download )
+  def wrapper( self, *args, **kwargs ):
+    try:
+      return download( self, *args, **kwargs )
+    except BaseException:
+      self.shutdown()
+      raise
+  return wrapper
+
 class AWS_Downloader( Process ):
 
   ATTEMPT_FMT = '     Download attempt {:2d} of {:2d} : {}' 
@@ -22,11 +102,11 @@ class AWS_Downloader( Process ):
   DLRATE_FMT  = '     {} sync complete. Rate: {}' 
   PDONE_FMT   = '     AWS Download process finished; Downloaded {} in {:0.3f} seconds - Rate : {}'
 
-  def __init__(self, resource, bucketName, fileQueue, logQueue = None, **kwargs):
+  def __init__(self, backend, fileQueue, logQueue = None, **kwargs):
     """
     Inputs:
-        resource   : The AWS resource to use for boto3 initialization
-        bucketName : Name of the bucket to download data from
+        backend    : Backend to download data from; connected in
+                        the download process
         event      : A multiprocess.Event object used to cleanly
                         end process
         All other arguments accepted by multiprocess.Process
@@ -35,12 +115,39 @@ class AWS_Downloader( Process ):
                         a file. Default is 3
         clobber    : Set to overwrite exisiting files.
                         Default is False
+        threads    : Number of download threads to run in the
+                        process. All threads share one boto3 client.
+                        Default is 1
+        maxGap     : Merge byte ranges separated by no more than
+                        this many bytes into one request.
+                        Default is MAX_GAP
+        rangeJobs  : Maximum concurrent range requests per file.
+                        Default is RANGE_JOBS
+        bufsize    : Size of the buffer each transfer streams data
+                        through; bounds memory use per transfer.
+                        Default is BUFSIZE
+        doneQueue  : Queue to put lists of Outcome tuples on once
+                        done with the files. Reports are sent whenever
+                        a worker runs out of files to download.
+                        Default is None
+        gate       : TransferGate to acquire before each transfer;
+                        limits transfers in flight over all
+                        processes. Default is None
+        counters   : LiveCounters to update as files finish.
+                        Default is None
+        retryPolicy: RetryPolicy giving delays between attempts
+                        and the retry budget for the run.
+                        Default is RetryPolicy()
+        limiter    : RateLimiter on bytes per second over all
+                        processes. Default is None
+        logLevel   : Level to log at when logQueue set; records
+                        below it are never created, let alone
+                        shipped. Default is logging.NOTSET
         All other keywords accepted by multiprocess.Process
     """
     super().__init__( )
 
-    self._resource    = resource                                                # Resource to use for downloading
-    self._bucketName  = bucketName                                              # Bucket to download from
+    self._backend     = backend                                                 # Backend to download from
     self._fileQueue   = fileQueue                                               # Queue for files to download
     self._logQueue    = logQueue                                                # Queue for logging
     self._returnQueue = Queue(1)                                                # Create Queue with depth of one (1) for value returned from process
@@ -49,92 +156,287 @@ class AWS_Downloader( Process ):
     self._stopEvent   = kwargs.get('stopEvent', Event())                        # If no stopEvent keyword, initialize Event
     self._retries     = kwargs.get('retries',   3)                              # If no attempt keyword set to 3
     self._clobber     = kwargs.get('clobber',   False)                          # If no clobber keyword set to False
+    self._threads     = max( kwargs.get('threads', 1), 1 )                      # If no threads keyword set to 1
+    self._maxGap      = kwargs.get('maxGap',    MAX_GAP)                        # If no maxGap keyword set to default
+    self._rangeJobs   = kwargs.get('rangeJobs', RANGE_JOBS)                     # If no rangeJobs keyword set to default
+    self._bufsize     = kwargs.get('bufsize',   BUFSIZE)                        # If no bufsize keyword set to default
+    self._doneQueue   = kwargs.get('doneQueue', None)                           # If no doneQueue keyword, don't report completed files
+    self._gate        = kwargs.get('gate',      None)                           # If no gate keyword, transfers limited only by number of workers
+    self._counters    = kwargs.get('counters',  None)                           # If no counters keyword, don't update live counters
+    self._retryPolicy = kwargs.get('retryPolicy', None) or RetryPolicy()        # If no retryPolicy keyword, back off with defaults and no budget
+    self._limiter     = kwargs.get('limiter',   None)                           # If no limiter keyword, bandwidth is not limited
+    self._logLevel    = kwargs.get('logLevel',  logging.NOTSET)                 # If no logLevel keyword, log at level of package logger
+    self._logHandler  = None                                                    # Handler shipping records to the parent; created in the process
+    self._local       = deque()                                                 # Rest of last batch taken from the fileQueue; shared by threads
+    self._finished    = deque()                                                 # Outcomes not yet reported on the doneQueue; shared by threads
 
   def _running(self):
     """Check if processes should still be running"""
 
-    check1 = not self._stopEvent.is_set() or not self._fileQueue.empty()
+    check1 = not self._stopEvent.is_set() or not self._fileQueue.empty() or len(self._local) > 0
     return check1 and not self._killEvent.is_set()
 
-  def run(self):
-    """This code is run in separte process"""
+  def _connect(self, poolSize = None):
+    """
+    Create connection to the backend for this process
 
-    _ = signal.signal(signal.SIGINT, signal.SIG_IGN)                            # Set to ingnore interupt signals in the process; we handle things nicely from top-level
+    The connection is shared by all transfers running in the process.
+
+    Keyword arguments:
+      poolSize (int) : Maximum number of connections to keep in the
+        client connection pool. Default is botocore default
+
+    Returns:
+      Backend : Connected backend for getting objects
+
+    """
+
+    return self._backend.connect( poolSize )
+
+  def _getLogger(self):
+    """Get logger for the process, shipping records to the parent if logQueue set"""
 
-    session = boto3.session.Session()                                           # Create own session as per https://boto3.amazonaws.com/v1/documentation/api/latest/guide/resources.html
-    s3conn  = session.resource(self._resource )                                 # Start client to AWS s3
-    bucket  = s3conn.Bucket( self._bucketName )                                 # Connect to bucket
-    log     = logging.getLogger( __name__ )
+    log = logging.getLogger( __name__ )
     if self._logQueue:
-       log.addHandler( QueueHandler( self._logQueue ) )                         # Add Queue Handler to the log
+      self._logHandler = BatchQueueHandler( self._logQueue )
+      log.addHandler( self._logHandler )                                        # Ship records to the parent in batches
+      log.setLevel( self._logLevel )                                            # Skip records no handler in the parent would take
+      log.propagate    = False                                                  # Parent's handlers do the logging; don't also log to handlers inherited at fork
+    return log
 
-    t0      = time.monotonic()                                                  # Start time of this download process
-    stats   = StatsCollection()                                                 # To store download statistics
-    totSize = 0                                                                 # Total download size for process
-    
-    while self._running():                                                      # While running
-      try:
-        label, key, localFile, offsets = self._fileQueue.get(True, TIMEOUT)     # Try to get information from the queue, waiting half a second
-      except Exception as err:                                                  # If failed to get something from the queue
-        continue                                                                # Continue to beginning of while loop
+  def _flushLog(self):
+    """Ship buffered log records to the parent"""
+
+    if self._logHandler is not None:
+      self._logHandler.flush()
+
+  def _get(self):
+    """
+    Get next item to download; returns None if nothing available
+
+    Items come off the fileQueue in batches; the rest of a batch is
+    kept locally and handed out first.
+
+    """
+
+    try:
+      return self._local.popleft()
+    except IndexError:
+      pass
+    self._flushDone()                                                           # Report finished files before waiting for more
+    try:
+      batch = self._fileQueue.get(True, TIMEOUT)                                # Try to get information from the queue, waiting TIMEOUT seconds
+    except Exception as err:                                                    # If failed to get something from the queue
+      return None
+    self._local.extend( batch[1:] )
+    return batch[0]
 
-      dt   = 0.0                                                                # Inititlize download time
-      size = 0                                                                  # Initialize file download size
-#      if (len( glob.glob('{}*'.format(localFile)) ) > 0) and self._clobber is False:  # If the file has already been downloaded, or is being downloaded; aws puts .RANDOMHASH on file names while downloading
-#          log.debug( self.EXISTS_FMT.format( key ) )
-#          stats[label].success( 0, 0)                                          # Increment number of successful downloads; size variables NOT incremented because didn't download anything
-      if os.path.isfile( localFile ) and self._clobber is False:                # If the file has already been downloaded, or is being downloaded; aws puts .RANDOMHASH on file names while downloading
-        log.debug( self.EXISTS_FMT.format( key ) )
-        stats[label].success( 0, 0)                                           # Increment number of successful downloads; size variables NOT incremented because didn't download anything
-      else:                                                                     # Else, we will try to download it
-        s3obj   = bucket.Object( key )                                          # Get object from bucket so that we can download
-        retries = attempt = self._retries                                       # Set retries and attempt to the retry limit 
-        t1      = time.monotonic()                                              # Start time of download
-        log.debug( f'Attempting download to : {localFile}' )
+  def _download(self, bucket, stats, log, item, buf = None):
+    """
+    Download a single file from the queue
+
+    Arguments:
+      bucket (s3.Bucket) : Bucket to download from
+      stats (StatsCollection) : Statistics to update
+      log (Logger) : Logger to use
+      item (WorkItem) : File to download
+
+    Keyword arguments:
+      buf (bytearray) : Reusable buffer to stream data through
+
+    Returns:
+      int : Number of bytes downloaded
+
+    """
+
+    label, key, localFile, offsets = item[:4]
+    dt   = 0.0                                                                  # Inititlize download time
+    size = 0                                                                    # Initialize file download size
+    if self._exists( item ):                                                    # If the file has already been downloaded
+      log.debug( self.EXISTS_FMT.format( key ) )
+      stats[label].success( 0, 0)                                               # Increment number of successful downloads; size variables NOT incremented because didn't download anything
+      self._count( files = 1, doneBytes = expectedBytes( item ) )
+      self._done( item )
+    elif not self._acquire():                                                   # Killed while waiting for a transfer slot
+      stats[label].fail( )
+      self._count( failed = 1, doneBytes = expectedBytes( item ) )
+      self._done( item, False )
+    else:                                                                       # Else, we will try to download it
+      s3obj   = bucket.Object( key )                                            # Get object from bucket so that we can download
+      retries = attempt = self._retries                                         # Set retries and attempt to the retry limit 
+      retried = backoff = 0                                                     # Retries, and time backing off, for this file
+      t1      = time.monotonic()                                                # Start time of download
+      log.debug( f'Attempting download to : {localFile}' )
+      self._count( inFlight = 1 )
+      try:
         while (retries > 0) and not self._killEvent.is_set():                   # While we have not reached maximum attempts
           log.debug( 
             self.ATTEMPT_FMT.format(attempt-retries+1, self._retries, key)
           )                                                                     # Log some info
 
-          size = download( s3obj, localFile, offsets )                          # Attempt a download
-          if size == 0:                                                         # If the size returned from download is zero (0)
-            retries -= 1                                                        # Download failed so decrement retries
-          else:                                                                 # Else
+          throttled = False
+          timing    = {}                                                        # Time to first byte of this attempt
+          try:
+            size = download( s3obj, localFile, offsets, self._maxGap, self._rangeJobs, buf, timing, self._limiter )# Attempt a download
+          except Throttled as err:
+            log.debug( f'Throttled : {err}' )
+            size, throttled = 0, True
+          if size > 0:                                                          # If the download succeeded
             break                                                               # Break out of the while loop
+          retries -= 1                                                          # Download failed so decrement retries
+          self._count( errors = 1 )
+          if retries == 0: break
+          if not self._retryPolicy.take():                                      # Retries for the whole run used up
+            log.warning( f'Retry budget spent; not retrying : {key}' )
+            break
+          delay = self._retryPolicy.delay( attempt-retries, throttled )         # Wait longer after each failure, and longer still if throttled
+          stats[label].retry( delay )
+          retried += 1
+          backoff += delay
+          self._killEvent.wait( delay )
+      finally:
+        self._release()                                                         # Free transfer slot even if download raised
+        self._count( inFlight = -1 )
+
+      if size > 0:                                                              # If any attempt succeeded
+        dt       = (time.monotonic() - t1)                                      # Increment dt by the time it took to download current file
+        stats[label].success( size, dt, timing.get( 'ttfb', None ) )             # Number of failed donwloads for thread
+        self._count( nbytes = size, files = 1, doneBytes = expectedBytes( item ) )
+        self._done( item, True, size, dt, timing.get( 'ttfb', None ), retried, backoff )
+      else:                                                                     # Else, downloaded the chunk/file
+        stats[label].fail( )                                                    # Number of successful downloads for thread
+        self._count( failed = 1, doneBytes = expectedBytes( item ) )
+        log.error( self.FAILED_FMT.format(key) )                                # Log error; partial data are kept so the next attempt can resume
+        self._done( item, False, retries = retried, backoff = backoff )
+      s3obj = None                                                              # Set to None for garbage collection of object
+
+    log.info( self.DLRATE_FMT.format( key, humanReadable( size, dt ) ) )
+    return size
+
+  def _exists(self, item):
+    """
+    Check if file for work item is already on local disk
 
-        if retries != 0:                                                        # If the download attempt matches maximum number of attempts,then all attempts failed
-          dt       = (time.monotonic() - t1)                                    # Increment dt by the time it took to download current file
-          totSize += size                                                       # Size of downloads for process
-          stats[label].success( size, dt )                                      # Number of failed donwloads for thread
-        else:                                                                   # Else, downloaded the chunk/file
-          stats[label].fail( )                                                  # Number of successful downloads for thread
-          log.error( self.FAILED_FMT.format(key) )                              # Log error
-          try:                                                                  # To to remove the file
-            os.remove( localFile )                                              # Delete local file if it exists
-          except:
-            pass
-        s3obj = None                                                            # Set to None for garbage collection of object
-
-      log.info( self.DLRATE_FMT.format( key, humanReadable( size, dt ) ) )
-
-    # Set all to None for garbage collection; may fix the SSLSocket error issue
-    bucket  = None 
-    s3conn  = None
-    session = None      
+    If the listing size of the object is known and a whole object is
+    being downloaded, the local file must also be that size; this
+    repairs truncated files left by older versions.
+
+    """
+
+    if self._clobber or item.clobber or not os.path.isfile( item.localFile ):
+      return False
+    if item.size is None or item.offsets is not None:
+      return True
+    return os.path.getsize( item.localFile ) == item.size
+
+  def _acquire(self):
+    """Wait for a transfer slot; returns False if killed while waiting"""
+
+    if self._gate is None: return True
+    while not self._killEvent.is_set():
+      if self._gate.acquire( TIMEOUT ): return True
+    return False
+
+  def _release(self):
+    """Free transfer slot"""
+
+    if self._gate is not None: self._gate.release()
+
+  def _count(self, **kwargs):
+    """Update live counters; keywords as LiveCounters.add()"""
+
+    if self._counters is not None: self._counters.add( **kwargs )
+
+  def _done(self, item, ok = True, *args, **kwargs):
+    """Note that work item is finished; arguments as Outcome"""
+
+    if self._doneQueue is not None:
+      self._finished.append( Outcome( item, ok, *args, **kwargs ) )
+
+  def _flushDone(self):
+    """Report all finished work items on the doneQueue as one list, and ship buffered log records"""
+
+    done = []
+    while True:
+      try:
+        done.append( self._finished.popleft() )
+      except IndexError:
+        break
+    if len(done) > 0:
+      self._doneQueue.put( done )
+    self._flushLog()
+
+  def _cancel(self, stats, log):
+    """Mark all files remaining in the queue as failed after SIGINT"""
+
+    log.error('Received SIGINT; download cancelled.')                           # Log an errory
+    while len(self._local) > 0:
+      self._failQueued( stats, self._local.popleft() )
+    while not self._fileQueue.empty():                                          # While the queue is NOT empty
+      try:
+        batch = self._fileQueue.get_nowait()
+      except:
+        break
+      else:
+        for item in batch: self._failQueued( stats, item )
+
+  def _failQueued(self, stats, item):
+    """Count file that was queued but never attempted as failed"""
+
+    stats[item.label].fail()
+    self._count( failed = 1, doneBytes = expectedBytes( item ) )
+    self._done( item, False )
+
+  def _worker(self, bucket, stats, log):
+    """
+    Download files from the queue until told to stop
+
+    Arguments:
+      bucket (Backend) : Backend to download from; may be shared
+      stats (StatsCollection) : Statistics for this worker only
+      log (Logger) : Logger to use
+
+    """
+
+    buf = bytearray( self._bufsize )                                            # Buffer reused for every transfer by this worker
+    while self._running():                                                      # While running
+      info = self._get()                                                        # Try to get information from the queue
+      if info is None:                                                          # If failed to get something from the queue
+        continue                                                                # Continue to beginning of while loop
+      self._download( bucket, stats, log, info, buf )                           # Download the file
+
+  def run(self):
+    """This code is run in separte process"""
+
+    _ = signal.signal(signal.SIGINT, signal.SIG_IGN)                            # Set to ingnore interupt signals in the process; we handle things nicely from top-level
+
+    bucket  = self._connect( max(self._threads, POOLSIZE) )                     # Connect to bucket; one client shared by all threads
+    log     = self._getLogger()
+
+    t0      = time.monotonic()                                                  # Start time of this download process
+    results = [StatsCollection() for i in range( self._threads )]               # One StatsCollection per thread so no locking is needed
+    if self._threads == 1:                                                      # If only one thread, just run in this thread
+      self._worker( bucket, results[0], log )
+    else:
+      workers = [Thread( target = self._worker, args = (bucket, res, log) ) for res in results]
+      for worker in workers: worker.start()
+      for worker in workers: worker.join()
+
+    stats   = StatsCollection()                                                 # To store download statistics
+    for res in results:                                                         # Merge statistics from all threads
+      stats = stats + res
+
+    bucket  = None                                                              # Set to None for garbage collection; may fix the SSLSocket error issue
     if self._killEvent.is_set():                                                # If killEvent set
-      log.error('Received SIGINT; download cancelled.')                         # Log an errory
-      while not self._fileQueue.empty():                                        # While the queue is NOT empty
-        try:
-          label, key, localFile, offsets = self._fileQueue.get_nowait()
-        except:
-          break
-        else:
-          stats[label].fail()
+      self._cancel( stats, log )
+    self._flushDone()
 
+    totSize = stats.totals()[2]                                                 # Total download size for process
     dt      = time.monotonic() - t0                                             # Compute runtime for the process
     rate    = humanReadable( totSize, dt )                                      # Compute average download rate of process
     totSize = humanReadable( totSize )                                          # Total size downloaded by process
     log.debug( self.PDONE_FMT.format( totSize, dt, rate ) )                     # Log information
+    self._flushLog()
 
     self._returnQueue.put( stats )                                              # Place stats object into the return queue
 
@@ -149,18 +451,31 @@ class AWS_Downloader( Process ):
     self._killEvent.set()
 
   def join(self, *args):
-    """Wait for process to finish and return process return value"""
+    """
+    Wait for process to finish and return process return value
+
+    The return value is read before joining, as the process can't exit
+    until all of it has been written to the pipe.
 
+    """
+
+    val = None
+    while True:
+      try:
+        val = self._returnQueue.get( True, TIMEOUT )
+      except Empty:
+        if self.is_alive(): continue                                            # Still downloading
+        try:
+          val = self._returnQueue.get( True, TIMEOUT )                          # Exited; anything it returned has been flushed to the pipe
+        except Empty:
+          pass
+      except Exception:
+        pass
+      break
     super().join(*args)
     if self.is_alive():
       return None
-    try:
-      val = self._returnQueue.get()
-    except:
-      val = None
-    finally:
-      self._returnQueue.close()
-    
+    self._returnQueue.close()
     return val
 
 
@@ -171,49 +486,201 @@ class AWS_Scheduler(object):
   tells the download processes to stop. While this will not happen
   instantly, trust that the processes are finishing what they are
   working on and closing.
+
+  The download processes are started once and kept running, so
+  download() may be called any number of times on the same scheduler.
+  Each call is a batch : wait() returns once every file of the batch is
+  done, with statistics for that batch alone. Call shutdown() (or
+  close()) when finished to stop the processes. If the download()
+  method of a subclass raises, the scheduler is shut down.
   """
 
-  def __init__(self, resource, bucketName, clobber=False, retries=3, jobs=4):
+  def __init_subclass__(cls, **kwargs):
+
+    super().__init_subclass__( **kwargs )
+    if 'download' in cls.__dict__:
+      cls.download = _shutdownOnError( cls.__dict__['download'] )
+
+  def __init__(self, resource, bucketName=None, clobber=False, retries=3, jobs=4, engine='process', threads=1,
+               maxGap=MAX_GAP, rangeJobs=RANGE_JOBS, bufsize=BUFSIZE, listCache=True,
+               minJobs=AUTO_JOBS[0], maxJobs=AUTO_JOBS[1], timeouts=TIMEOUTS,
+               backoff=BACKOFF, throttleBackoff=THROTTLE_BACKOFF, retryBudget=None, order=None,
+               fairShare=False, labelCaps=None, batch=BATCH, progress=None, metricsFile=None,
+               rateLimit=None):
     """
     Initialize downloader processes for concurrent downloading of data.
 
     Arguments:
-      resource (str) : The AWS resource to use
-      bucketName (str) : Name of the AWS bucket to use
+      resource (str, Backend) : The AWS resource to use, or the Backend
+        to list and download objects from
+      bucketName (str) : Name of the AWS bucket to use; ignored if
+        resource is a Backend
 
     Keyword arguments:
       clobber (bool) : Boolean that enables/disables file clobbering
       retries  (int)  : Integer maximum number of download retries
-      jobs (int) : Integer number of concurrent downloads to allow
+      jobs (int, str) : Integer number of concurrent downloads to allow,
+        or 'auto' to have the number of transfers in flight adjusted at
+        runtime, between minJobs and maxJobs, from measured throughput
+        and failed attempts. With 'auto' and the 'process' engine, at
+        most one process per CPU is started, and threads is raised so
+        the processes can run maxJobs transfers
+      engine (str) : Download engine to use; one of ENGINES.
+        'process' runs one download process per job, while 'async'
+        runs all downloads from a single process using an asyncio
+        event loop. With the 'async' engine, jobs may be set in the
+        hundreds.
+      threads (int) : Number of download threads in each process of
+        the 'process' engine. Threads in a process share one boto3
+        client, so total concurrency is jobs * threads.
+      maxGap (int) : When downloading byte ranges (e.g., GRIB subsets),
+        merge ranges separated by no more than this many bytes into a
+        single request
+      rangeJobs (int) : Maximum number of range requests to run
+        concurrently for a single file
+      bufsize (int) : Size of the buffer each transfer streams data
+        through. Peak memory per transfer is bounded by this size
+        (times rangeJobs for byte range downloads)
+      listCache (bool, ListingCache) : Cache bucket listings on disk.
+        If True, a ListingCache with default settings is used; if
+        False, every prefix is listed from the bucket
+      minJobs (int) : Fewest transfers in flight when jobs is 'auto'
+      maxJobs (int) : Most transfers in flight when jobs is 'auto'
+      timeouts (tuple) : Connect and read timeouts for S3 requests;
+        seconds. Not used if resource is a Backend
+      backoff (tuple) : Base and maximum delay between attempts to
+        download a file; seconds. Delays double with each failed
+        attempt and are jittered
+      throttleBackoff (tuple) : As backoff, but used after S3 responds
+        that requests should slow down (e.g., 503 SlowDown)
+      retryBudget (int) : Total number of retries allowed over the whole
+        download, so that files that keep failing cannot use up the
+        run; if None, there is no limit
+      order (str, callable) : Order to download files in; one of
+        ORDERS (e.g., 'analysis', 'latest', 'largest', 'deadline'), or
+        a function of a WorkItem returning a sort key, smallest first.
+        Files listed so far are reordered while earlier ones download.
+        If None, files are downloaded in listing order
+      fairShare (bool, dict) : Share downloads between labels (e.g.,
+        stations) so files for every label arrive at the same rate,
+        rather than one label at a time. A dict gives the weight of
+        each label; labels not in it have weight 1. Within a label,
+        files are downloaded in order
+      labelCaps (int, dict) : Most files for any one label (or, for a
+        dict, for the labels given) queued or downloading at once
+      batch (tuple) : Most files, and bytes, to put on the fileQueue as
+        one item. Batches shrink as the backlog does, so the last files
+        are spread over all workers. Set to (1, 0) to disable batching
+      progress (float) : Log a line with files done, rate, and ETA
+        every this many seconds; None to not log progress. See also
+        progress()
+      metricsFile (str) : Write progress, in Prometheus text format, to
+        this file every `progress` (or PROGRESS_INTERVAL) seconds; for
+        node_exporter's textfile collector, it must end in .prom
+      rateLimit (float) : Most data to download per second over all
+        processes, threads, and tasks; MB/s. None for no limit. May be
+        changed while downloading through the rateLimit attribute
 
     """
 
+    if engine not in ENGINES:
+      raise ValueError( f'Unknown download engine : {engine}' )
+
     self.log        = logging.getLogger(__name__)                               # Initialize logger for the class
 
     self.outdir     = None                                                      # Attribute for output directory
     self.t0         = None                                                      # Attribute for start time of download 
+    self._created   = time.monotonic()                                          # Progress is timed from here until download() is called
 
     self.clobber    = clobber
-    self.s3conn     = boto3.resource(resource)                                  # Start client to AWS s3
-    self.bucket     = self.s3conn.Bucket(bucketName)                            # Connect to bucket
+    self.engine     = engine
+    self.metadata   = None                                                      # MetadataStore for the output directory; set by openMetadata()
+    self.skipped    = StatsCollection()                                         # Statistics for files that were up to date so never queued
+    self.stats      = None                                                      # Statistics of the last finished batch; set by wait()
+    self._batchStats = StatsCollection()                                        # Statistics of files reported done this batch
+    self._nQueued   = 0                                                         # Files queued this batch
+    self._nDone     = 0                                                         # Files reported done this batch
+    self._closed    = False                                                     # Set by shutdown()
+    if not isinstance(resource, Backend):
+      resource      = S3Backend( bucketName, resource, timeouts = timeouts )
+    self.backend    = resource.connect()                                        # Connect to backend for listing
+    if listCache is True:
+      try:
+        listCache   = ListingCache()
+      except Exception as err:
+        self.log.warning( f'Could not open listing cache; all prefixes will be listed : {err}' )
+        listCache   = None
+    self.listCache  = listCache or None                                         # Cache of bucket listings; None if disabled
 
-    self.fileQueue  = Queue( 10 )                                               # Limit fileQueue to 10 so that doesn't grow too large
+    self.counters   = LiveCounters()                                            # Bytes, files, errors, and transfers in flight over all download processes
+    self._base      = self.counters.snapshot()                                  # Counters at start of batch
+    self.gate       = None                                                      # Limit on transfers in flight; only used when jobs is 'auto'
+    self.controller = None
+    if jobs == AUTO:
+      self.gate       = TransferGate( min( max(minJobs, 4), maxJobs ) )         # Start at the fixed default and adjust from there
+      self.controller = AIMDController( self.gate, self.counters, minJobs, maxJobs )
+      if engine == 'async':
+        jobs          = maxJobs                                                 # Enough workers for the largest limit
+      else:
+        jobs          = min( -(-maxJobs // threads), os.cpu_count() or 1 )      # Each process is a full interpreter, so no more than one per CPU
+        threads       = -(-maxJobs // jobs)                                     # Threads make up the rest of the largest limit
+    elif not isinstance(jobs, int) or jobs < 1:
+      raise ValueError( f'jobs must be a positive integer or {AUTO!r} : {jobs}' )
+
+    self.limiter    = RateLimiter()                                             # Bandwidth limit shared by all download processes; always created so it can be set later
+    self.rateLimit  = rateLimit
+    self.pending    = PendingQueue( order, fairShare, labelCaps )               # Files not yet on the fileQueue
+    self._pendCond  = Condition()                                               # Guards pending
+    scheduled       = self.pending.order is not None or fairShare or labelCaps is not None # Resolved order, as 'listing' means no reordering
+    self.fileQueue  = Queue( max(1 if scheduled else 10, jobs * threads) )      # Keep one file queued per concurrent transfer; when scheduling, the rest wait in pending
     self.logQueue   = Queue( )                                                  # Queue for logging from separate processes
     self.killEvent  = Event()                                                   # Event to cleanly kill downloads
     self.stopEvent  = Event()                                                   # Event to cleanly stop download processes when the fileQueue is empty
 
+    self.doneQueue  = Queue( )                                                  # Queue of files that download processes have on disk
+
     self.logThread  = Thread(target=mpLogHandler, args=(self.logQueue,))        # Initialize thread to consume log message from queue
     self.logThread.start()                                                      # Start the thread
+    self.doneThread = Thread(target=self._recordHandler)                        # Initialize thread to record completed downloads
+    self.doneThread.start()
 
+    self._listed    = False                                                     # Set once no more items will be enqueued this batch
+    self._closing   = False                                                     # Set once no more batches will be run
+    self.batch      = batch
+    self.nWorkers   = jobs if engine == 'async' else jobs * threads             # Concurrent transfers the batches are spread over
+    self.feedThread = Thread(target=self._feedHandler)                          # Initialize thread to move files from pending heap to fileQueue
+    self.feedThread.start()
+
+    kwargs          = dict( retries   = retries,   clobber   = clobber,
+                            maxGap    = maxGap,    rangeJobs = rangeJobs,
+                            bufsize   = bufsize,   doneQueue = self.doneQueue,
+                            gate      = self.gate, counters  = self.counters,
+                            limiter   = self.limiter,
+                            logLevel  = shipLevel( logging.getLogger( __name__ ) ),
+                            retryPolicy = RetryPolicy( backoff, throttleBackoff, retryBudget ),
+                            killEvent = self.killEvent, stopEvent = self.stopEvent )
     self.tids       = []                                                        # List to store download process objects
-    for i in range( jobs ):                                                     # Iterate over number of concurrency allowed
+    if engine == 'async':                                                       # If asyncio engine, then single process handles all concurrency
+      from .asyncEngine import AsyncDownloader
+      tid = AsyncDownloader(
+              resource, self.fileQueue, self.logQueue, 
+              concurrency = jobs, **kwargs )
+      tid.start()
+      self.tids.append( tid )
+    else:
+      for i in range( jobs ):                                                   # Iterate over number of concurrency allowed
         tid = AWS_Downloader(
-                resource, bucketName, self.fileQueue, self.logQueue, 
-                retries = retries, clobber = clobber,
-                killEvent = self.killEvent, stopEvent = self.stopEvent )        # Initialize a download process
+                resource, self.fileQueue, self.logQueue,
+                threads = threads, **kwargs )                                   # Initialize a download process
         tid.start()                                                             # Start the process
         self.tids.append( tid )                                                 # Append process to the list of processes
 
+    if self.controller is not None: self.controller.start()
+    self.reporter   = None
+    if progress or metricsFile:
+      self.reporter = ProgressReporter( self.progress, progress or PROGRESS_INTERVAL, bool(progress),
+                                        metricsFile, {'bucket' : self.backend.name} )
+      self.reporter.start()
     signal.signal( signal.SIGINT, self.cancel )                                 # On SIGINT, set the killEvent
     
   def cancel( self, *args, **kwargs ):
@@ -227,28 +694,430 @@ class AWS_Scheduler(object):
     """
     Overload with filtering for given dataset
 
+    Starts a new batch; end the overloaded method with
+    `return self.wait()`.
+
     NOTE :
       You should call this method using super().download() at the beginning
       of your overloaded method so that download timings can be computed
     """
 
-    self.t0 = time.monotonic()
-    pass
+    if self._closed:
+      raise RuntimeError( 'Scheduler has been shut down' )
+    if self.killEvent.is_set():
+      raise RuntimeError( 'Scheduler was cancelled; shut it down and start a new one' )
+    with self._pendCond:
+      self._listed  = False
+      self._nQueued = 0
+      self._nDone   = 0
+    self.skipped     = StatsCollection()
+    self._batchStats = StatsCollection()
+    self._base       = self.counters.snapshot()
+    self._decisions  = len(self.controller.decisions) if self.controller is not None else 0 # Concurrency changes made before this batch
+    self._cacheBase  = (self.listCache.hits, self.listCache.misses) if self.listCache is not None else (0, 0) # Listing cache counts before this batch
+    self.t0          = time.monotonic()
 
+  @property
+  def rateLimit(self):
+    """Most data to download per second over all processes; MB/s. None if not limited"""
 
-  def close(self):
+    rate = self.limiter.rate
+    return rate / 1.0e6 if rate > 0 else None
+
+  @rateLimit.setter
+  def rateLimit(self, value):
+    if value is not None and value < 0:
+      raise ValueError( f'rateLimit must be positive or None : {value}' )
+    self.limiter.rate = (value or 0.0) * 1.0e6
+
+  def progress(self):
+    """
+    Snapshot of download progress
+
+    Read from counters shared with the download processes, so may be
+    called at any time while files are downloading; e.g., from another
+    thread. Counts are for the current batch.
+
+    Returns:
+      dict : Values of LiveCounters.FIELDS, plus
+        remaining (int) : Files queued but not yet finished
+        elapsed (float) : Seconds since download started
+        rate (float) : Average download rate; bytes per second
+        eta (float) : Estimated seconds until the queued files finish;
+          None if not known. While listing, only counts files queued
+        listing (bool) : Files are still being listed and queued
+        rateLimit (float) : Bandwidth limit; bytes per second. Zero if
+          not limited
+        totals (dict) : Values of LiveCounters.FIELDS over all batches
+          since the scheduler started; these only increase
+
+    """
+
+    base    = self._base
+    totals  = self.counters.snapshot()
+    snap    = {key : val - base[key] for key, val in totals.items()}
+    elapsed = time.monotonic() - (self._created if self.t0 is None else self.t0)
+    rate    = snap['bytes'] / elapsed if elapsed > 0 else 0.0
+    left    = max( snap['queuedBytes'] - snap['doneBytes'], 0 )                 # Bytes still to download
+    snap['remaining'] = snap['queued'] - snap['files'] - snap['failed']
+    snap['elapsed']   = elapsed
+    snap['rate']      = rate
+    snap['eta']       = left / rate if rate > 0 else (0.0 if snap['remaining'] == 0 else None)
+    snap['listing']   = not self._listed
+    snap['rateLimit'] = self.limiter.rate
+    snap['totals']    = totals
+    return snap
+
+  def listObjects(self, prefix, end = None, startAfter = None, stopAfter = None):
+    """
+    List objects below a prefix, using the listing cache if enabled
+
+    Arguments:
+      prefix (str) : Prefix to list objects below
+
+    Keyword arguments:
+      end (datetime) : End time of data below the prefix. Prefixes
+        whose data ended long enough ago are cached indefinitely
+      startAfter (str) : Only list keys after this one; listing starts
+        there rather than at the beginning of the prefix
+      stopAfter (str) : Stop listing at the first key after this one;
+        no further pages are requested
+
+    Returns:
+      iterable : Objects with key, size, and e_tag attributes
+
+    """
+
+    if self.listCache is None:
+      return self.backend.list( prefix, startAfter, stopAfter )
+    return self.listCache.filter( self.backend, prefix, end, startAfter, stopAfter )
+
+  def listMany(self, prefixes, jobs = LIST_JOBS, batch = None):
+    """
+    List objects below many prefixes concurrently
+
+    Prefixes are listed from a thread pool and objects are yielded as
+    each page of a listing arrives, so work can be queued before all
+    prefixes are listed. Objects below one prefix are yielded in key
+    order, but those below different prefixes are interleaved.
+
+    Arguments:
+      prefixes (iterable) : (prefix, end) or (prefix, end, startAfter,
+        stopAfter) tuples; see listObjects
+
+    Keyword arguments:
+      jobs (int) : Number of prefixes to list at once
+      batch (int) : If set, yield lists of up to this many tuples; each
+        holds whatever has been listed since the last, so objects are
+        not held back waiting for a batch to fill
+
+    Returns:
+      generator : (prefix, object) tuples, or lists of them
+
+    """
+
+    prefixes = list( prefixes )
+    results  = ThreadQueue()
+    stop     = ThreadEvent()                                                    # Set if consumer stops early
+
+    def listOne( prefix, *args ):
+      try:
+        for obj in self.listObjects( prefix, *args ):
+          if stop.is_set() or self.killEvent.is_set(): break
+          results.put( (prefix, obj) )
+      except Exception as err:
+        self.log.error( f'Failed to list prefix {prefix} : {err}' )
+      finally:
+        results.put( (prefix, None) )                                           # Prefix done
+
+    pool = ThreadPoolExecutor( max(1, min(jobs, len(prefixes))) )
+    try:
+      for args in prefixes:
+        pool.submit( listOne, *args )
+      nDone = 0
+      while nDone < len(prefixes):
+        items = [results.get()]
+        while batch and len(items) < batch:                                    # Take everything else listed so far
+          try:
+            items.append( results.get_nowait() )
+          except Empty:
+            break
+        listed = [item for item in items if item[1] is not None]
+        nDone += len(items) - len(listed)                                       # None marks the end of a prefix
+        if batch is None:
+          yield from listed
+        elif len(listed) > 0:
+          yield listed
+    finally:
+      stop.set()
+      pool.shutdown( wait = False, cancel_futures = True )
+
+  def openMetadata(self, outroot):
+    """
+    Open the metadata store for an output directory
+
+    Once open, work items whose ETag and size match what was recorded
+    for the local file when it was downloaded are not queued.
+
+    Arguments:
+      outroot (str) : Top-level output directory
+
+    """
+
+    if self.metadata is not None:
+      if self.metadata.root == outroot: return
+      self.metadata.close()
+    try:
+      self.metadata = MetadataStore( outroot )
+    except Exception as err:
+      self.log.warning( f'Could not open metadata store; every file will be checked : {err}' )
+      self.metadata = None
+
+  def _upToDate(self, item):
+    """
+    Check if local file was downloaded from the same version of the object
+
+    Files that are up to date are counted as successful, zero-size
+    downloads for the item's label.
+
+    Arguments:
+      item (WorkItem) : File to download
+
+    Returns:
+      bool : True if the ETag and size recorded for the local file
+        match those of the work item
+
+    """
+
+    if self.clobber or self.metadata is None or item.etag is None:
+      return False
+    if self.metadata.lookup( item.localFile ) != (item.etag, item.size):
+      return False
+    self.log.debug( AWS_Downloader.EXISTS_FMT.format( item.key ) )
+    self.skipped[item.label].success( 0, 0 )
+    self.counters.add( skipped = 1 )
+    return True
+
+  def _enqueue(self, item):
+    """
+    Queue work item for download unless the local file is up to date
 
+    Items are held in pending, ordered by the scheduler's order, until
+    there is room for them on the fileQueue.
+
+    Arguments:
+      item (WorkItem) : File to download
+
+    Returns:
+      bool : True if the item was queued (or was up to date), False if
+        the killEvent is set
+
+    """
+
+    if self.killEvent.is_set(): return False
+    if self._upToDate( item ): return True
+    if self.metadata is not None and self.metadata.lookup( item.localFile ) is not None:
+      item = item._replace( clobber = True )                                    # Remote object changed, so replace local file
+
+    with self._pendCond:
+      self.pending.push( item )
+      self._nQueued += 1
+      self._pendCond.notify_all()
+    self.counters.add( queued = 1, queuedBytes = expectedBytes( item ) )
+    return True
+
+  def _feedHandler(self):
+    """Move highest priority pending items to the fileQueue, in batches, as room frees up"""
+
+    maxFiles, maxBytes = self.batch
+    while True:
+      with self._pendCond:
+        item = self.pending.pop()
+        while item is None:                                                     # Nothing pending, or every label with files pending is at its cap
+          if self._closing and len(self.pending) == 0: return                   # Everything has been queued and no more batches will be run
+          self._pendCond.wait()
+          item = self.pending.pop()
+        batch  = [item]
+        nBytes = item.size or 0
+        nFiles = min( maxFiles, len(self.pending) // self.nWorkers + 1 )        # Smaller batches as backlog runs down, so no worker is left idle
+        while len(batch) < nFiles and nBytes < maxBytes:                        # Large files go alone
+          item = self.pending.pop()
+          if item is None: break
+          batch.append( item )
+          nBytes += item.size or 0
+      while not self.killEvent.is_set():                                        # While kill event is NOT set, try to enqueue information
+        try:
+          self.fileQueue.put( batch, True, TIMEOUT )
+        except Exception as err:
+          pass
+        else:
+          break
+      if self.killEvent.is_set():                                               # Cancelled, so drop everything not yet queued
+        self._discardPending()
+
+  def _stopFeeding(self, discard = False):
+    """
+    Wait for all pending items to be put on the fileQueue, then stop the feed thread
+
+    Keyword arguments:
+      discard (bool) : Drop pending items rather than queue them
+
+    """
+
+    if discard: self._discardPending()
+    with self._pendCond:
+      self._listed  = True
+      self._closing = True
+      self._pendCond.notify_all()
+    self.feedThread.join()
+
+  def _barrier(self):
+    """
+    Wait until every file queued this batch has been reported done
+
+    Returns early if the download is cancelled or a download process
+    dies.
+
+    Returns:
+      int : Number of files not reported done
+
+    """
+
+    with self._pendCond:
+      self._listed = True
+      self._pendCond.notify_all()
+      while self._nDone < self._nQueued and not self.killEvent.is_set():
+        if not all( tid.is_alive() for tid in self.tids ): break
+        self._pendCond.wait( TIMEOUT )
+      return self._nQueued - self._nDone
+
+  def _discardPending(self):
+    """Drop all pending items; they no longer count as queued"""
+
+    with self._pendCond:
+      items = self.pending.clear()
+    self.counters.add( queued = -len(items), queuedBytes = -sum( expectedBytes( item ) for item in items ) )
+
+  def _recordHandler(self):
+    """Record files download processes report as done in the batch statistics and metadata store, and free their label's slot"""
+
+    while True:
+      done = self.doneQueue.get()
+      if done is None: break
+      stats = self._batchStats
+      for res in done:
+        val = stats[res.item.label]
+        if res.ok:
+          val.success( res.size, res.dt, res.ttfb )
+        else:
+          val.fail()
+        if res.retries > 0: val.retry( res.backoff, res.retries )
+      metadata = self.metadata
+      if metadata is not None:
+        for res in done:
+          if res.ok and res.item.etag is not None:
+            metadata.record( res.item.localFile, res.item.key, res.item.etag, res.item.size, commit = False )
+        if self.doneQueue.empty(): metadata.commit()                            # Batch commits while files are arriving quickly
+      with self._pendCond:                                                      # Labels have room for more files
+        for res in done:
+          self.pending.finished( res.item.label )
+        self._nDone += len(done)
+        self._pendCond.notify_all()
+
+  def _stopRecording(self):
+    """Record all remaining done files, then close the metadata store"""
+
+    if self.doneThread.is_alive():
+      self.doneQueue.put( None )
+      self.doneThread.join()
+    if self.metadata is not None:
+      self.metadata.close()
+      self.metadata = None
+
+  def _stopController(self):
+    """Stop adjusting concurrency"""
+
+    if self.controller is not None and self.controller.is_alive():
+      self.controller.stop()
+
+  def _logController(self):
+    """Log the concurrency changes made during the batch; times are since the batch started"""
+
+    if self.controller is None: return
+    decisions = self.controller.decisions[self._decisions:]
+    offset    = self.t0 - self.controller.t0
+    self.log.info( '   Concurrency      : {:>10} (range {:d}-{:d}); {:d} changes'.format(
+      self.gate.limit, self.controller.minJobs, self.controller.maxJobs, len(decisions) ) )
+    for t, limit, rate, errors, action in decisions:
+      self.log.info( f'     {t - offset:8.1f} s : {action:>8} to {limit:3d}; {rate:8.1f} MB/s, {errors} errors' )
+
+  def _logQuantiles(self, stats):
+    """Log quantiles of per-file latency, time to first byte, and throughput; per label at debug level, slowest first"""
+
+    latency, ttfb, throughput = stats.histograms()
+    if latency is None: return
+    names   = [f'p{100*q:g}' for q in QUANTILES]
+    fmtTime = lambda vals : ', '.join( f'{name} ' + ('-' if val is None else f'{val:0.3g} s') for name, val in zip(names, vals) )
+    fmtRate = lambda vals : ', '.join( f'{name} ' + ('-' if val is None else humanReadable( val, 1.0 )) for name, val in zip(names, vals) )
+    self.log.info( '   Latency          : {}'.format( fmtTime( latency.quantiles() ) ) )
+    self.log.info( '   Time to 1st byte : {}'.format( fmtTime( ttfb.quantiles() ) ) )
+    self.log.info( '   Throughput       : {}'.format( fmtRate( throughput.quantiles() ) ) )
+
+    labels = [(val.latency.quantiles(), label, val) for label, val in stats.items() if val.latency is not None]
+    for quants, label, val in sorted( labels, key = lambda x : -x[0][1] ):      # Stragglers first; sorted by p95 latency
+      self.log.debug( f'     {label} : latency {fmtTime( quants )}; '
+                      f'TTFB {fmtTime( val.ttfb.quantiles() )}; rate {fmtRate( val.throughput.quantiles() )}' )
+
+  def _stopWorkers(self):
+    """Tell download processes to stop once the fileQueue is empty, and wait for them"""
+
+    for tid in self.tids: tid.stop()                                            # Tell each process to stop once no more data in queue
+    for tid in self.tids:                                                       # Iterate over the process objects
+      if tid.join() is None:                                                    # Join process, blocks until finished
+        self.log.warning('There was an error with a download process!')
+    self.tids = []
+
+  def shutdown(self):
+    """
+    Stop the download processes and threads
+
+    Files not yet downloaded are dropped. The scheduler can't be used
+    once shut down.
+
+    """
+
+    if self._closed: return
+    self._closed = True
+    self._stopFeeding( discard = True )
     while not self.fileQueue.empty():
-      _ = self.fileQueue.get()
+      try:
+        _ = self.fileQueue.get( True, TIMEOUT )
+      except Empty:
+        break
+    self._stopWorkers()
     self.fileQueue.close()
 
+    self._stopRecording()
+    self._stopController()
+    if self.reporter is not None: self.reporter.stop()
+    self.doneQueue.close()
+    if self.listCache is not None: self.listCache.close()
+
     self.logQueue.put(None)                                                                  # Put None in to the logQueue, this will cause the thread the stop
     self.logThread.join()                                                               # Join the thread to make sure it finishes 
     self.logQueue.close()
 
+  def close(self):
+    """Same as shutdown()"""
+
+    self.shutdown()
+
   def wait(self):
     """
-    Wait for all download processes to finish
+    Wait for all files of the batch to finish
+
+    The download processes keep running, ready for the next batch. If
+    the download was cancelled, they are stopped.
 
     Returns:
       tuple : Output directory for data files, # successful downloads,
@@ -256,15 +1125,19 @@ class AWS_Scheduler(object):
 
     """
 
-    for tid in self.tids: tid.stop()                                            # Tell each process to stop once no more data in queue
+    lost = self._barrier()                                                      # Every file reported done, unless cancelled
+    if self.killEvent.is_set():                                                 # Processes fail what is left and exit; wait for all of their reports
+      self._stopFeeding( discard = True )
+      self._stopWorkers()
+      self._stopRecording()
+    elif lost > 0:
+      self.log.warning( f'There was an error with a download process! {lost} files never finished' )
+    elif self.metadata is not None:
+      self.metadata.commit()
 
-    stats = StatsCollection()
-    for tid in self.tids:                                                   # Iterate over the process objects
-      vals = tid.join()                                                        # Join process, blocks until finished
-      if vals is None:
-        self.log.warning('There was an error with a download process!')
-      else:
-        stats = stats + vals
+    stats = self.skipped + self._batchStats                                     # Start with files that were already up to date
+    self.stats = stats
+    if self.reporter is not None: self.reporter.report( log = False )           # Final counts, for the metrics file
 
     nSuccess, nFail, totSize, dt = stats.totals()
 
@@ -272,12 +1145,27 @@ class AWS_Scheduler(object):
     self.log.info( '   Downloaded       : {:10d} files'.format(  nSuccess) )
     self.log.info( '   Failed           : {:10d} files'.format(  nFail))
     self.log.info( '   Data transferred : {:>10}'.format( humanReadable( totSize ) ) )
+    nRetry, backoff = stats.retries()
+    if nRetry > 0:
+      self.log.info( '   Retries          : {:10d} ({:0.1f} s backing off)'.format( nRetry, backoff ) )
+      for label, val in sorted( stats.items() ):
+        if val.nRetry > 0:
+          self.log.debug( f'     {label} : {val.nRetry} retries, {val.backoff:0.1f} s' )
+    self._logQuantiles( stats )
+    self._logController()
+    if self.listCache is not None:
+      self.log.info( '   Listing cache    : {:10d} hits, {:d} misses'.format(
+        self.listCache.hits - self._cacheBase[0], self.listCache.misses - self._cacheBase[1] ) )
     try:                                                                        # Try to
       elapsed = time.monotonic() - self.t0                                      # Compute elpased time using the start time of the full download
     except:                                                                     # On exception (perhaps someone forgot to call super().download()
       pass                                                                      # Do nothing
     else:                                                                       # Else, we know the elapsed time, so print some more statistics
       self.log.info( '   Transfer Rate    : {:>10}'.format( humanReadable( totSize, elapsed ) ) )
+      taken, realized, waited = self.limiter.realized()
+      if taken > 0:
+        self.log.info( '   Rate limit       : {:>10}; realized {} ({:0.1f} s waiting)'.format(
+          humanReadable( self.limiter.rate, 1.0 ), humanReadable( realized, 1.0 ), waited ) )
       self.log.info( '   Elapsed time     : {:10.1f} s'.format(elapsed))
 
     if (nFail == 0):
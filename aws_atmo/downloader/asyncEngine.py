@@ -0,0 +1,117 @@
+import signal, time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from . import AWS_Downloader
+from .stats import StatsCollection, humanReadable
+
+class AsyncDownloader( AWS_Downloader ):
+  """
+  Download engine that runs many concurrent transfers from one process
+
+  Rather than one blocking GET per process, an asyncio event loop
+  runs `concurrency` worker coroutines that pull files from the
+  fileQueue. The blocking boto3 calls are handed off to a thread pool
+  that shares a single, thread-safe client whose connection pool is
+  sized to match, so hundreds of requests can be in flight without
+  paying for hundreds of processes and boto3 sessions.
+
+  """
+
+  def __init__(self, *args, concurrency = 64, **kwargs):
+    """
+    Inputs:
+        All arguments accepted by AWS_Downloader
+    Keywords:
+        concurrency : Maximum number of transfers in flight.
+                        Default is 64
+        All other keywords accepted by AWS_Downloader
+    """
+
+    super().__init__( *args, **kwargs )
+    self._concurrency = max( concurrency, 1 )
+
+  def run(self):
+    """This code is run in separte process"""
+
+    _ = signal.signal(signal.SIGINT, signal.SIG_IGN)                            # Set to ingnore interupt signals in the process; we handle things nicely from top-level
+
+    log     = self._getLogger()
+    t0      = time.monotonic()                                                  # Start time of this download process
+    stats   = asyncio.run( self._main( log ) )                                  # Run the event loop until all files downloaded
+
+    if self._killEvent.is_set():                                                # If killEvent set
+      self._cancel( stats, log )
+    self._flushDone()
+
+    totSize = stats.totals()[2]                                                 # Total download size for process
+    dt      = time.monotonic() - t0                                             # Compute runtime for the process
+    rate    = humanReadable( totSize, dt )                                      # Compute average download rate of process
+    totSize = humanReadable( totSize )                                          # Total size downloaded by process
+    log.debug( self.PDONE_FMT.format( totSize, dt, rate ) )                     # Log information
+    self._flushLog()
+
+    self._returnQueue.put( stats )                                              # Place stats object into the return queue
+
+  async def _main(self, log):
+    """
+    Start feeder and worker coroutines, wait for them to finish
+
+    Arguments:
+      log (Logger) : Logger to use
+
+    Returns:
+      StatsCollection : Merged statistics from all workers
+
+    """
+
+    loop   = asyncio.get_running_loop()
+    pool   = ThreadPoolExecutor( self._concurrency + 1 )                        # Extra thread so the blocking fileQueue.get() never starves a transfer
+    bucket = self._connect( self._concurrency )                                 # One client shared by all transfers
+    queue  = asyncio.Queue( self._concurrency )                                 # Local queue between feeder and workers
+
+    workers = [
+      loop.create_task( self._worker( loop, pool, queue, bucket, log ) )
+      for i in range( self._concurrency )
+    ]
+    await self._feed( loop, pool, queue )                                       # Feed workers until no more files
+    for worker in workers:                                                      # One sentinel per worker
+      await queue.put( None )
+
+    stats = StatsCollection()
+    for result in await asyncio.gather( *workers ):                             # Merge statistics from all workers
+      stats = stats + result
+
+    pool.shutdown()
+    return stats
+
+  async def _feed(self, loop, pool, queue):
+    """Move files from the multiprocessing fileQueue to the local queue"""
+
+    while self._running():
+      info = await loop.run_in_executor( pool, self._get )
+      if info is not None:
+        await queue.put( info )
+
+  async def _worker(self, loop, pool, queue, bucket, log):
+    """
+    Download files from local queue until sentinel received
+
+    Each worker has its own StatsCollection so that no statistics are
+    shared between threads; they are merged once all workers finish.
+
+    """
+
+    stats = StatsCollection()
+    buf   = bytearray( self._bufsize )                                          # Buffer reused for every transfer by this worker
+    while True:
+      info = await queue.get()
+      if info is None:
+        break
+      if self._killEvent.is_set():                                              # Files pulled before cancel are failures
+        self._failQueued( stats, info )
+        continue
+      await loop.run_in_executor( pool, self._download, bucket, stats, log, info, buf )
+      if queue.empty(): self._flushDone()                                       # Out of files; report now rather than when the feeder next takes a batch
+
+    return stats
@@ -0,0 +1,293 @@
+import io, os
+from collections import namedtuple
+
+
+Listing = namedtuple( 'Listing', ['key', 'size', 'e_tag'] )
+Listing.__doc__ = """
+Object in a bucket listing; same attributes as boto3 ObjectSummary
+
+Fields:
+  key (str) : Key of the object
+  size (int) : Size of the object; bytes
+  e_tag (str) : ETag of the object
+
+"""
+
+class BackendObject( object ):
+  """
+  Object in a backend with the subset of the s3.Object interface used
+  by the download functions
+
+  """
+
+  def __init__(self, backend, key):
+    """
+    Arguments:
+      backend (Backend) : Backend the object lives in
+      key (str) : Key of the object
+
+    """
+
+    self._backend = backend
+    self._head    = None
+    self.key      = key
+
+  def load(self):
+    """Get object metadata"""
+
+    self._head = self._backend.head( self.key )
+
+  @property
+  def content_length(self):
+    if self._head is None: self.load()
+    return self._head.size
+
+  @property
+  def e_tag(self):
+    if self._head is None: self.load()
+    return self._head.e_tag
+
+  def get(self, **kwargs):
+    """Get object; all keywords passed to Backend.get()"""
+
+    return self._backend.get( self.key, **kwargs )
+
+class Backend( object ):
+  """
+  Interface to an object store
+
+  Schedulers list objects through a backend, and download processes
+  get objects (or byte ranges of them) through it. Subclasses must be
+  picklable before connect() is called, as they are handed to the
+  download processes.
+
+  Attributes:
+    name (str) : Name of the bucket
+
+  """
+
+  name = None
+
+  def connect(self, poolSize = None):
+    """
+    Get backend ready to make requests from the calling process
+
+    Keyword arguments:
+      poolSize (int) : Number of requests that may be made concurrently
+
+    Returns:
+      Backend : Connected backend; may be a new instance
+
+    """
+
+    return self
+
+  def list(self, prefix, startAfter = None, stopAfter = None):
+    """
+    List objects below a prefix in key order
+
+    Arguments:
+      prefix (str) : Prefix to list objects below
+
+    Keyword arguments:
+      startAfter (str) : Only list keys after this one
+      stopAfter (str) : Stop listing at the first key after this one
+
+    Returns:
+      iterable : Listing for each object
+
+    """
+
+    raise NotImplementedError
+
+  def head(self, key):
+    """
+    Get metadata for an object
+
+    Arguments:
+      key (str) : Key of the object
+
+    Returns:
+      Listing
+
+    """
+
+    raise NotImplementedError
+
+  def get(self, key, Range = None, IfMatch = None):
+    """
+    Get data of an object
+
+    Arguments:
+      key (str) : Key of the object
+
+    Keyword arguments:
+      Range (str) : HTTP style byte range; e.g., 'bytes=0-99'. An open
+        ended range (e.g., 'bytes=100-') runs to the end of the object
+      IfMatch (str) : Fail unless object has this ETag
+
+    Returns:
+      dict : As returned by S3 GetObject; 'Body' is a file-like object
+        to read data from, 'ContentLength' is the number of bytes in
+        the body, and 'ETag' is the ETag of the object
+
+    """
+
+    raise NotImplementedError
+
+  def Object(self, key):
+    """Return BackendObject for given key"""
+
+    return BackendObject( self, key )
+
+class S3Backend( Backend ):
+  """
+  Objects in an AWS S3 bucket
+
+  Requests are made with a low-level client rather than a resource
+  because clients are thread-safe, so one client (and its connection
+  pool) can be shared by all transfers running in a process.
+
+  """
+
+  def __init__(self, bucketName, resource = 's3', client = None, timeouts = None):
+    """
+    Arguments:
+      bucketName (str) : Name of the bucket
+
+    Keyword arguments:
+      resource (str) : The AWS resource to use
+      client (botocore.client.S3) : Client to make requests with; set
+        by connect()
+      timeouts (tuple) : Connect and read timeouts; seconds. If None,
+        botocore defaults are used
+
+    """
+
+    self.name      = bucketName
+    self._resource = resource
+    self._client   = client
+    self._timeouts = timeouts
+
+  def __getstate__(self):
+    return {**self.__dict__, '_client' : None}                                  # Clients cannot be pickled; each process connects its own
+
+  def connect(self, poolSize = None):
+
+    import boto3.session                                                        # Imported here so that importing the package does not pay for boto3
+    from botocore.config import Config
+
+    session = boto3.session.Session()                                           # Create own session as per https://boto3.amazonaws.com/v1/documentation/api/latest/guide/resources.html
+    kwargs  = {}
+    if poolSize:
+      kwargs['max_pool_connections'] = poolSize
+    if self._timeouts:                                                          # A stalled socket fails the attempt rather than holding the worker
+      kwargs['connect_timeout'], kwargs['read_timeout'] = self._timeouts
+    config  = Config( **kwargs ) if kwargs else None
+    client  = session.client( self._resource, config = config )
+    return S3Backend( self.name, self._resource, client, self._timeouts )
+
+  def list(self, prefix, startAfter = None, stopAfter = None):
+
+    kwargs    = {} if startAfter is None else {'StartAfter' : startAfter} # Listing starts at the first key after startAfter; earlier pages are never requested
+    paginator = self._client.get_paginator( 'list_objects_v2' )
+    for page in paginator.paginate( Bucket = self.name, Prefix = prefix, **kwargs ):
+      for obj in page.get( 'Contents', [] ):
+        if stopAfter is not None and obj['Key'] > stopAfter: return             # Keys are in order, so no later page is needed
+        yield Listing( obj['Key'], obj['Size'], obj['ETag'] )
+
+  def head(self, key):
+
+    resp = self._client.head_object( Bucket = self.name, Key = key )
+    return Listing( key, resp['ContentLength'], resp['ETag'] )
+
+  def get(self, key, **kwargs):
+
+    return self._client.get_object( Bucket = self.name, Key = key, **kwargs )
+
+class LocalBody( io.RawIOBase ):
+  """Body of a LocalBackend response; reads length bytes from an open file"""
+
+  def __init__(self, fid, length):
+    self._fid  = fid
+    self._left = length
+
+  def readable(self):
+    return True
+
+  def readinto(self, view):
+    n = self._fid.readinto( memoryview(view)[:min( len(view), self._left )] )
+    self._left -= n
+    return n
+
+  def close(self):
+    self._fid.close()
+    super().close()
+
+class LocalBackend( Backend ):
+  """
+  Objects stored as files below a local directory
+
+  Keys map to paths relative to the root directory, so a copy of part
+  of a bucket made with, e.g., `aws s3 sync s3://noaa-nexrad-level2/2011/02/28/KHGX root/2011/02/28/KHGX`
+  is served with the same key layout as the bucket; this works for
+  noaa-nexrad-level2 and the noaa-*-bdp-pds model buckets alike. ETags
+  are built from file modification time and size.
+
+  """
+
+  def __init__(self, root, name = None):
+    """
+    Arguments:
+      root (str) : Directory to serve objects from
+
+    Keyword arguments:
+      name (str) : Name of the bucket; default is a file:// URL of
+        root, so listings are never confused with those of a real bucket
+
+    """
+
+    self.root = root
+    self.name = name or 'file://' + os.path.abspath( root )
+
+  def _path(self, key):
+    return os.path.join( self.root, *key.split('/') )
+
+  def _listing(self, key, path):
+    info = os.stat( path )
+    return Listing( key, info.st_size, f'"{info.st_mtime_ns:x}-{info.st_size:x}"' )
+
+  def list(self, prefix, startAfter = None, stopAfter = None):
+
+    top, _, _ = prefix.rpartition( '/' )                                        # Deepest directory that must exist for keys to match
+    keys      = []
+    for dirpath, dirnames, filenames in os.walk( self._path( top ) ):
+      rel  = os.path.relpath( dirpath, self.root )
+      base = '' if rel == os.curdir else rel.replace( os.sep, '/' ) + '/'
+      keys.extend( base + f for f in filenames if (base + f).startswith( prefix ) )
+      dirnames[:] = [d for d in dirnames                                        # Only descend where keys could match prefix
+                      if (base + d + '/').startswith( prefix ) or prefix.startswith( base + d + '/' )]
+    for key in sorted( keys ):
+      if startAfter is not None and key <= startAfter: continue
+      if stopAfter  is not None and key >  stopAfter:  return
+      yield self._listing( key, self._path( key ) )
+
+  def head(self, key):
+
+    return self._listing( key, self._path( key ) )
+
+  def get(self, key, Range = None, IfMatch = None):
+
+    path = self._path( key )
+    head = self._listing( key, path )
+    if IfMatch is not None and IfMatch != head.e_tag:
+      raise ValueError( f'Precondition failed; ETag of {key} is not {IfMatch}' )
+    start, end = 0, head.size-1
+    if Range:
+      start, end = Range.split('=')[1].split('-')
+      start, end = int(start), (min( int(end), head.size-1 ) if end else head.size-1)
+      if start >= head.size:
+        raise ValueError( f'Invalid range for {key} : {Range}' )
+    fid = open( path, 'rb' )
+    fid.seek( start )
+    return {'Body' : LocalBody( fid, end-start+1 ), 'ContentLength' : end-start+1, 'ETag' : head.e_tag}
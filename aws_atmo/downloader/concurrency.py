@@ -0,0 +1,313 @@
+import logging
+import time
+from threading import Thread, Event as ThreadEvent
+from multiprocessing import Condition, Lock, Array, RawValue, RawArray
+
+AUTO  = 'auto'                                                                  # Value of jobs that enables the AIMD controller
+BURST = 0.1                                                                     # Seconds of data a RateLimiter lets through at once
+
+class LiveCounters( object ):
+  """
+  Counters shared by all download processes and threads
+
+  Updated by the download workers as transfers start and files finish,
+  and by the scheduler as files are queued; read by the scheduler (and
+  its AIMD controller and progress reporter) while downloads are
+  running.
+
+  """
+
+  FIELDS = ('bytes', 'files', 'errors', 'failed', 'inFlight',
+            'doneBytes', 'queued', 'queuedBytes', 'skipped')
+
+  def __init__(self):
+    self._values = Array( 'q', len(self.FIELDS) )
+
+  def add(self, nbytes = 0, files = 0, errors = 0, failed = 0, inFlight = 0,
+                doneBytes = 0, queued = 0, queuedBytes = 0, skipped = 0):
+    """
+    Increment counters
+
+    Keyword arguments:
+      nbytes (int) : Bytes downloaded
+      files (int) : Files downloaded, or found already on disk
+      errors (int) : Failed download attempts
+      failed (int) : Files that failed to download
+      inFlight (int) : Change in number of transfers in flight
+      doneBytes (int) : Expected size of files finished; downloaded or not
+      queued (int) : Files queued for download
+      queuedBytes (int) : Expected size of files queued
+      skipped (int) : Files up to date so never queued
+
+    """
+
+    with self._values.get_lock():
+      for i, val in enumerate( (nbytes, files, errors, failed, inFlight,
+                                doneBytes, queued, queuedBytes, skipped) ):
+        if val: self._values[i] += val
+
+  def snapshot(self):
+    """Return dict of current counter values"""
+
+    with self._values.get_lock():
+      return dict( zip( self.FIELDS, self._values[:] ) )
+
+class TransferGate( object ):
+  """
+  Limit on the number of transfers in flight over all download processes
+
+  Workers acquire the gate before each transfer and release it after.
+  The limit may be changed at any time, from any process; lowering it
+  takes effect as running transfers finish.
+
+  """
+
+  def __init__(self, limit):
+    """
+    Arguments:
+      limit (int) : Maximum number of transfers in flight
+
+    """
+
+    self._cond   = Condition()
+    self._limit  = RawValue( 'i', limit )
+    self._active = RawValue( 'i', 0 )
+
+  @property
+  def limit(self):
+    return self._limit.value
+
+  @limit.setter
+  def limit(self, value):
+    with self._cond:
+      self._limit.value = value
+      self._cond.notify_all()
+
+  @property
+  def active(self):
+    return self._active.value
+
+  def acquire(self, timeout = None):
+    """
+    Wait for a transfer slot
+
+    Keyword arguments:
+      timeout (float) : Maximum time to wait; seconds
+
+    Returns:
+      bool : True if slot acquired, False on timeout
+
+    """
+
+    with self._cond:
+      if not self._cond.wait_for( lambda : self._active.value < self._limit.value, timeout ):
+        return False
+      self._active.value += 1
+      return True
+
+  def release(self):
+    """Free slot acquired with acquire()"""
+
+    with self._cond:
+      self._active.value -= 1
+      self._cond.notify()
+
+class RateLimiter( object ):
+  """
+  Token bucket limiting bytes per second over all download processes
+
+  Workers call take() after each read of a response body. Tokens are
+  refilled at `rate` bytes per second, up to BURST seconds' worth. A
+  read that takes more tokens than there are puts the bucket in debt
+  and the reader sleeps until the debt is paid off, so readers are
+  spaced out in proportion to what they read and the aggregate rate
+  stays smooth. Reads are kept to about BURST seconds of data; see
+  chunkSize().
+
+  The rate may be changed at any time, from any process; a rate of zero
+  disables the limit.
+
+  """
+
+  def __init__(self, rate = 0.0):
+    """
+    Keyword arguments:
+      rate (float) : Maximum rate; bytes per second. Zero for no limit
+
+    """
+
+    self._lock   = Lock()
+    self._rate   = RawValue( 'd', rate or 0.0 )
+    self._state  = RawArray( 'd', 6 )                                           # Tokens, time of last refill, bytes taken, time of first take, time waited, time last take is paid for
+
+  @property
+  def rate(self):
+    return self._rate.value
+
+  @rate.setter
+  def rate(self, value):
+    with self._lock:
+      self._rate.value = value or 0.0
+
+  def chunkSize(self, size):
+    """
+    Largest read to make
+
+    Arguments:
+      size (int) : Size of the read buffer
+
+    Returns:
+      int : size, or BURST seconds of data at the current rate if less
+        (but no less than 16 KiB)
+
+    """
+
+    rate = self._rate.value
+    if rate <= 0: return size
+    return max( min( size, int( rate * BURST ) ), min( size, 16 * 1024 ) )
+
+  def take(self, nbytes):
+    """
+    Take tokens for bytes read, sleeping if over the rate
+
+    Arguments:
+      nbytes (int) : Number of bytes read
+
+    Returns:
+      float : Time slept; seconds
+
+    """
+
+    rate = self._rate.value
+    if rate <= 0: return 0.0
+    with self._lock:
+      now   = time.monotonic()                                                  # System-wide clock, so comparable between processes
+      state = self._state
+      if state[3] == 0.0:                                                       # First take; bucket starts full
+        state[0], state[1], state[3] = rate * BURST, now, now
+      state[0]  = min( rate * BURST, state[0] + (now - state[1]) * rate )       # Refill
+      state[1]  = now
+      state[0] -= nbytes
+      state[2] += nbytes
+      wait      = -state[0] / rate if state[0] < 0 else 0.0                     # Time until the debt is paid
+      state[4] += wait
+      state[5]  = max( state[5], now + wait )
+    if wait > 0: time.sleep( wait )
+    return wait
+
+  def realized(self):
+    """
+    Get amount limited and rate achieved
+
+    Returns:
+      tuple : Bytes taken, rate from first take to last (bytes/s), and
+        total time readers slept (seconds)
+
+    """
+
+    with self._lock:
+      taken, t0, waited, t1 = self._state[2:6]
+    dt = t1 - t0
+    return int(taken), (taken / dt if dt > 0 else 0.0), waited
+
+class AIMDController( Thread ):
+  """
+  Adjust the transfer limit of a TransferGate at runtime
+
+  Every `interval` seconds the aggregate throughput and number of failed
+  download attempts since the last check are measured from the shared
+  counters. As in TCP congestion control, the limit grows additively
+  while transfers succeed and throughput holds up, and shrinks
+  multiplicatively when attempts fail (e.g., S3 503 SlowDown). If
+  throughput drops by more than `drop` after an increase, the increase
+  is undone. The limit stays within [minJobs, maxJobs].
+
+  Attributes:
+    decisions (list) : (seconds since t0, limit, MB/s, errors,
+      action) for every change of the limit
+    t0 (float) : time.monotonic() when the controller was created
+
+  """
+
+  def __init__(self, gate, counters, minJobs, maxJobs,
+               interval = 5.0, step = 1, backoff = 0.5, drop = 0.1):
+    """
+    Arguments:
+      gate (TransferGate) : Gate whose limit is controlled
+      counters (LiveCounters) : Counters updated by download workers
+      minJobs (int) : Smallest limit allowed
+      maxJobs (int) : Largest limit allowed
+
+    Keyword arguments:
+      interval (float) : Seconds between adjustments
+      step (int) : Additive increase
+      backoff (float) : Multiplicative decrease factor
+      drop (float) : Fractional throughput drop treated as congestion
+
+    """
+
+    super().__init__( daemon = True )
+    self.log       = logging.getLogger(__name__)
+    self.gate      = gate
+    self.counters  = counters
+    self.minJobs   = minJobs
+    self.maxJobs   = maxJobs
+    self.interval  = interval
+    self.step      = step
+    self.backoff   = backoff
+    self.drop      = drop
+    self.decisions = []
+    self.t0        = time.monotonic()
+    self._finish   = ThreadEvent()
+
+  def decide(self, limit, rate, prevRate, errors, active, increased):
+    """
+    Decide on new transfer limit
+
+    Arguments:
+      limit (int) : Current limit
+      rate (float) : Throughput over last interval; bytes/s
+      prevRate (float) : Throughput over the interval before
+      errors (int) : Failed attempts over last interval
+      active (int) : Transfers in flight
+      increased (bool) : Limit was increased at start of last interval
+
+    Returns:
+      tuple : New limit and name of action taken
+
+    """
+
+    if errors > 0:
+      return max( self.minJobs, int(limit * self.backoff) ), 'decrease'
+    if increased and rate < prevRate * (1.0 - self.drop):
+      return max( self.minJobs, limit - self.step ), 'revert'
+    if active < limit:                                                          # Not all slots in use, so more would not help
+      return limit, 'hold'
+    return min( self.maxJobs, limit + self.step ), 'increase'
+
+  def run(self):
+
+    t0        = self.t0
+    prev      = self.counters.snapshot()
+    prevTime  = t0
+    prevRate  = 0.0
+    increased = False
+    while not self._finish.wait( self.interval ):
+      now   = time.monotonic()
+      snap  = self.counters.snapshot()
+      rate  = (snap['bytes'] - prev['bytes']) / (now - prevTime)
+      errs  = snap['errors'] - prev['errors']
+      limit = self.gate.limit
+      new, action = self.decide( limit, rate, prevRate, errs, self.gate.active, increased )
+      if new != limit:
+        self.gate.limit = new
+        self.decisions.append( (now - t0, new, rate / 1.0e6, errs, action) )
+        self.log.debug( f'Concurrency {limit} -> {new} ({action}); {rate/1.0e6:0.1f} MB/s, {errs} errors' )
+      increased = new > limit
+      prev, prevTime, prevRate = snap, now, rate
+
+  def stop(self):
+    """Stop adjusting and wait for thread to finish"""
+
+    self._finish.set()
+    self.join()
@@ -0,0 +1,186 @@
+"""
+Parse pages of listing results into columns
+
+Rather than splitting, matching and strptime-ing one key at a time, a
+batch of keys is converted to a NumPy character matrix and the fields
+of the file names are decoded with array operations. The schedulers
+then select the objects they want with NumPy comparisons and only
+build Python objects (datetimes, WorkItems) for those.
+
+"""
+from datetime import datetime, timedelta
+
+import numpy
+
+_EPOCH  = datetime(1970, 1, 1)
+_ZERO   = ord('0')
+_FHOUR  = 6                                                                     # Most digits read for a forecast hour
+
+def epoch( date ):
+  """Seconds since epoch of datetime, as int"""
+
+  return int( (date - _EPOCH).total_seconds() )
+
+def fromEpoch( seconds ):
+  """datetime for seconds since epoch"""
+
+  return _EPOCH + timedelta( seconds = int(seconds) )
+
+def _charMatrix( strings ):
+  """
+  Convert strings to a 2-D array of character codes
+
+  Shorter strings are padded with zeros.
+
+  Returns:
+    tuple : Matrix of character codes (n, width), lengths of strings
+
+  """
+
+  arr = numpy.asarray( strings, dtype = str )
+  if arr.size == 0 or arr.itemsize == 0:
+    return numpy.zeros( (arr.size, 1), dtype = numpy.uint32 ), numpy.zeros( arr.size, dtype = numpy.int64 )
+  mat = arr.view( numpy.uint32 ).reshape( arr.size, -1 )
+  return mat, (mat != 0).sum( axis = 1 )
+
+def _columns( mat, start, width ):
+  """Characters start[i]:start[i]+width of every row; zeros past the end"""
+
+  mat  = numpy.concatenate( [mat, numpy.zeros( (mat.shape[0], 1), dtype = mat.dtype )], axis = 1 )
+  cols = numpy.minimum( start[:,None] + numpy.arange( width ), mat.shape[1] - 1 )  # Past the end reads the zero column
+  return numpy.take_along_axis( mat, cols, axis = 1 )
+
+def _isDigit( chars ):
+  return (chars >= _ZERO) & (chars <= _ZERO + 9)
+
+def _number( digits ):
+  """Integer value of each row of a digit matrix"""
+
+  value = numpy.zeros( digits.shape[0], dtype = numpy.int64 )
+  for i in range( digits.shape[1] ):
+    value = value * 10 + (digits[:,i].astype(numpy.int64) - _ZERO)
+  return value
+
+class KeyColumns( object ):
+  """
+  Columns parsed from the keys of a batch of listed objects
+
+  Attributes:
+    objs (list) : The listed objects, in order
+    size (ndarray) : Size of each object; int64
+    station (ndarray) : First four characters of each base name; i.e.,
+      the radar station ID of NEXRAD files
+    time (ndarray) : Time in the file name; int64 seconds since epoch
+    fHour (ndarray) : Forecast hour in the file name; int64
+    valid (ndarray) : True where the fields could be parsed
+
+  """
+
+  def __init__(self, objs):
+    """
+    Arguments:
+      objs (list) : Objects with key, size, and e_tag attributes
+
+    """
+
+    self.objs    = objs if isinstance(objs, list) else list( objs )
+    self.size    = numpy.fromiter( (obj.size for obj in self.objs), dtype = numpy.int64, count = len(self.objs) )
+    self.valid   = numpy.ones( len(self.objs), dtype = bool )
+    self.time    = None
+    self.fHour   = None
+
+    mat, length  = _charMatrix( [obj.key for obj in self.objs] )
+    slash        = mat == ord('/')
+    last         = mat.shape[1] - 1 - numpy.argmax( slash[:,::-1], axis = 1 )    # Index of last '/'
+    self._start  = numpy.where( slash.any( axis = 1 ), last + 1, 0 )            # Start of base name
+    self._mat    = mat
+    self._len    = length
+    self.station = numpy.ascontiguousarray( _columns( mat, self._start, 4 ) ).view( 'U4' ).ravel()
+
+  def __len__(self):
+    return len(self.objs)
+
+  def endswith(self, suffix):
+    """True where the key ends with suffix"""
+
+    n     = len(suffix)
+    chars = _columns( self._mat, numpy.maximum( self._len - n, 0 ), n )
+    match = (chars == numpy.array( [ord(c) for c in suffix], dtype = chars.dtype )).all( axis = 1 )
+    return match & (self._len >= n)
+
+  def parseTime(self, offset = 4):
+    """
+    Parse YYYYMMDD_HHMMSS at offset into the base name into the time column
+
+    Keys where the time can't be parsed are marked invalid.
+
+    Keyword arguments:
+      offset (int) : Index of the time in the base name; 4 for NEXRAD
+        Level 2 files (KXXXYYYYMMDD_HHMMSS...)
+
+    Returns:
+      ndarray : The time column
+
+    """
+
+    chars  = _columns( self._mat, self._start + offset, 15 )
+    date   = chars[:, :8]
+    clock  = chars[:, 9:]
+    ok     = _isDigit( date ).all( axis = 1 ) & _isDigit( clock ).all( axis = 1 ) & (chars[:,8] == ord('_'))
+    year   = _number( date[:, :4] )
+    month  = _number( date[:, 4:6] )
+    day    = _number( date[:, 6:] )
+    hour   = _number( clock[:, :2] )
+    minute = _number( clock[:, 2:4] )
+    second = _number( clock[:, 4:] )
+    ok    &= (month >= 1) & (month <= 12) & (day >= 1) & (day <= 31) & (hour < 24) & (minute < 60) & (second < 60)
+
+    month  = numpy.where( ok, month, 1 )                                        # Keep bad rows from breaking the date arithmetic
+    months = (year - 1970) * 12 + month - 1
+    days   = months.astype( 'datetime64[M]' ).astype( 'datetime64[D]' ).astype( numpy.int64 ) + day - 1
+    ok    &= days.astype( 'datetime64[D]' ).astype( 'datetime64[M]' ).astype( numpy.int64 ) == months # Day exists in month; e.g., not Feb 30
+
+    self.time   = days * 86400 + hour * 3600 + minute * 60 + second
+    self.valid &= ok
+    return self.time
+
+  def parseFHour(self):
+    """
+    Parse the forecast hour, f<digits>, of the base name into the fHour column
+
+    As with re.findall('f(\\d+)', name), the base name must contain
+    exactly one 'f' followed by a digit; other keys are marked invalid.
+
+    Returns:
+      ndarray : The fHour column
+
+    """
+
+    base   = _columns( self._mat, self._start, self._mat.shape[1] + 1 )         # Base names, left aligned; trailing zero column so argmax never sees an empty row, e.g., empty listing
+    digit  = _isDigit( base )
+    starts = (base[:, :-1] == ord('f')) & digit[:, 1:]
+    ok     = starts.sum( axis = 1 ) == 1
+    pos    = numpy.argmax( starts, axis = 1 ) + 1                               # First digit
+    digits = _columns( base, pos, _FHOUR + 1 )
+    run    = numpy.cumprod( _isDigit( digits ), axis = 1 ).sum( axis = 1 )      # Number of digits
+    ok    &= run <= _FHOUR
+    value  = numpy.zeros( len(self.objs), dtype = numpy.int64 )
+    for i in range( _FHOUR ):
+      use   = run > i
+      value = numpy.where( use, value * 10 + digits[:,i].astype(numpy.int64) - _ZERO, value )
+
+    self.fHour  = value
+    self.valid &= ok
+    return self.fHour
+
+  def select(self, mask):
+    """
+    Objects where mask is True
+
+    Returns:
+      generator : (index, object) tuples, in listing order
+
+    """
+
+    for i in numpy.flatnonzero( mask & self.valid ):
+      yield int(i), self.objs[i]
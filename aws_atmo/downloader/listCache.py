@@ -0,0 +1,163 @@
+import logging
+import os, time, json, zlib, sqlite3
+from datetime import datetime, timedelta
+from threading import Lock
+
+from .. import CACHEDIR
+from .backends import Listing
+
+class ListingCache( object ):
+  """
+  On-disk cache of bucket listings keyed by bucket and prefix
+
+  Objects below a prefix are listed once and the key, size and ETag of
+  each are stored in an sqlite file. Prefixes holding data that ended
+  more than `settle` ago (e.g., a station-day of NEXRAD from last year)
+  never change, so their listings never expire. Listings of recent
+  prefixes are reused for `ttl` seconds.
+
+  When the cache grows past `maxSize` bytes, the least recently used
+  listings are evicted.
+
+  Attributes:
+    hits (int) : Number of listings served from the cache
+    misses (int) : Number of listings requested from the bucket
+
+  """
+
+  FILENAME = 'listings.sqlite'
+  SCHEMA   = ('CREATE TABLE IF NOT EXISTS listings '
+              '(bucket TEXT, prefix TEXT, listed REAL, immutable INTEGER, '
+              'nbytes INTEGER, used REAL, data BLOB, PRIMARY KEY (bucket, prefix))')
+
+  def __init__(self, cachedir = CACHEDIR, ttl = 0.0, maxSize = 256 * 1024**2, settle = timedelta(days = 1)):
+    """
+    Keyword arguments:
+      cachedir (str) : Directory to create the cache file in
+      ttl (float) : Seconds that listings of recent prefixes are valid;
+        recent prefixes are not cached if zero
+      maxSize (int) : Maximum size of cached listings; bytes
+      settle (timedelta) : Time after the end of a prefix's data
+        after which the prefix is assumed to never change
+
+    """
+
+    self.log     = logging.getLogger(__name__)
+    self.path    = os.path.join( cachedir, self.FILENAME )
+    self.ttl     = ttl
+    self.maxSize = maxSize
+    self.settle  = settle
+    self.hits    = 0
+    self.misses  = 0
+    self._lock   = Lock()
+    if not os.path.isdir( cachedir ): os.makedirs( cachedir )
+    self._conn   = sqlite3.connect( self.path, timeout = 30.0, check_same_thread = False )
+    self._conn.execute( self.SCHEMA )
+    self._conn.commit()
+
+  def immutable(self, end):
+    """
+    Check if a prefix will never change
+
+    Arguments:
+      end (datetime) : End time of data below the prefix; None if unknown
+
+    Returns:
+      bool
+
+    """
+
+    return end is not None and end + self.settle < datetime.utcnow()
+
+  def filter(self, backend, prefix, end = None, startAfter = None, stopAfter = None):
+    """
+    List objects below a prefix; from the cache when valid
+
+    Arguments:
+      backend (Backend) : Backend to list if not in cache
+      prefix (str) : Prefix to list objects below
+
+    Keyword arguments:
+      end (datetime) : End time of data below the prefix; used to
+        decide if the prefix is immutable
+      startAfter (str) : Only list keys after this one
+      stopAfter (str) : Stop listing at the first key after this one
+
+    Returns:
+      generator : Listing for each object below the prefix. On a cache
+        miss, objects are yielded as the backend lists them, and the
+        listing is cached once it has all been read. Only full listings
+        are cached; a windowed listing is served from the cached full
+        listing if there is one, else from the backend
+
+    """
+
+    listing = self._get( backend.name, prefix )
+    if listing is not None:
+      with self._lock:                                                          # Listing threads share the cache
+        self.hits += 1
+      for obj in listing:
+        if startAfter is not None and obj.key <= startAfter: continue
+        if stopAfter  is not None and obj.key >  stopAfter:  break
+        yield obj
+      return
+
+    with self._lock:
+      self.misses += 1
+    if startAfter is not None or stopAfter is not None:                         # Part of a listing can't stand in for the whole prefix, so don't cache it
+      yield from backend.list( prefix, startAfter, stopAfter )
+      return
+
+    listing = []
+    for obj in backend.list( prefix ):
+      listing.append( obj )
+      yield obj
+    immutable = self.immutable( end )
+    if immutable or self.ttl > 0:
+      self._put( backend.name, prefix, listing, immutable )
+
+  def _get(self, bucketName, prefix):
+
+    now = time.time()
+    with self._lock:
+      row = self._conn.execute(
+        'SELECT listed, immutable, data FROM listings WHERE bucket = ? AND prefix = ?',
+        (bucketName, prefix) ).fetchone()
+      if row is None: return None
+      listed, immutable, data = row
+      if not immutable and listed + self.ttl < now:                             # Expired
+        return None
+      self._conn.execute(
+        'UPDATE listings SET used = ? WHERE bucket = ? AND prefix = ?',
+        (now, bucketName, prefix) )
+      self._conn.commit()
+    return [ Listing( *obj ) for obj in json.loads( zlib.decompress( data ) ) ]
+
+  def _put(self, bucketName, prefix, listing, immutable):
+
+    now  = time.time()
+    data = zlib.compress( json.dumps( listing ).encode() )
+    with self._lock:
+      self._conn.execute(
+        'INSERT OR REPLACE INTO listings VALUES (?, ?, ?, ?, ?, ?, ?)',
+        (bucketName, prefix, now, int(immutable), len(data), now, data) )
+      self._evict()
+      self._conn.commit()
+
+  def _evict(self):
+    """Remove least recently used listings until cache is under maxSize"""
+
+    total = self._conn.execute( 'SELECT COALESCE(SUM(nbytes), 0) FROM listings' ).fetchone()[0]
+    if total <= self.maxSize: return
+    rows = self._conn.execute( 'SELECT bucket, prefix, nbytes FROM listings ORDER BY used' )
+    drop = []
+    for bucketName, prefix, nbytes in rows:
+      if total <= self.maxSize: break
+      drop.append( (bucketName, prefix) )
+      total -= nbytes
+    self._conn.executemany( 'DELETE FROM listings WHERE bucket = ? AND prefix = ?', drop )
+    self.log.debug( f'Evicted {len(drop)} listings from cache' )
+
+  def close(self):
+    with self._lock:
+      self._conn.close()
@@ -0,0 +1,96 @@
+import logging
+import os, time, sqlite3
+from threading import Lock
+
+class MetadataStore( object ):
+  """
+  Record of what has been downloaded to an output directory
+
+  An sqlite file in the top-level output directory holds the key, ETag,
+  size and download time of every file downloaded below it. Comparing
+  bucket listings against this record tells which objects are new or
+  changed without stat'ing any local files.
+
+  All records are read into memory when the store is opened, so lookups
+  are dictionary lookups. Writes may come from a different thread than
+  the one that opened the store.
+
+  """
+
+  FILENAME = '.aws_atmo.sqlite'
+  SCHEMA   = ('CREATE TABLE IF NOT EXISTS files '
+              '(path TEXT PRIMARY KEY, key TEXT, etag TEXT, size INTEGER, mtime REAL)')
+
+  def __init__(self, root):
+    """
+    Arguments:
+      root (str) : Top-level output directory; the sqlite file is
+        created in this directory and paths are stored relative to it
+
+    """
+
+    self.log     = logging.getLogger(__name__)
+    self.root    = root
+    self.path    = os.path.join( root, self.FILENAME )
+    self._lock   = Lock()
+    if not os.path.isdir( root ): os.makedirs( root )
+    self._conn   = sqlite3.connect( self.path, timeout = 30.0, check_same_thread = False )
+    self._conn.execute( self.SCHEMA )
+    self._conn.commit()
+    self._files  = {
+      path : (etag, size) for path, etag, size in
+      self._conn.execute( 'SELECT path, etag, size FROM files' )
+    }
+
+  def __len__(self):
+    return len(self._files)
+
+  def _relpath(self, localFile):
+    return os.path.relpath( localFile, self.root )
+
+  def lookup(self, localFile):
+    """
+    Get recorded ETag and size for a local file
+
+    Arguments:
+      localFile (str) : Full path to local file
+
+    Returns:
+      tuple : ETag and size of the object the file was downloaded from,
+        or None if there is no record of the file
+
+    """
+
+    return self._files.get( self._relpath( localFile ) )
+
+  def record(self, localFile, key, etag, size, commit = True):
+    """
+    Record that a file has been downloaded
+
+    Arguments:
+      localFile (str) : Full path to local file
+      key (str) : Key of the object the file was downloaded from
+      etag (str) : ETag of the object
+      size (int) : Size of the object; bytes
+
+    Keyword arguments:
+      commit (bool) : Commit to disk immediately
+
+    """
+
+    path = self._relpath( localFile )
+    with self._lock:
+      self._files[path] = (etag, size)
+      self._conn.execute(
+        'INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)',
+        (path, key, etag, size, time.time()) )
+      if commit: self._conn.commit()
+
+  def commit(self):
+    with self._lock:
+      self._conn.commit()
+
+  def close(self):
+    with self._lock:
+      self._conn.commit()
+      self._conn.close()
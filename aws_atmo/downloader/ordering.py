@@ -0,0 +1,202 @@
+"""
+Orders in which schedulers hand files to the download processes
+
+An order is a priority function that takes a WorkItem and returns a
+sort key; files with the smallest keys are downloaded first. Files
+with equal keys are downloaded in listing order. Any callable may be
+used, so custom orders can be passed to AWS_Scheduler directly.
+
+"""
+import heapq
+from datetime import datetime
+
+_EPOCH = datetime(1970, 1, 1)
+
+def _timestamp( item ):
+  """Seconds since epoch of WorkItem time; zero if not known"""
+
+  return 0.0 if item.time is None else (item.time - _EPOCH).total_seconds()
+
+def _fHour( item ):
+  """Forecast hour of WorkItem; zero if not known (e.g., NEXRAD)"""
+
+  return item.fHour or 0
+
+def analysisFirst( item ):
+  """
+  Analysis and early forecast hours first
+
+  For model data, every run's analysis is downloaded before any run's
+  first forecast hour, and so on. For radar data, oldest volumes first.
+
+  """
+
+  return _fHour( item ), _timestamp( item )
+
+def latestFirst( item ):
+  """
+  Most recent model run or radar volume first
+
+  Within a model run, early forecast hours first.
+
+  """
+
+  return -_timestamp( item ), _fHour( item )
+
+def largestFirst( item ):
+  """
+  Largest files first
+
+  Starting the big files early keeps one large straggler from setting
+  the length of a backfill.
+
+  """
+
+  return -(item.size or 0)
+
+def deadline( item ):
+  """
+  Earliest valid time first; i.e., initialization time plus forecast hour
+
+  Files are downloaded in the order they will be needed by anything
+  stepping forward through time.
+
+  """
+
+  return _timestamp( item ) + 3600.0 * _fHour( item )
+
+ORDERS = {
+  'listing'  : None,
+  'analysis' : analysisFirst,
+  'latest'   : latestFirst,
+  'largest'  : largestFirst,
+  'deadline' : deadline,
+}
+
+def getOrder( order ):
+  """
+  Get priority function for an order
+
+  Arguments:
+    order (str, callable) : Name of an order in ORDERS, a priority
+      function, or None for listing order
+
+  Returns:
+    callable : Priority function; None for listing order
+
+  """
+
+  if order is None or callable( order ):
+    return order
+  try:
+    return ORDERS[order]
+  except KeyError:
+    raise ValueError( f'order must be callable or one of {", ".join(ORDERS)} : {order}' )
+
+class PendingQueue( object ):
+  """
+  Work items waiting to be put on the fileQueue
+
+  Items are kept in one heap per label, each ordered by the priority
+  function. Which label the next item comes from depends on the mode:
+  without fair sharing, the label holding the highest priority item;
+  with fair sharing, the label that has been served least relative to
+  its weight, so every label's files arrive at the same (weighted)
+  rate. Labels at their cap on files queued or downloading are skipped
+  until one of their files finishes.
+
+  Not thread-safe; the caller must hold a lock.
+
+  """
+
+  def __init__(self, order = None, fairShare = False, labelCaps = None):
+    """
+    Keyword arguments:
+      order (str, callable) : Order of items; see getOrder
+      fairShare (bool, dict) : If True, share downloads equally between
+        labels; if a dict, share them in proportion to the weight given
+        for each label (labels not in the dict have weight 1)
+      labelCaps (int, dict) : Maximum number of files queued or
+        downloading for each label; a dict gives caps by label (labels
+        not in the dict have no cap). If None, there are no caps
+
+    """
+
+    self.order     = getOrder( order )
+    self.weights   = ({} if fairShare is True else dict(fairShare)) if fairShare else None
+    self.caps      = labelCaps
+    self.inFlight  = {}                                                         # Files queued or downloading per label
+    self.served    = {}                                                         # Weighted number of files handed out per label
+    self._heaps    = {}
+    self._size     = 0
+    self._seq      = 0                                                          # Keeps listing order among equal priorities
+
+  def __len__(self):
+    return self._size
+
+  def _cap(self, label):
+    if isinstance(self.caps, dict): return self.caps.get( label, None )
+    return self.caps
+
+  def _eligible(self, label):
+    cap = self._cap( label )
+    return cap is None or self.inFlight.get( label, 0 ) < cap
+
+  def push(self, item):
+    """Add WorkItem to queue"""
+
+    priority = () if self.order is None else self.order( item )
+    heap     = self._heaps.get( item.label, None )
+    if heap is None:
+      if self.weights is not None:                                              # New or returning label starts level with the others, not ahead of them
+        level = min( (self.served[label] for label in self._heaps), default = 0.0 )
+        self.served[item.label] = max( self.served.get( item.label, 0.0 ), level )
+      heap = self._heaps[item.label] = []
+    heapq.heappush( heap, (priority, self._seq, item) )
+    self._seq  += 1
+    self._size += 1
+
+  def pop(self):
+    """
+    Take next item from queue
+
+    Returns:
+      WorkItem : Next item to download; None if queue is empty or every
+        label with items is at its cap
+
+    """
+
+    labels = [label for label in self._heaps if self._eligible( label )]
+    if len(labels) == 0: return None
+    if self.weights is None:
+      label = min( labels, key = lambda label : self._heaps[label][0][:2] )
+    else:
+      label = min( labels, key = lambda label : (self.served[label], self._heaps[label][0][1]) )
+      self.served[label] += 1.0 / self.weights.get( label, 1.0 )
+
+    heap = self._heaps[label]
+    item = heapq.heappop( heap )[-1]
+    if len(heap) == 0: del self._heaps[label]
+    self._size -= 1
+    self.inFlight[label] = self.inFlight.get( label, 0 ) + 1
+    return item
+
+  def finished(self, label):
+    """Note that a file for label is no longer queued or downloading"""
+
+    if self.inFlight.get( label, 0 ) > 0:
+      self.inFlight[label] -= 1
+
+  def clear(self):
+    """
+    Drop all items
+
+    Returns:
+      list : The items dropped
+
+    """
+
+    items = [entry[-1] for heap in self._heaps.values() for entry in heap]
+    self._heaps.clear()
+    self._size = 0
+    return items
@@ -0,0 +1,165 @@
+"""
+Report progress of a running download
+
+While the download processes run, a ProgressReporter thread in the
+scheduler reads the shared LiveCounters and logs a progress line and/or
+writes the counters as a Prometheus text-format file, which can be
+scraped with node_exporter's textfile collector.
+
+"""
+import logging
+import os
+from threading import Thread, Event as ThreadEvent
+
+from .stats import humanReadable
+
+PROGRESS_INTERVAL = 15.0                                                        # Default seconds between progress reports
+PROGRESS_FMT      = ('   Progress : {files:d}/{queued:d} files ({failed:d} failed, {skipped:d} up to date), '
+                     '{size} at {rate}, {inFlight:d} in flight, ETA {eta}')
+
+METRICS = (                                                                     # Key in progress snapshot, metric name, type, help; counters are read from the snapshot's totals
+  ('bytes',       'bytes_total',         'counter', 'Bytes downloaded'),
+  ('files',       'files_total',         'counter', 'Files downloaded or already on disk'),
+  ('failed',      'failed_total',        'counter', 'Files that failed to download'),
+  ('errors',      'errors_total',        'counter', 'Failed download attempts'),
+  ('skipped',     'skipped_total',       'counter', 'Files up to date locally so never queued'),
+  ('queued',      'queued_total',        'counter', 'Files queued for download'),
+  ('queuedBytes', 'queued_bytes_total',  'counter', 'Bytes queued for download'),
+  ('bytes',       'batch_bytes',         'gauge',   'Bytes downloaded in current batch'),
+  ('files',       'batch_files',         'gauge',   'Files downloaded or already on disk in current batch'),
+  ('failed',      'batch_failed',        'gauge',   'Files that failed to download in current batch'),
+  ('errors',      'batch_errors',        'gauge',   'Failed download attempts in current batch'),
+  ('skipped',     'batch_skipped',       'gauge',   'Files up to date locally so never queued in current batch'),
+  ('queued',      'batch_queued',        'gauge',   'Files queued for download in current batch'),
+  ('queuedBytes', 'batch_queued_bytes',  'gauge',   'Bytes queued for download in current batch'),
+  ('inFlight',    'in_flight',           'gauge',   'Transfers in flight'),
+  ('remaining',   'remaining',           'gauge',   'Files queued but not yet finished'),
+  ('rate',        'rate_bytes',          'gauge',   'Average download rate; bytes per second'),
+  ('eta',         'eta_seconds',         'gauge',   'Estimated time until queued files finish; -1 if unknown'),
+  ('elapsed',     'elapsed_seconds',     'gauge',   'Time since the download started'),
+  ('listing',     'listing',             'gauge',   '1 while files are still being listed'),
+  ('rateLimit',   'rate_limit_bytes',    'gauge',   'Bandwidth limit; bytes per second. 0 if not limited'),
+)
+
+def formatETA( eta ):
+  """Format seconds as H:MM:SS; '?' if unknown"""
+
+  if eta is None or eta < 0: return '?'
+  eta = int(eta)
+  return f'{eta // 3600:d}:{eta % 3600 // 60:02d}:{eta % 60:02d}'
+
+def formatProgress( progress ):
+  """
+  Format progress snapshot as a single log line
+
+  Arguments:
+    progress (dict) : Snapshot from AWS_Scheduler.progress()
+
+  Returns:
+    str
+
+  """
+
+  return PROGRESS_FMT.format( **{ **progress,
+    'size' : humanReadable( progress['bytes'] ),
+    'rate' : humanReadable( progress['rate'], 1.0 ),
+    'eta'  : formatETA( progress['eta'] ) } )
+
+def writePrometheus( path, progress, labels = None, prefix = 'aws_atmo_' ):
+  """
+  Write progress snapshot to file in Prometheus text format
+
+  The file is written to a temporary file and renamed into place so a
+  scrape never sees a partial file. For node_exporter's textfile
+  collector, the file name must end in .prom.
+
+  Counters are written from the snapshot's totals, which only increase
+  while the scheduler runs, so reusing a scheduler for another batch
+  does not look like a counter reset. The counts of the current batch
+  are written as gauges.
+
+  Arguments:
+    path (str) : File to write
+    progress (dict) : Snapshot from AWS_Scheduler.progress()
+
+  Keyword arguments:
+    labels (dict) : Labels to add to every metric; e.g., bucket name
+    prefix (str) : Prefix for metric names
+
+  """
+
+  labels = ','.join( '{}="{}"'.format( key, str(val).replace('\\', '\\\\').replace('"', '\\"') )
+                     for key, val in (labels or {}).items() )
+  labels = f'{{{labels}}}' if labels else ''
+  totals = progress.get( 'totals', None ) or progress                            # Snapshots without totals cover a single batch
+  lines  = []
+  for key, name, kind, text in METRICS:
+    value = (totals if kind == 'counter' else progress).get( key, None )
+    if value is None: value = -1
+    lines.append( f'# HELP {prefix}{name} {text}' )
+    lines.append( f'# TYPE {prefix}{name} {kind}' )
+    lines.append( f'{prefix}{name}{labels} {float(value):g}' )
+
+  tmp = f'{path}.{os.getpid()}.tmp'
+  with open( tmp, 'w' ) as fid:
+    fid.write( '\n'.join( lines ) + '\n' )
+  os.replace( tmp, path )
+
+class ProgressReporter( Thread ):
+  """
+  Periodically log progress and/or write Prometheus metrics
+
+  """
+
+  def __init__(self, progress, interval = PROGRESS_INTERVAL, log = True, metricsFile = None, labels = None):
+    """
+    Arguments:
+      progress (callable) : Returns a progress snapshot; e.g.,
+        AWS_Scheduler.progress
+
+    Keyword arguments:
+      interval (float) : Seconds between reports
+      log (bool) : Log a progress line every report
+      metricsFile (str) : Prometheus text-format file to write every
+        report; None to not write metrics
+      labels (dict) : Labels to add to every metric
+
+    """
+
+    super().__init__( daemon = True )
+    self.log         = logging.getLogger(__name__)
+    self.progress    = progress
+    self.interval    = interval
+    self.logProgress = log
+    self.metricsFile = metricsFile
+    self.labels      = labels
+    self._finish     = ThreadEvent()
+
+  def report(self, log = None):
+    """
+    Report progress now
+
+    Keyword arguments:
+      log (bool) : Log a progress line; defaults to the log setting
+
+    """
+
+    progress = self.progress()
+    if self.logProgress if log is None else log:
+      self.log.info( formatProgress( progress ) )
+    if self.metricsFile:
+      try:
+        writePrometheus( self.metricsFile, progress, self.labels )
+      except Exception as err:
+        self.log.warning( f'Failed to write metrics to {self.metricsFile} : {err}' )
+
+  def run(self):
+
+    while not self._finish.wait( self.interval ):
+      self.report()
+
+  def stop(self):
+    """Stop reporting and wait for thread to finish"""
+
+    self._finish.set()
+    if self.is_alive(): self.join()
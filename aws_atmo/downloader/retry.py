@@ -0,0 +1,100 @@
+import random
+from multiprocessing import Value
+
+BACKOFF          = (0.5, 30.0)                                                  # Base and maximum backoff after a failed attempt; seconds
+THROTTLE_BACKOFF = (2.0, 120.0)                                                 # Base and maximum backoff after a throttling response; seconds
+THROTTLE_CODES   = ('SlowDown', 'Throttling', 'ThrottlingException',
+                    'RequestLimitExceeded', 'TooManyRequests', '503')          # Error codes S3 uses to ask clients to slow down
+
+class Throttled( Exception ):
+  """Raised when a request was refused because requests are too frequent"""
+
+def isThrottle( err ):
+  """
+  Check if an exception is a throttling response
+
+  Arguments:
+    err (Exception) : Exception raised by a request; botocore
+      ClientErrors are inspected for their error code and HTTP status
+
+  Returns:
+    bool : True if the request should be retried more slowly
+
+  """
+
+  if isinstance( err, Throttled ): return True
+  resp = getattr( err, 'response', None )
+  if not isinstance( resp, dict ): return False
+  code   = resp.get( 'Error', {} ).get( 'Code', '' )
+  status = resp.get( 'ResponseMetadata', {} ).get( 'HTTPStatusCode', None )
+  return code in THROTTLE_CODES or status in (429, 503)
+
+class RetryPolicy( object ):
+  """
+  Delays between download attempts, and a retry budget for the run
+
+  Delays grow exponentially with the attempt number, with "full
+  jitter": the delay is drawn uniformly between zero and the
+  exponential bound so that workers that failed together do not retry
+  together. Throttling responses use a separate, longer backoff.
+
+  The budget is the number of retries allowed over all download
+  processes, so that one bad prefix cannot use up the whole run
+  retrying; once spent, failed files are not retried.
+
+  """
+
+  def __init__(self, backoff = BACKOFF, throttleBackoff = THROTTLE_BACKOFF, budget = None):
+    """
+    Keyword arguments:
+      backoff (tuple) : Base and maximum delay after a failed attempt;
+        seconds
+      throttleBackoff (tuple) : Base and maximum delay after a throttling
+        response; seconds
+      budget (int) : Total number of retries allowed. If None, there
+        is no limit
+
+    """
+
+    self.backoff         = backoff
+    self.throttleBackoff = throttleBackoff
+    self._budget         = None if budget is None else Value( 'i', budget )
+
+  @property
+  def budget(self):
+    """Retries left; None if no limit"""
+
+    return None if self._budget is None else self._budget.value
+
+  def delay(self, attempt, throttled = False):
+    """
+    Time to wait before next attempt
+
+    Arguments:
+      attempt (int) : Number of attempts that have failed; starts at 1
+
+    Keyword arguments:
+      throttled (bool) : Last attempt failed with throttling response
+
+    Returns:
+      float : Delay; seconds
+
+    """
+
+    base, cap = self.throttleBackoff if throttled else self.backoff
+    return random.uniform( 0, min( cap, base * 2**(attempt-1) ) )
+
+  def take(self):
+    """
+    Take one retry from the budget
+
+    Returns:
+      bool : True if a retry may be made, False if budget is spent
+
+    """
+
+    if self._budget is None: return True
+    with self._budget.get_lock():
+      if self._budget.value <= 0: return False
+      self._budget.value -= 1
+    return True
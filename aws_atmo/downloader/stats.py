@@ -1,6 +1,13 @@
+import math
+
 FACTORS = (1.0e9, 1.0e6, 1.0e3)
 PREFIX  = ( 'GB',  'MB',  'KB')
 
+LATENCY_RANGE    = (1.0e-3, 1.0e4)                                              # Range of latency histograms; seconds
+THROUGHPUT_RANGE = (1.0e2,  1.0e11)                                             # Range of throughput histograms; bytes/s
+PER_DECADE       = 20                                                           # Histogram buckets per factor of 10; each bucket is ~12% wide
+QUANTILES        = (0.50, 0.95, 0.99)                                           # Quantiles reported by AWS_Scheduler.wait()
+
 def humanReadable(size, dt = None):
   """
   Convert number of bytes to a human-readable format
@@ -38,10 +45,119 @@ def humanReadable(size, dt = None):
   return strfmt.format( size, 'B' )                                             # If made here, then is only bytes, return formatted string
 
 
+class Histogram( object ):
+  """
+  Counts of values in fixed, log-scale buckets
+
+  Buckets are the same for every histogram with the same range, so
+  histograms merge by adding counts, no matter how many values went
+  into them. Quantiles are accurate to about the width of a bucket.
+  Values below (above) the range are counted in the first (last) bucket.
+  Only buckets holding values are stored, so the histograms of labels
+  with few files are small and cheap to merge.
+
+  """
+
+  __slots__ = ('lo', 'hi', 'perDecade', 'nBuckets', 'counts')
+
+  def __init__(self, lo, hi, perDecade = PER_DECADE, counts = None):
+    """
+    Arguments:
+      lo (float) : Lower edge of first bucket
+      hi (float) : Upper edge of last bucket
+
+    Keyword arguments:
+      perDecade (int) : Number of buckets per factor of 10
+      counts (dict) : Initial counts, keyed by bucket index; empty if None
+
+    """
+
+    self.lo        = lo
+    self.hi        = hi
+    self.perDecade = perDecade
+    self.nBuckets  = math.ceil( math.log10( hi / lo ) * perDecade )
+    self.counts    = {} if counts is None else counts
+
+  @classmethod
+  def _fromCounts(cls, like, counts):
+    """Histogram with the buckets of like and the given counts, without recomputing the buckets"""
+
+    hist           = object.__new__( cls )
+    hist.lo        = like.lo
+    hist.hi        = like.hi
+    hist.perDecade = like.perDecade
+    hist.nBuckets  = like.nBuckets
+    hist.counts    = counts
+    return hist
+
+  @property
+  def count(self):
+    """Number of values counted"""
+    return sum( self.counts.values() )
+
+  def __add__(self, other):
+
+    if isinstance(other, Histogram):
+      if (self.lo, self.hi, self.perDecade) != (other.lo, other.hi, other.perDecade):
+        raise ValueError( 'Cannot add histograms with different buckets' )
+      counts = dict( self.counts )
+      for i, n in other.counts.items():
+        counts[i] = counts.get( i, 0 ) + n
+      return Histogram._fromCounts( self, counts )
+    return NotImplemented
+
+  def add(self, value):
+    """Count one value"""
+
+    if value <= self.lo:
+      i = 0
+    else:
+      i = min( int( math.log10( value / self.lo ) * self.perDecade ), self.nBuckets - 1 )
+    self.counts[i] = self.counts.get( i, 0 ) + 1
+
+  def quantile(self, q):
+    """
+    Estimate quantile of the values counted
+
+    The value is interpolated, on a log scale, within the bucket the
+    quantile falls in.
+
+    Arguments:
+      q (float) : Quantile; between 0 and 1
+
+    Returns:
+      float : Estimated value; None if no values counted
+
+    """
+
+    total = self.count
+    if total == 0: return None
+    rank  = max( q * total, 1 )                                                 # At least the smallest value
+    cum   = 0                                                                   # Values in buckets below bucket i
+    for i in sorted( self.counts ):                                             # Find bucket the quantile falls in
+      n = self.counts[i]
+      if cum + n >= rank: break
+      cum += n
+    frac  = (rank - cum) / n
+    return float( self.lo * 10.0**( (i + frac) / self.perDecade ) )
+
+  def quantiles(self, qs = QUANTILES):
+    """Estimate several quantiles; see quantile()"""
+
+    return [ self.quantile( q ) for q in qs ]
+
+def _addHist( a, b ):
+  """Add histograms where either may be None"""
+
+  if a is None: return b
+  if b is None: return a
+  return a + b
+
 class DownloadStats( object ):
   """Store statistics downloads in a download process"""
 
-  def __init__(self, nSuccess = 0, nFail = 0, size = 0, dt = 0.0 ):
+  def __init__(self, nSuccess = 0, nFail = 0, size = 0, dt = 0.0, nRetry = 0, backoff = 0.0,
+                     latency = None, ttfb = None, throughput = None ):
     """
     Arguments:
       None
@@ -51,20 +167,30 @@ class DownloadStats( object ):
       nFail (int) : Number of failed downloads
       size (int) : Size of all successful downloads; in bytes
       dt (float) : Time it took for all downloads; in seconds
+      nRetry (int) : Number of download attempts that were retried
+      backoff (float) : Time spent waiting between attempts; in seconds
+      latency (Histogram) : Time to download each file; in seconds
+      ttfb (Histogram) : Time to first byte of each file; in seconds
+      throughput (Histogram) : Rate of each download; in bytes/s
 
     """
 
-    self._nSuccess = nSuccess
-    self._nFail    = nFail
-    self._size     = size
-    self._dt       = dt
+    self._nSuccess   = nSuccess
+    self._nFail      = nFail
+    self._size       = size
+    self._dt         = dt
+    self._nRetry     = nRetry
+    self._backoff    = backoff
+    self._latency    = latency                                                  # Histograms are created on first download, so labels with none stay small
+    self._ttfb       = ttfb
+    self._throughput = throughput
 
   def __repr__(self):
 
     attempts = self._nSuccess + self._nFail
     size     = humanReadable( self.size )
     rate     = humanReadable( self.size, self.dt ) 
-    return f"<Success : {self._nSuccess} - Failed : {self._nFail} - Attempts : {attempts} - Size : {size} - Time : {self._dt} - Rate : {rate}/S>"
+    return f"<Success : {self._nSuccess} - Failed : {self._nFail} - Attempts : {attempts} - Size : {size} - Time : {self._dt} - Rate : {rate}/S - Retries : {self._nRetry} - Backoff : {self._backoff:0.1f}>"
  
   def __add__(self, other):
 
@@ -73,7 +199,12 @@ class DownloadStats( object ):
         self._nSuccess + other._nSuccess,
         self._nFail    + other._nFail,
         self._size     + other._size,
-        self._dt       + other._dt
+        self._dt       + other._dt,
+        self._nRetry   + other._nRetry,
+        self._backoff  + other._backoff,
+        _addHist( self._latency,    other._latency ),
+        _addHist( self._ttfb,       other._ttfb ),
+        _addHist( self._throughput, other._throughput ),
       )
 
   @property
@@ -88,8 +219,23 @@ class DownloadStats( object ):
   @property
   def dt(self):
     return self._dt
+  @property
+  def nRetry(self):
+    return self._nRetry
+  @property
+  def backoff(self):
+    return self._backoff
+  @property
+  def latency(self):
+    return self._latency
+  @property
+  def ttfb(self):
+    return self._ttfb
+  @property
+  def throughput(self):
+    return self._throughput
 
-  def success(self, size, dt):
+  def success(self, size, dt, ttfb = None):
     """
     Method to signal successful download
 
@@ -97,17 +243,43 @@ class DownloadStats( object ):
       size (int) : Size of the download
       dt (float) : Time it took to download
 
+    Keyword arguments:
+      ttfb (float) : Time until the first response arrived
+
     """
 
     self._nSuccess += 1                                                         # Increment # of successful downloads
     self._size     += size                                                      # Increment total size of downloads
     self._dt       += dt                                                        # Increment download time
+    if dt <= 0: return                                                          # Nothing was transferred; e.g., file already on disk
+    if self._latency is None:
+      self._latency    = Histogram( *LATENCY_RANGE )
+      self._ttfb       = Histogram( *LATENCY_RANGE )
+      self._throughput = Histogram( *THROUGHPUT_RANGE )
+    self._latency.add( dt )
+    self._throughput.add( size / dt )
+    if ttfb is not None: self._ttfb.add( ttfb )
 
   def fail(self):
     """Method to signal failed download"""
 
     self._nFail += 1                                                            # Increment # of fails
 
+  def retry(self, backoff, count = 1):
+    """
+    Method to signal a failed attempt that will be retried
+
+    Arguments:
+      backoff (float) : Time waited before retrying
+
+    Keyword arguments:
+      count (int) : Number of retries backoff is the total for
+
+    """
+
+    self._nRetry  += count                                                      # Increment # of retries
+    self._backoff += backoff                                                    # Increment time spent backing off
+
 class StatsCollection( dict ):
   """Store statistics about downloads in an AWS_Downloader process"""
 
@@ -157,3 +329,37 @@ class StatsCollection( dict ):
       dt       += val.dt                                                        # Sum time
 
     return nSuccess, nFail, size, dt                                            # Return totals
+
+  def retries(self):
+    """
+    Get number of retries and backoff time for all objects in the collection
+
+    Returns:
+      tuple : # of retried attempts, time spent backing off (seconds)
+
+    """
+
+    nRetry, backoff = 0, 0.0
+    for key, val in self.items():
+      nRetry  += val.nRetry
+      backoff += val.backoff
+
+    return nRetry, backoff
+
+  def histograms(self):
+    """
+    Get histograms merged over all objects in the collection
+
+    Returns:
+      tuple : Latency, time to first byte, and throughput Histograms;
+        None for each if no files were downloaded
+
+    """
+
+    latency = ttfb = throughput = None
+    for key, val in self.items():
+      latency    = _addHist( latency,    val.latency )
+      ttfb       = _addHist( ttfb,       val.ttfb )
+      throughput = _addHist( throughput, val.throughput )
+
+    return latency, ttfb, throughput
@@ -1,30 +1,177 @@
 import logging
+import os, time
+from contextlib import suppress
+from queue import Queue
+from concurrent.futures import ThreadPoolExecutor
+
+from .retry import Throttled, isThrottle
+
+MAX_GAP    = 64 * 1024                                                          # Merge byte ranges separated by up to this many bytes
+RANGE_JOBS = 8                                                                  # Maximum concurrent range requests per file
+BUFSIZE    = 1024 * 1024                                                        # Size of the reusable read buffer for each transfer
+
+def readInto( body, view ):
+  """
+  Read from streaming body into a buffer
+
+  Uses the body's readinto() method so that no new bytes object is
+  allocated for each read. Falls back to read() for bodies that do
+  not support readinto().
+
+  Arguments:
+    body (file-like) : Streaming response body
+    view (memoryview) : Buffer to read data into
+
+  Returns:
+    int : Number of bytes read; zero at end of stream
+
+  """
+
+  readinto = getattr( body, 'readinto', None )
+  if readinto is not None:
+    return readinto( view ) or 0
+  data = body.read( len(view) )
+  view[:len(data)] = data
+  return len(data)
+
+def writeStream( body, fid, buf, pieces = None, limiter = None ):
+  """
+  Stream response body to file through a reusable buffer
+
+  Data are written as they arrive, so memory use is bounded by the
+  size of the buffer rather than the size of the response.
+
+  Arguments:
+    body (file-like) : Streaming response body
+    fid (file-like) : Open file object to write data to
+    buf (bytearray) : Buffer to read data into
+
+  Keyword arguments:
+    pieces (list) : (skip, length, position) tuples, as returned by
+      planRanges, giving the parts of the response to keep and where
+      to write them. If None, all data are written at the current
+      file position
+    limiter (RateLimiter) : Limit on bytes per second over all
+      transfers; waited on after every read, and reads are kept small
+      enough that the rate is smooth
+
+  Returns:
+    tuple : Number of bytes read from body, number of bytes written
+
+  """
+
+  view    = memoryview( buf )
+  nRead   = 0                                                                   # Offset into the response
+  nWrite  = 0
+  while True:
+    n = readInto( body, view if limiter is None else view[:limiter.chunkSize( len(view) )] )
+    if n == 0:                                                                  # End of stream
+      break
+    if limiter is not None: limiter.take( n )
+    chunk = view[:n]
+    if pieces is None:
+      fid.write( chunk )
+      nWrite += n
+    else:
+      for skip, length, position in pieces:                                     # Write any part of the chunk that overlaps a piece
+        end   = nRead + n if length is None else min( nRead + n, skip + length )
+        start = max( nRead, skip )
+        if start < end:
+          os.pwrite( fid.fileno(), chunk[start-nRead:end-nRead], position + start - skip )
+          nWrite += end - start
+    nRead += n
+
+  return nRead, nWrite
 
 def downloadBytes( obj ):
   """
   Download bytes from AWS object 
 
+  The data are read directly into a buffer sized to the object, so only
+  one allocation is made regardless of object size.
+
   Arguments:
     obj (s3.Object) : An AWS boto3 object to download
 
   Returns:
-    bytes : Raw byte data from remote
+    bytearray : Raw byte data from remote
 
   """
 
   log = logging.getLogger( __name__ )
   try:
     resp = obj.get()
-    data = resp['Body'].read()
+    size = resp['ContentLength']
+    data = bytearray( size )
+    view = memoryview( data )
+    nRead = 0
+    while nRead < size:
+      n = readInto( resp['Body'], view[nRead:] )
+      if n == 0: break
+      nRead += n
   except Exception as err:
     log.debug( err )
     return None
   finally:
     resp = None
-  
+
+  if nRead != size:
+    return None
   return data
 
-def downloadChunk( obj, fid, offsets ):
+def planRanges( offsets, maxGap = MAX_GAP ):
+  """
+  Merge byte ranges into as few requests as possible
+
+  Ranges are sorted and any that are adjacent, or separated by no more
+  than maxGap bytes, are merged into a single request; the bytes in the
+  gap are fetched and thrown away, which is cheaper than paying for
+  another round trip. Data from each range is written to the local
+  file back-to-back in the order the ranges were given, matching the
+  offsets written to subset idx files by parseIDX.
+
+  Arguments:
+    offsets (list) : (start, end) byte ranges, inclusive. The end of the
+      LAST range may be '' or None to read to the end of the object
+
+  Keyword arguments:
+    maxGap (int) : Maximum number of unwanted bytes between two ranges
+      for them to be merged. Set to negative value to disable merging
+
+  Returns:
+    list : ((start, end), pieces) for each request to make, where pieces
+      is a list of (skip, length, position) tuples giving the offset
+      into the response, the number of bytes to keep (None for to the
+      end), and the position in the local file to write them to
+
+  """
+
+  ranges   = []
+  position = 0                                                                  # Position in local file of the next range
+  for i, (start, end) in enumerate( offsets ):
+    start = int(start)
+    end   = None if end in ('', None) else int(end)
+    if end is None and i != len(offsets)-1:
+      raise ValueError( 'Only the last range may be open ended' )
+    ranges.append( (start, end, position) )
+    if end is not None:
+      position += end - start + 1
+
+  requests = []
+  for start, end, position in sorted( ranges ):                                 # Iterate over ranges in order they appear in remote file
+    length = None if end is None else end - start + 1
+    if len(requests) > 0:
+      (rStart, rEnd), pieces = requests[-1]
+      if rEnd is not None and start - rEnd - 1 <= maxGap:                       # If the range is close enough to the previous request, merge them
+        rEnd = end if end is None else max(rEnd, end)
+        pieces.append( (start - rStart, length, position) )
+        requests[-1] = ((rStart, rEnd), pieces)
+        continue
+    requests.append( ((start, end), [(0, length, position)]) )
+
+  return requests
+
+def downloadChunk( obj, fid, offsets, pieces = None, buf = None, timing = None, limiter = None ):
   """
   Download chunk of data from AWS object to file-like object
 
@@ -32,29 +179,49 @@ def downloadChunk( obj, fid, offsets ):
     obj (s3.Object) : An AWS boto3 object to download
     fid (file-like) : Full local file path to download data to
     offsets (tuple) : starting and ending bytes to download
+
+  Keyword arguments:
+    pieces (list) : (skip, length, position) tuples, as returned by
+      planRanges, giving the parts of the chunk to keep and where to
+      write them. Writes are positional, so chunks may be downloaded
+      concurrently. If None, the whole chunk is written at the
+      current file position
+    buf (bytearray) : Reusable buffer to stream data through. If None,
+      a buffer of BUFSIZE bytes is allocated
+    timing (dict) : If given, 'ttfb' is set to the time, in seconds, from
+      sending the request to receiving its response headers
+    limiter (RateLimiter) : Limit on bytes per second over all transfers
+
   Returns:
     int : Size of data downloaded. If size is 0, then download failed
 
+  Raises:
+    Throttled : If the request was refused with a throttling response
+
   """
 
   log = logging.getLogger( __name__ )
+  if buf is None: buf = bytearray( BUFSIZE )
   try:
-    resp = obj.get( Range = 'bytes={}-{}'.format( *offsets ) )              # Get response for given range
+    start, end = offsets
+    if end is None: end = ''                                                # Open ended range; read to end of object
+    t0   = time.monotonic()
+    resp = obj.get( Range = f'bytes={start}-{end}' )                        # Get response for given range
+    if timing is not None: timing.setdefault( 'ttfb', time.monotonic() - t0 ) # First response of concurrent requests wins
     size = resp['ContentLength']                                            # Size of chunk to download
-    data = resp['Body'].read()                                              # Actually read the data
+    nRead, nWrite = writeStream( resp['Body'], fid, buf, pieces, limiter )  # Stream the data to the file
   except Exception as err:
     log.debug( err )
+    if isThrottle( err ): raise Throttled( str(err) ) from err
     return 0
   finally:
     resp = None
 
-  if len(data) == size:
-    fid.write( data )                                                       # Write data to the file 
-    return size
-
-  return 0 
+  if nRead != size:
+    return 0
+  return nWrite
 
-def downloadFile( obj, fid ):
+def downloadFile( obj, fid, buf = None, offset = 0, etag = None, etagFile = None, timing = None, limiter = None ):
   """
   Download all data from AWS object to file-like object
 
@@ -62,48 +229,258 @@ def downloadFile( obj, fid ):
     obj (s3.Object) : An AWS boto3 object to download
     fid (file-like) : Full local file path to download data to
 
+  Keyword arguments:
+    buf (bytearray) : Reusable buffer to stream data through. If None,
+      a buffer of BUFSIZE bytes is allocated
+    offset (int) : Byte to start downloading from; used to resume a
+      partial download. The data are appended to fid
+    etag (str) : ETag the object must still have when resuming
+    etagFile (str) : If set, the ETag of the object is written to this
+      file before any data are, so that an interrupted download can be
+      resumed later
+    timing (dict) : If given, 'ttfb' is set to the time, in seconds, from
+      sending the request to receiving its response headers
+    limiter (RateLimiter) : Limit on bytes per second over all transfers
+
   Returns:
     int : Size of data downloaded. If size is 0, then download failed
 
+  Raises:
+    Throttled : If the request was refused with a throttling response
+
   """
 
-  log = logging.getLogger( __name__ )
+  log    = logging.getLogger( __name__ )
+  kwargs = {}
+  if buf is None: buf = bytearray( BUFSIZE )
+  if offset > 0:                                                            # If resuming, only get rest of the object, and only if it hasn't changed
+    kwargs['Range'] = f'bytes={offset}-'
+    if etag: kwargs['IfMatch'] = etag
   try:                                                                      # Try to
-    size = obj.content_length
-    obj.download_fileobj( fid )
+    t0   = time.monotonic()
+    resp = obj.get( **kwargs )
+    if timing is not None: timing.setdefault( 'ttfb', time.monotonic() - t0 )
+    size = resp['ContentLength']
+    if etagFile:                                                            # Record ETag of object the data come from
+      with open( etagFile, 'w' ) as etagFID:
+        etagFID.write( resp['ETag'] )
+    nRead, nWrite = writeStream( resp['Body'], fid, buf, limiter = limiter )# Stream the data to the file
   except Exception as err:
     log.debug( err )
+    if isThrottle( err ): raise Throttled( str(err) ) from err
     return 0 
-  else:
-    fid.seek(0, 2)                                                              # Ensure we are at end of file; AWS does some weird things with threaded downloading that messes up file position?
+  finally:
+    resp = None
 
-  if fid.tell() == size:
+  if nWrite == size and fid.tell() == offset + size:
     return size
 
   return 0
- 
-def download( obj, fpath, offsets = None ):
+
+def partPaths( fpath ):
+  """
+  Paths of the partial download and its ETag for a local file
+
+  Partial files are hidden files in the same directory as the final
+  file, so that the final rename is atomic (same filesystem).
+
+  Arguments:
+    fpath (str) : Full local file path
+
+  Returns:
+    tuple : Path to partial data, path to file holding ETag of the
+      object the partial data came from
+
+  """
+
+  dirname, basename = os.path.split( fpath )
+  part = os.path.join( dirname, f'.{basename}.part' )
+  return part, f'{part}.etag'
+
+def resumeOffset( obj, part, etagFile ):
+  """
+  Determine where to resume a partial download from
+
+  The partial data are only used if the ETag recorded when they were
+  started matches the ETag of the remote object, and there are no more
+  of them than the object holds.
+
+  Arguments:
+    obj (s3.Object) : An AWS boto3 object to download
+    part (str) : Path to partial download
+    etagFile (str) : Path to ETag of object partial data came from
+
+  Returns:
+    tuple : Offset to resume from and object ETag; offset is zero if
+      download must start from beginning
+
+  Raises:
+    Throttled : If the metadata request was refused with a throttling
+      response
+    Exception : If the object's metadata could not be requested; the
+      caller must then keep the partial data for the next attempt
+
+  """
+
+  log = logging.getLogger( __name__ )
+  try:
+    offset = os.path.getsize( part )
+    with open( etagFile, 'r' ) as fid:
+      etag = fid.read().strip()
+  except:                                                                   # No partial data, or no ETag for it
+    return 0, None
+
+  try:
+    changed = obj.e_tag != etag or offset > obj.content_length              # Object changed, or partial is too big
+  except Exception as err:
+    if isThrottle( err ): raise Throttled( str(err) ) from err
+    raise
+
+  if changed:                                                               # Start over
+    log.debug( f'Remote object changed; restarting download : {part}' )
+    return 0, None
+
+  return offset, etag
+
+def download( obj, fpath, offsets = None, maxGap = MAX_GAP, rangeJobs = RANGE_JOBS, buf = None, timing = None, limiter = None ):
   """
   Download data from AWS to local file
 
+  Data are written to a hidden partial file next to fpath that is
+  renamed to fpath only once the download is complete, so fpath never
+  holds truncated data. When downloading a whole object, data left in
+  the partial file by an interrupted download are kept and the
+  download resumes from the end of them with a Range request, as long
+  as the object's ETag has not changed.
+
+  Data are streamed to the file through buf, so memory use per transfer
+  is bounded by the buffer size (times the number of concurrent range
+  requests when downloading byte ranges).
+
   Arguments:
     obj (s3.Object) : An AWS boto3 object to download
     fpath (str) : Full local file path to download data to
 
   Keyword arguments:
-    offsets (iter) : 
+    offsets (iter) : (start, end) byte ranges to download; the data
+      are written to fpath back-to-back. If None, download whole object
+    maxGap (int) : Merge ranges separated by no more than this many
+      bytes into one request. See planRanges
+    rangeJobs (int) : Maximum number of range requests to run
+      concurrently for a single file
+    buf (bytearray) : Reusable buffer to stream data through. If None,
+      a buffer of BUFSIZE bytes is allocated
+    timing (dict) : If given, 'ttfb' is set to the time, in seconds, from
+      sending the first request to receiving its response headers
+    limiter (RateLimiter) : Limit on bytes per second over all transfers
+
+  Returns:
+    int : Size of data downloaded. If size is 0, then download failed
+
+  Raises:
+    Throttled : If a request was refused with a throttling response
 
   """
 
-  with open( fpath, 'wb' ) as fid:                                            # Open local file for writing
-    if offsets is None:
-      return downloadFile( obj, fid )
+  log = logging.getLogger( __name__ )
+  if buf is None: buf = bytearray( BUFSIZE )
+  part, etagFile = partPaths( fpath )
+
+  if offsets is None:
+    try:
+      offset, etag = resumeOffset( obj, part, etagFile )
+    except Throttled:
+      raise
+    except Exception as err:                                                  # Could not check partial against object; keep it for the next attempt
+      log.debug( err )
+      return 0
+    size         = 0
+    try:
+      if offset == 0:                                                         # Starting from scratch; ETag recorded from the response
+        with open( part, 'wb' ) as fid:
+          size = downloadFile( obj, fid, buf, etagFile = etagFile, timing = timing, limiter = limiter )
+      elif offset == obj.content_length:                                      # Partial is complete; just needs renaming
+        size = offset
+      else:
+        log.debug( f'Resuming download at byte {offset} : {fpath}' )
+        with open( part, 'ab' ) as fid:
+          if downloadFile( obj, fid, buf, offset, etag, timing = timing, limiter = limiter ) > 0:
+            size = fid.tell()
+    finally:
+      if size > 0:
+        os.replace( part, fpath )                                             # Atomically move complete file into place
+        with suppress( FileNotFoundError ):                                   # No ETag recorded; e.g., partial was already complete
+          os.remove( etagFile )
+      elif os.path.exists( part ) and os.path.getsize( part ) == 0:           # Nothing to resume from, so clean up; part may not exist if it could not be opened
+        os.remove( part )
+    return size
+
+  size = 0
+  try:
+    with open( part, 'wb' ) as fid:                                           # Byte ranges cannot be resumed; always start from scratch
+      size = downloadRanges( obj, fid, offsets, maxGap, rangeJobs, buf, timing, limiter )
+  finally:
+    if size > 0:
+      os.replace( part, fpath )                                               # Atomically move complete file into place
     else:
-      totSize = 0 
-      for offset in offsets:                                                              # Iterate over ranges
-        size = downloadChunk( obj, fid, offset )
-        if size > 0:
-          totSize += size
-        else:
-          return 0
-      return totSize 
+      with suppress( FileNotFoundError ):                                     # part may not exist if it could not be opened
+        os.remove( part )
+  return size
+
+def downloadRanges( obj, fid, offsets, maxGap = MAX_GAP, rangeJobs = RANGE_JOBS, buf = None, timing = None, limiter = None ):
+  """
+  Download byte ranges from AWS object to file-like object
+
+  Arguments:
+    obj (s3.Object) : An AWS boto3 object to download
+    fid (file-like) : Open file object to write data to
+    offsets (iter) : (start, end) byte ranges to download; the data
+      are written to fid back-to-back
+
+  Keyword arguments:
+    maxGap (int) : Merge ranges separated by no more than this many
+      bytes into one request. See planRanges
+    rangeJobs (int) : Maximum number of range requests to run
+      concurrently
+    buf (bytearray) : Reusable buffer to stream data through. If None,
+      a buffer of BUFSIZE bytes is allocated
+    timing (dict) : If given, 'ttfb' is set to the time, in seconds, from
+      sending the first request to receiving its response headers
+    limiter (RateLimiter) : Limit on bytes per second over all transfers
+
+  Returns:
+    int : Size of data downloaded. If size is 0, then download failed
+
+  Raises:
+    Throttled : If a request was refused with a throttling response
+
+  """
+
+  if buf is None: buf = bytearray( BUFSIZE )
+  requests = planRanges( offsets, maxGap )                                    # Merge ranges into fewer requests
+  if len(requests) == 1 or rangeJobs < 2:                                     # If only one request, or not running concurrently
+    totSize = 0 
+    for rng, pieces in requests:                                              # Iterate over requests
+      size = downloadChunk( obj, fid, rng, pieces, buf, timing, limiter )
+      if size == 0:
+        return 0
+      totSize += size
+    return totSize 
+
+  nJobs   = min(rangeJobs, len(requests))
+  buffers = Queue()                                                           # One buffer per concurrent request, allocated once per file
+  buffers.put( buf )
+  for i in range( nJobs-1 ): buffers.put( bytearray( len(buf) ) )
+
+  def fetch( req ):
+    chunkBuf = buffers.get()
+    try:
+      return downloadChunk( obj, fid, *req, chunkBuf, timing, limiter )
+    finally:
+      buffers.put( chunkBuf )
+
+  with ThreadPoolExecutor( nJobs ) as pool:                                   # Fetch ranges concurrently; each chunk is written to its final position
+    sizes = list( pool.map( fetch, requests ) )
+  if 0 in sizes:
+    return 0
+  return sum( sizes )
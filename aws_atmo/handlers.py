@@ -1,46 +1,295 @@
 import logging
+import sys, time
+from collections import deque
+from logging.handlers import QueueHandler
+from queue import Queue as ThreadQueue, Empty
 from subprocess import Popen, PIPE, STDOUT
+from threading import Thread
+
+from . import LOG, logFormatter
+
+LOG_BATCH    = 256                                                              # Most records a worker ships to the parent at once
+LOG_INTERVAL = 1.0                                                              # Most seconds a record waits in a worker before it is shipped
+
+###############################################################################
+def sendMail( subject, body, toemails, attachments = (), command = 'mail' ):
+  """
+  Send an email with the mail utility
+
+  If mail fails with attachments, as some versions don't accept -a, the
+  message is sent again without them.
+
+  Arguments:
+    subject (str) : Subject of the email
+    body (str) : Body of the email
+    toemails (list) : Addresses to send to
+
+  Keyword arguments:
+    attachments (list) : Files to attach
+    command (str) : mail command to run; e.g., a local stand-in
+
+  Returns:
+    bool : True if the email was sent
+
+  """
+
+  base = [command, '-s', subject]
+  cmds = [base + [arg for path in attachments for arg in ('-a', path)]] if attachments else []
+  for cmd in cmds + [base]:
+    try:
+      proc = Popen( cmd + list(toemails), stdin=PIPE, stdout=PIPE, stderr=STDOUT )
+      proc.communicate( body.encode() )                                         # Body is piped in on stdin
+    except OSError:
+      return False                                                              # Command not found; no point retrying without attachments
+    if proc.returncode == 0: return True
+  return False
 
-from . import LOG 
 ###############################################################################
 class EMailHandler( logging.Handler ):
-  def __init__(self, toemails, subject, *args, **kwargs):
-    super().__init__(*args, **kwargs);                                              # Initialize base class
-    if not isinstance(toemails, (list)): toemails = [toemails];                     # Convert toemails variable to list
-    self.toemails = toemails;                                                       # Set toemails class attribute
-    self.subject  = subject;                                                        # Set subject class attribute
-  ##################################
-  def emit(self, record):                                                           # Overload the emit method                        
-    logFiles = [];                                                                  # List for any log files attached to logger
-    for handler in LOG.handlers:                                          # Iterate over all handlers in the DCOTSS_py.log
-        if isinstance(handler, logging.FileHandler):                                # If the logger is a FileHandler
-            handler.flush();                                                        # Flush all logs to file
-            handler.close();                                                        # Close the file
-            logFiles.append( handler.baseFilename );                                # Append the log file path to the logFiles list
-            LOG.removeHandler( handler );                                 # Remove the handler from the logger
-
-    body   = ['echo', record.getMessage()];                                         # Command for piping body of email into the mail utitlity
-    mail1  = ['mail', '-s', '{} - {}'.format(record.levelname, self.subject)];      # Base mail command; NO attachements; this is fall back
-    mail2  = mail1.copy();                                                          # Copy the mail1 command list into mail2 variable
-    for f in logFiles: mail2 += ['-a', f];                                          # Iterate over all log files and add as attachments to mail2 command
-
-    mail1 += self.toemails;                                                         # Add emails to mail1 command
-    mail2 += self.toemails;                                                         # Add emails to mail2 command
-
-    proc1  = Popen(body,  stdout=PIPE, stderr=STDOUT);                              # Run body command and send stdout and stderr to PIPE
-    proc2  = Popen(mail2, stdin=proc1.stdout, stdout=PIPE, stderr=STDOUT);          # Run mail2 command with PIPE from body as input
-    proc1.stdout.close();                                                           # Close the PIPE from body command
-    proc2.communicate();                                                            # Wait for mail command to finish
-    if (proc2.returncode != 0):                                                     # If return code from mail is NOT 0, then probably does NOT accept the attachments
-        proc1  = Popen(body,  stdout=PIPE, stderr=STDOUT);                          # Run body command again
-        proc2  = Popen(mail1, stdin=proc1.stdout, stdout=PIPE, stderr=STDOUT);      # Run mail1 command
-        proc1.stdout.close();                                                       # Close the PIPE from body command
-        proc2.communicate();                                                        # Wait for mail command to finish
- 
+  """
+  Email digests of log records
+
+  emit() only queues the record, so logging is never held up by mail.
+  A background thread collects records and, interval seconds after the
+  first arrives, sends them all as one digest, with the files of the
+  package's FileHandlers attached. No more than maxPerHour digests are
+  sent in any hour; records arriving while the limit is reached are
+  held for the next digest. Anything still queued is sent on close().
+
+  """
+
+  MAX_RECORDS = 500                                                             # Most records written out in one digest; the rest are counted
+
+  def __init__(self, toemails, subject, level = logging.NOTSET, interval = 300.0, maxPerHour = 6,
+               mailer = sendMail, attachLogs = True):
+    """
+    Arguments:
+      toemails (str, list) : Address(es) to send to
+      subject (str) : Subject of the emails; the highest level name and
+        number of records in the digest are added
+
+    Keyword arguments:
+      level (int) : Level of the handler
+      interval (float) : Seconds to collect records for before sending
+      maxPerHour (int) : Most digests to send per hour
+      mailer (callable) : Sends a digest; called as
+        mailer(subject, body, toemails, attachments) and returns True
+        if sent. Default is sendMail
+      attachLogs (bool) : Attach files of FileHandlers on the package
+        logger
+
+    """
+
+    super().__init__( level )
+    if not isinstance(toemails, (list, tuple)): toemails = [toemails]          # Convert toemails variable to list
+    self.toemails   = list( toemails )
+    self.subject    = subject
+    self.interval   = interval
+    self.maxPerHour = maxPerHour
+    self.mailer     = mailer
+    self.attachLogs = attachLogs
+    self.sent       = deque()                                                   # Times of digests sent in the last hour
+    self.failed     = 0                                                         # Digests that could not be sent
+    self._queue     = ThreadQueue()
+    self._thread    = Thread( target = self._run, daemon = True )
+    self._thread.start()
+
+  def emit(self, record):
+
+    try:
+      self._queue.put( (record.levelno, record.levelname, self.format( record )) )
+    except Exception:
+      self.handleError( record )
+
+  def format(self, record):
+
+    return (self.formatter or logFormatter).format( record )
+
+  def _nextSend(self, first):
+    """Time a digest whose first record arrived at first may be sent"""
+
+    now = time.monotonic()
+    while self.sent and now - self.sent[0] >= 3600.0:                           # Forget sends more than an hour ago
+      self.sent.popleft()
+    when = first + self.interval
+    if len(self.sent) >= self.maxPerHour:                                       # Limit reached; wait until oldest send is an hour old
+      when = max( when, self.sent[0] + 3600.0 )
+    return when
+
+  def _run(self):
+    """Collect records and send digests until None received"""
+
+    records = []
+    first   = None
+    while True:
+      timeout = None if first is None else max( self._nextSend( first ) - time.monotonic(), 0.0 )
+      try:
+        item = self._queue.get( timeout = timeout )
+      except Empty:
+        self._send( records )                                                   # Digest is due
+        records, first = [], None
+        continue
+      if item is None: break
+      records.append( item )
+      if first is None: first = time.monotonic()
+    self._send( records )                                                       # Send whatever is left on close
+
+  def _send(self, records):
+    """Send records as one digest"""
+
+    if not records: return
+    attachments = []
+    if self.attachLogs:
+      for handler in LOG.handlers:                                              # Log files are flushed, but left open, so they can be attached
+        if isinstance(handler, logging.FileHandler):
+          handler.flush()
+          attachments.append( handler.baseFilename )
+
+    top     = max( records )                                                    # Highest level record
+    body    = [text for _, _, text in records[:self.MAX_RECORDS]]
+    if len(records) > self.MAX_RECORDS:
+      body.append( f'... and {len(records) - self.MAX_RECORDS} more records' )
+    subject = f'{top[1]} - {self.subject} ({len(records)} records)'
+    self.sent.append( time.monotonic() )
+    try:
+      ok = self.mailer( subject, '\n'.join( body ) + '\n', self.toemails, attachments )
+    except Exception as err:
+      ok = err
+    if ok is not True:                                                          # Not logged, as that would queue another digest
+      self.failed += 1
+      sys.stderr.write( f'Failed to send log digest "{subject}" : {ok}\n' )
+
+  def close(self):
+    """Send any queued records and stop the background thread"""
+
+    if self._thread.is_alive():
+      self._queue.put( None )
+      self._thread.join()
+    super().close()
+
+###############################################################################
+def shipLevel( logger ):
+  """
+  Lowest level at which records of logger are handled anywhere
+
+  This is the level a worker process should log at : records below it
+  would be shipped to this process only to be dropped by every handler.
+
+  Arguments:
+    logger (Logger) : Logger the records are sent to
+
+  Returns:
+    int : Logging level
+
+  """
+
+  levels = []
+  node   = logger
+  while node:                                                                   # Walk up the handlers a record would be passed to
+    levels.extend( handler.level for handler in node.handlers )
+    if not node.propagate: break
+    node = node.parent
+  if not levels:                                                                # No handlers, so only logging's last resort handler
+    levels = [logging.lastResort.level if logging.lastResort else logging.CRITICAL + 1]
+  return max( logger.getEffectiveLevel(), min( levels ) )
+
 ###############################################################################
-def mpLogHandler( queue ):
-    while True:                                                                 # Iterate forever
-        record= queue.get();                                                      # Apparently just getting the message from the queue will log it
-        if (record is None): break                                                 # If the message is None, then break; this will kill the thread
-        logger = logging.getLogger( record.name )
-        logger.handle( record )
+class BatchQueueHandler( QueueHandler ):
+  """
+  QueueHandler that ships records in lists rather than one at a time
+
+  Records are buffered and put on the queue together once capacity are
+  buffered, the oldest has waited interval seconds, a record at or
+  above flushLevel arrives, or flush() is called. One pickle and pipe
+  write then covers many records.
+
+  """
+
+  def __init__(self, queue, capacity = LOG_BATCH, interval = LOG_INTERVAL, flushLevel = logging.WARNING):
+    """
+    Arguments:
+      queue (Queue) : Queue to put lists of records on
+
+    Keyword arguments:
+      capacity (int) : Most records to buffer
+      interval (float) : Most seconds to buffer a record
+      flushLevel (int) : Records at or above this level are shipped,
+        with those buffered, straight away
+
+    """
+
+    super().__init__( queue )
+    self.capacity   = capacity
+    self.interval   = interval
+    self.flushLevel = flushLevel
+    self.buffer     = []
+    self._oldest    = None                                                      # Time first record in buffer arrived
+
+  def emit(self, record):
+
+    try:
+      self.buffer.append( self.prepare( record ) )                              # Formats message; args and traceback may not pickle
+    except Exception:
+      self.handleError( record )
+      return
+    now = time.monotonic()
+    if self._oldest is None: self._oldest = now
+    if (len(self.buffer) >= self.capacity or record.levelno >= self.flushLevel or
+        now - self._oldest >= self.interval):
+      self._ship()
+
+  def _ship(self):
+    """Put buffered records on the queue; lock must be held"""
+
+    records, self.buffer, self._oldest = self.buffer, [], None
+    if records:
+      try:
+        self.enqueue( records )
+      except Exception:
+        self.handleError( records[-1] )
+
+  def flush(self):
+    """Ship all buffered records now"""
+
+    self.acquire()
+    try:
+      self._ship()
+    finally:
+      self.release()
+
+  def close(self):
+
+    self.flush()
+    super().close()
+
+###############################################################################
+def mpLogHandler( queue, batch = LOG_BATCH ):
+  """
+  Handle records from other processes until None is received
+
+  Items on the queue are records or lists of records. After each
+  blocking get, up to batch items already waiting are taken too, so a
+  busy queue is drained in few wake-ups.
+
+  Arguments:
+    queue (Queue) : Queue the records are put on
+
+  Keyword arguments:
+    batch (int) : Most items to take per wake-up
+
+  """
+
+  stop = False
+  while not stop:
+    items = [queue.get()]
+    while len(items) < batch:
+      try:
+        items.append( queue.get_nowait() )
+      except Empty:
+        break
+    for item in items:
+      if item is None:                                                          # None is put on the queue to stop the thread
+        stop = True
+        continue
+      for record in (item if isinstance(item, list) else [item]):
+        logging.getLogger( record.name ).handle( record )
@@ -3,15 +3,42 @@ import signal
 import os, shutil, glob, time
 from datetime import datetime, timedelta
 
-import boto3
-import boto3.session
-
 from . import NCPU
 from .pathUtils.nexrad import nexrad_level2_directory
 
-from .downloader import AWS_Scheduler, TIMEOUT
+from .downloader import AWS_Scheduler, WorkItem
+from .daemon import submit, SOCKET
 
 _dateFMT   = "%Y%m%d_%H%M%S"                                                   # Time format in NEXRAD files
+KEY_BATCH   = 1000                                                              # Most listed keys parsed at once; one page of a listing
+DAY_LISTING = 60                                                                # List whole days when more stations than this are requested; a day of ~200 stations at ~300 volumes each is ~60 pages of 1000 keys, and each station-day is one page
+
+###############################################################################
+def _keyWindow( prefix, start, end, date0, date1 ):
+  """
+  Keys bounding the files of a station-day that are in a time window
+
+  Level 2 keys are <prefix>/KXXXYYYYMMDD_HHMMSS<suffix>, so they sort by
+  time. Listing can start after the key for the window start and stop
+  after the key for the window end instead of reading the whole day.
+
+  Arguments:
+    prefix (str) : Station-day prefix; e.g., 2011/02/28/KHGX
+    start (datetime) : Start of the day
+    end (datetime) : End of the day
+    date0 (datetime) : Start of the window
+    date1 (datetime) : End of the window
+
+  Returns:
+    tuple : startAfter and stopAfter keys; None where the window covers
+      that end of the day
+
+  """
+
+  base       = f'{prefix}/{prefix[-4:]}'
+  startAfter = None if date0 <= start else base + date0.strftime(_dateFMT)          # Every suffix sorts after the bare time, so a file at date0 is kept
+  stopAfter  = None if date1 >= end   else base + date1.strftime(_dateFMT) + '~'    # '~' sorts after any character of a suffix, so a file at date1 is kept
+  return startAfter, stopAfter
 
 ###############################################################################
 class NEXRAD_AWS_Scheduler( AWS_Scheduler ):
@@ -31,7 +58,8 @@ class NEXRAD_AWS_Scheduler( AWS_Scheduler ):
           outroot     = '/traid1/NEXRAD/level2/',
           no_MDM      = True,
           no_tar      = True,
-          verbose     = False):
+          verbose     = False,
+          listing     = 'auto'):
     """
     Name:
         download
@@ -61,7 +89,16 @@ class NEXRAD_AWS_Scheduler( AWS_Scheduler ):
         clobber    : Set to True to re download files that exist.
         maxAttempt : Maximum number of times to try to download
                         file. DEFAULT: 3
-        concurrency: Number of concurrent downloads to allow
+        concurrency: Number of concurrent downloads to allow, or
+                        'auto' to adjust it at runtime from measured
+                        throughput and failed attempts
+        listing    : How to list the bucket; 'station' lists each
+                        station-day prefix, concurrently, while 'day'
+                        lists each day and keeps requested stations.
+                        'auto' uses 'day' if more than DAY_LISTING
+                        stations are requested. Station listings
+                        of part of a day only read keys in the window
+                        DEFAULT: 'auto'
     Outputs:
         Returns output directory for data files, # successful downloads,
         # failed downloads, and total size of all downloaded files.
@@ -81,47 +118,55 @@ class NEXRAD_AWS_Scheduler( AWS_Scheduler ):
       self.log.info( '   Deleting existing output directory and its contents' )
       shutil.rmtree( self.outdir )
     if not os.path.isdir( self.outdir ): os.makedirs( self.outdir )
+    self.openMetadata( outroot )                                                        # Record of files already downloaded below outroot
 
     date  = datetime(date0.year, date0.month, date0.day, 0)                             # Create date for current date with hour at 0
     if (date1 is None):                                                                 # If date1 is None
       date1 = date + timedelta(days=1)                                                  # Set date1 to one day after date
 
-    queueIndex = 0                                                                     # Index for which queue to put files in
-    while (date1 > date) and (not self.kilEvent.is_set()):                             # While the end date is greater than date
+    if listing == 'auto':                                                               # One listing per day if that needs fewer LIST pages than one per station-day
+      listing = 'day' if len(station) > DAY_LISTING else 'station'
+    self.log.info( '   Listing by       : {}'.format(listing) )
+    prefixes   = []                                                                     # (prefix, end[, startAfter, stopAfter]) to list; listings of days in the past are cached
+    stationDir = {}                                                                     # Output directory by date prefix and station
+    while (date1 > date):                                                               # While the end date is greater than date
       stationdir, self.outdir, _ = nexrad_level2_directory(date, station, root=outroot)
-
       datePrefix = date.strftime('%Y/%m/%d/')                                           # Set date prefix for key filtering of bucket
+      stationDir[datePrefix] = dict( zip(station, stationdir) )
+      for sdir in stationdir:                                                           # Iterate over all stations in the station list
+        if not os.path.isdir( sdir ): os.makedirs( sdir )                               # If the output diretory does NOT exist, create it
+      end = date + timedelta(days=1)                                                    # End of data below the date prefix
+      if listing == 'day':
+        prefixes.append( (datePrefix, end) )
+      else:
+        for stat in station:
+          prefixes.append( (datePrefix + stat, end) + _keyWindow(datePrefix + stat, date, end, date0, date1) )
+      date += timedelta(days = 1)                                                       # Increment date by one (1) day
+
+    import numpy                                                                        # Imported here so that importing the module stays fast
+    from .downloader.keyColumns import KeyColumns, epoch, fromEpoch
+
+    t0, t1   = epoch( date0 ), epoch( date1 )
+    stations = numpy.asarray( station, dtype = str )
+    for batch in self.listMany( prefixes, batch = KEY_BATCH ):                         # Objects arrive as each page of each listing does
+      cols = KeyColumns( [statKey for _, statKey in batch] )                            # Parse the whole batch of keys at once
+      cols.parseTime()
+      keep = (cols.time >= t0) & (cols.time <= t1)                                      # Date/time of the file is within the date0 -- date1 range
+      keep &= numpy.isin( cols.station, stations )                                      # Requested stations only; day listings hold every station
+      if no_MDM: keep &= ~cols.endswith('MDM')                                          # If the no_MDM keyword is set, skip files ending in MDM
+      if no_tar: keep &= ~cols.endswith('tar')                                          # If the no_tar keyword is set, skip files ending in tar
+      for i, statKey in cols.select( keep ):
+        prefix = batch[i][0]
+        fBase  = statKey.key.split('/')[-1]                                             # Get the base name of the file
+        fDate  = fromEpoch( cols.time[i] )
+        self.log.debug( f'File : {statKey.key}; date : {fDate }' )
+        localFile = os.path.join(stationDir[prefix[:11]][fBase[:4]], fBase)             # Create local file path
+        info = WorkItem(fBase[:4], statKey.key, localFile,
+                        size = statKey.size, etag = statKey.e_tag, time = fDate)        # Listing gives size and ETag, so unchanged files are skipped without a request
+        if not self._enqueue( info ): break                                             # If the killEvent is set, stop listing; we don't want to put anything else into the queue
+      if self.killEvent.is_set(): break
 
-      for i in range( len(stationdir) ):                                                # Iterate over all stations in the station list
-        if not os.path.isdir( stationdir[i] ): os.makedirs( stationdir[i] )             # If the output diretory does NOT exist, create it
-        info       = []
-        statPrefix = datePrefix + station[i]                                            # Create station prefix for bucket filter using datePrefix and the station ID
-        statKeys   = self.bucket.objects.filter( Prefix = statPrefix )                  # Apply filter to bucket objects
-        for statKey in statKeys:                                                        # Iterate over all the objects in the filter
-          fBase = statKey.key.split('/')[-1]                                            # Get the base name of the file
-          if (no_MDM and fBase.endswith('MDM')): continue                               # If the no_MDM keyword is set and the file ends in MDM, then skip it
-          if (no_tar and fBase.endswith('tar')): continue                               # If the no_tar keyword is set and the file ends in tar, then skip it
-          fDate = datetime.strptime(fBase[4:19], _dateFMT)                              # Create datetime object for file using information in file name
-          if (fDate >= date0) and (fDate <= date1):                                     # If the date/time of the file is within the date0 -- date1 range
-            self.log.debug( f'File : {statKey.key}; date : {fDate }' )
-            localFile = os.path.join(stationdir[i], fBase)                              # Create local file path
-            info = (station[i], statKey.key, localFile, None)                           # Order is ( label for download stats, statKey for S3 object, local file to download to, offsets into file if downloading chunks )
- 
-            while not self.killEvent.is_set():                                          # If the killEvent is set, then return from method; we don't want to put anything else into the queue
-              try:
-                self.fileQueue.put( info, True, TIMEOUT )
-              except Exception as err:
-                self.log.error( err )
-                pass
-              else:
-                break
-
-        if self.killEvent.is_set():                                                     # If the killEvent is set, then return from method; we don't want to put anything else into the queue
-          date = date1
-          break
-      date += timedelta(days = 1)                                                # Increment date by one (1) day
-
-    return self._wait()
+    return self.wait()
 
 ###############################################################################
 def level2(
@@ -136,7 +181,18 @@ def level2(
         clobber     = False,
         maxAttempt  = 3,
         verbose     = False,
-        concurrency = NCPU):
+        concurrency = NCPU,
+        engine      = 'process',
+        threads     = 1,
+        listCache   = True,
+        order       = None,
+        fairShare   = False,
+        labelCaps   = None,
+        listing     = 'auto',
+        progress    = None,
+        metricsFile = None,
+        rateLimit   = None,
+        daemon      = None):
   """
   Name:
       nexrad_aws_level2_download
@@ -152,7 +208,8 @@ def level2(
                           DEFAULT: End of date0 day.
       station    : Scalar string or list of strings containing 
                       radar station IDs in the for KXXX
-      resource   : AWS resource to download from. Default is s3
+      resource   : AWS resource to download from, or a Backend
+                      (e.g., LocalBackend) to use instead. Default is s3
       bucketName : Name of the bucket to download data from.
                       DEFAULT: noaa-nexrad_level2
       outroot    : Top level output directory for downloaded files.
@@ -166,22 +223,69 @@ def level2(
       clobber    : Set to True to re download files that exist.
       maxAttempt : Maximum number of times to try to download
                       file. DEFAULT: 3
-      concurrency: Number of concurrent downloads to allow
+      concurrency: Number of concurrent downloads to allow, or
+                      'auto' to adjust it at runtime from measured
+                      throughput and failed attempts
+      engine     : Download engine to use; 'process' or 'async'.
+                      With 'async', concurrency may be set in the
+                      hundreds. DEFAULT: 'process'
+      threads    : Number of download threads per process for the
+                      'process' engine; total concurrency is
+                      concurrency * threads. DEFAULT: 1
+      listCache  : Cache bucket listings on disk; listings of past
+                      days are reused on later runs. DEFAULT: True
+      order      : Order to download volumes in; e.g., 'latest' for
+                      newest volumes first or 'largest' for largest
+                      first. See downloader.ordering.ORDERS.
+                      DEFAULT: listing order
+      fairShare  : Set to True to download files for all stations at
+                      the same rate, rather than one station after
+                      another; may be dict of weights by station.
+                      DEFAULT: False
+      labelCaps  : Most files of any one station to have queued or
+                      downloading at once; may be dict of caps by
+                      station. DEFAULT: no cap
+      listing    : List the bucket by 'station'-day, by 'day', or
+                      'auto' to choose whichever needs fewer requests.
+                      DEFAULT: 'auto'
+      progress   : Log files done, rate, and ETA every this many
+                      seconds. DEFAULT: no progress lines
+      metricsFile: Prometheus text-format file (*.prom) to write
+                      progress to; e.g., for node_exporter's textfile
+                      collector. DEFAULT: None
+      rateLimit  : Most data to download per second over all
+                      processes; MB/s. DEFAULT: no limit
+      daemon     : Socket of a download daemon (see aws_atmo.daemon)
+                      to run the download on, or True for the default
+                      socket. All keywords must then be JSON
+                      serializable; e.g., resource can't be a Backend.
+                      DEFAULT: download from this process
   Author and History:
       Kyle R. Wodzicki     Created 2019-07-06
   """
   log = logging.getLogger( __name__ )
 
-  scheduler = NEXRAD_AWS_Scheduler( resource, bucketName, clobber, maxAttempt, concurrency ) 
+  options = dict( resource = resource, bucketName = bucketName, clobber = clobber,
+                  retries = maxAttempt, jobs = concurrency, engine = engine, threads = threads,
+                  listCache = listCache, order = order,
+                  fairShare = fairShare, labelCaps = labelCaps,
+                  progress = progress, metricsFile = metricsFile,
+                  rateLimit = rateLimit )
+  kwargs  = dict( date0       = date0,
+                  date1       = date1,
+                  station     = station,
+                  outroot     = outroot,
+                  no_MDM      = no_MDM,
+                  no_tar      = no_tar,
+                  verbose     = verbose,
+                  listing     = listing )
 
-  outdir, nSuccess, nFail, size = scheduler.download( 
-      date0       = date0,
-      date1       = date1,
-      station     = station,
-      outroot     = outroot,
-      no_MDM      = no_MDM,
-      no_tar      = no_tar,
-      verbose     = verbose)
+  if daemon:                                                                    # Run on the download daemon rather than starting processes here
+    outdir, nSuccess, nFail, size, _ = submit( 'nexrad', options, kwargs, SOCKET if daemon is True else daemon )
+  else:
+    scheduler = NEXRAD_AWS_Scheduler( **options )
+    outdir, nSuccess, nFail, size = scheduler.download( **kwargs )
+    scheduler.close()
 
   filelist = glob.iglob( os.path.join(outdir,'**'), recursive=True )
   filelist = [f for f in filelist if os.path.isfile(f)]
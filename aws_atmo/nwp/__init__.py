@@ -1,10 +1,8 @@
 import logging
-import boto3
-import boto3.session
-import os, time, re
+import os, time
 from datetime import datetime, timedelta
 
-from ..downloader import AWS_Scheduler, TIMEOUT
+from ..downloader import AWS_Scheduler, WorkItem, TIMEOUT
 from ..downloader.utils import downloadBytes
 
 from .pathUtils import nwpPath
@@ -82,7 +80,9 @@ class NWP_AWS_Scheduler( AWS_Scheduler ):
         clobber    : Set to True to re download files that exist.
         retries : Maximum number of times to try to download
                         file. DEFAULT: 3
-        concurrency: Number of concurrent downloads to allow
+        concurrency: Number of concurrent downloads to allow, or
+                        'auto' to adjust it at runtime from measured
+                        throughput and failed attempts
         **kwargs : All extra keywords are passed to the formatter strings
           for directory and file paths
     Outputs:
@@ -90,6 +90,9 @@ class NWP_AWS_Scheduler( AWS_Scheduler ):
         # failed downloads, and total size of all downloaded files.
     """
 
+    import numpy                                                                    # Imported here so that importing the module stays fast
+    from ..downloader.keyColumns import KeyColumns
+
     super().download()
 
     utcnow = datetime.utcnow()                                                      # Get current UTC time
@@ -101,6 +104,7 @@ class NWP_AWS_Scheduler( AWS_Scheduler ):
         #date2 = datetime(date1.year, date1.month, date1.day+1, 0)                   # Set default end date to tomorrow's UTC day at 00z
 
     fcstTimes = list( range(0, fcstlen+fcststep, fcststep ) )
+    self.openMetadata( outroot )                                                    # Record of files already downloaded below outroot
     initDate = date1
 
     while date2 >= initDate:                                                        # While the end date is greater than date
@@ -114,29 +118,31 @@ class NWP_AWS_Scheduler( AWS_Scheduler ):
       outDir   = os.path.join( outroot, *localDir )
       if not os.path.isdir( outDir ): os.makedirs( outDir )                   # If output directory NOT exist, create it
 
-      objs = self.bucket.objects.filter( Prefix = prefix )                      # Filter to objects that match prefix
+      objs = self.listObjects( prefix, end = initDate + timedelta( hours = fcstlen ) ) # Filter to objects that match prefix; past forecast runs are cached
       if subset:                                                                # If the subset keyword is set
         self.log.debug( 'Finding all idx files')
-        objs = [obj for obj in objs if obj.key.endswith('.idx')]                # Filter objects to only those that end in .idx
+        objs  = list( objs )
+        gribs = {obj.key : obj for obj in objs if not obj.key.endswith('.idx')} # GRIB objects; their size and ETag tell if local subset is current
+        objs  = [obj for obj in objs if obj.key.endswith('.idx')]               # Filter objects to only those that end in .idx
           
-      for obj in objs:                                                          # Iterate over all objects for downloading
+      cols  = KeyColumns( objs )                                                # Parse forecast hours of all objects at once
+      cols.parseFHour()
+      for i, obj in cols.select( numpy.isin( cols.fHour, fcstTimes ) ):          # Objects with one forecast hour in their base name that is in the requested forecast times
         key     = obj.key                                                       # Get key for given object
         fBase   = key.split('/')[-1]                                            # Get file base name for given object
-        fHour   = re.findall( 'f(\d+)', fBase )                                 # Get forecast hour from base name
-        if len(fHour) != 1 or int(fHour[0]) not in fcstTimes: continue          # If no forecast hour found in base name OR the forecast hour is NOT in the requested forecast times; skip file
 
-        offsets = None                                                          # Set offsets to None by default
+        size, etag = obj.size, obj.e_tag                                        # Size and ETag of object to download
         if subset:                                                              # If subset is set
-          idx = downloadBytes( obj )                                            # Download the data for the given object; it's and IDX file
-          if idx:                                                               # If the data are valid
-            offsets, idx = parseIDX( idx, *subset )                             # Get offsets into the GRIB file and NEW idx data
-            fBase,   _   = os.path.splitext( fBase )                            # Get the file basename with NO extension; i.e., strip off .idx
-            key,     _   = os.path.splitext( key )                              # Get the key with NO file extension; i.e., strip off .idx
-          else:                                                                 # Else, log error and skip to next object
-            self.log.error( f'Failed to get IDX data : {key}' ) 
+          idxObj   = obj
+          fBase, _ = os.path.splitext( fBase )                                  # Get the file basename with NO extension; i.e., strip off .idx
+          key,   _ = os.path.splitext( key )                                    # Get the key with NO file extension; i.e., strip off .idx
+          if key not in gribs:
+            self.log.error( f'No GRIB file for IDX : {idxObj.key}' )
             continue
+          size = gribs[key].size
+          etag = '{}:{}'.format( gribs[key].e_tag, ':'.join(subset) )           # Local file is only current for same GRIB AND same subset
 
-        fHour = int(fHour[0])                                                   # Get the forecast hour
+        fHour = int(cols.fHour[i])                                              # Get the forecast hour
         if isinstance(outFileFMT, str):                                         # If out file format is set
           localFile = outFileFMT.format( model=model, initDate=initDate, fHour=fHour, **kwargs )# Build base name
           if fBase.endswith( '.idx' ) and not localFile.endswith('.idx'):
@@ -145,18 +151,21 @@ class NWP_AWS_Scheduler( AWS_Scheduler ):
           localFile = fBase                                                     # Use fBase as the local file name
 
         localFile = os.path.join( outDir, localFile )
+        info      = WorkItem( prefix, key, localFile, size = size, etag = etag,
+                              time = initDate, fHour = fHour )                  # Build work item to enqueue
+        if self._upToDate( info ): continue                                     # Skip before the idx file is downloaded
+
         if subset:                                                              # If subset set
+          idx = downloadBytes( self.backend.Object( idxObj.key ) )                                         # Download the data for the given object; it's and IDX file
+          if not idx:                                                           # If the data are NOT valid, log error and skip to next object
+            self.log.error( f'Failed to get IDX data : {idxObj.key}' ) 
+            continue
+          offsets, idx = parseIDX( idx, *subset )                               # Get offsets into the GRIB file and NEW idx data
+          info         = info._replace( offsets = offsets )
           with open( f'{localFile}.idx', 'w' ) as fid:                          # Open idx file for writing
             fid.write( os.linesep.join( idx ) )                                 # Write subset idx data to file
 
-        info = (prefix, key, localFile, offsets, )                              # Build info tuple of data to enqueue
-        while not self.killEvent.is_set():                                      # While kill event is NOT set, try to enqueue information
-          try:
-            self.fileQueue.put( info, True, TIMEOUT )
-          except Exception as err:
-            pass
-          else:
-            break
+        if not self._enqueue( info ): break
 
       if self.killEvent.is_set(): initDate = date2                              # If killEvent is set, set initDate to last date to download
       initDate += timedelta( hours = initstep )                                 # Increment date; if killEvent was set, then this incrementing will push initDate past date2
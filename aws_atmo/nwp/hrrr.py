@@ -3,6 +3,8 @@ import logging
 from . import NWP_AWS_Scheduler, TIMEOUT
 from .pathUtils import nwpPath
 from . import HRRR_DEFAULTS
+from ..downloader.utils import MAX_GAP
+from ..daemon import submit, SOCKET
 
 
 def hrrr( outroot,
@@ -21,7 +23,18 @@ def hrrr( outroot,
         resource    = 's3',
         bucketName  = 'noaa-hrrr-bdp-pds',
         clobber     = False,
-        jobs        = 4):
+        jobs        = 4,
+        engine      = 'process',
+        threads     = 1,
+        maxGap      = MAX_GAP,
+        listCache   = True,
+        order       = None,
+        fairShare   = False,
+        labelCaps   = None,
+        progress    = None,
+        metricsFile = None,
+        rateLimit   = None,
+        daemon      = None):
 
     """
     Function for downloading NEXRAD Level 2 data from AWS.
@@ -52,7 +65,29 @@ def hrrr( outroot,
                         file. DEFAULT: 3
         bucketName (str) : Name of the AWS s3 bucket to download data
                         from. DEFAULT: 'noaa-nexrad-level2'
-        jobs (int) : Number of concurrent downloads to allow
+        jobs (int) : Number of concurrent downloads to allow, or 'auto' to
+                        adjust it at runtime from measured throughput and failed attempts
+        engine (str) : Download engine to use; 'process' or 'async'.
+                        With 'async', jobs may be set in the hundreds
+        threads (int) : Number of download threads per process for the
+                        'process' engine; total concurrency is jobs * threads
+        maxGap (int) : When subsetting, merge byte ranges separated by no
+                        more than this many bytes into one request
+        listCache (bool) : Cache bucket listings on disk; listings of past
+                        forecast runs are reused on later runs
+        order (str) : Order to download files in; e.g., 'analysis' for analysis
+                        and early forecast hours first, 'latest' for newest run
+                        first. See downloader.ordering.ORDERS. Default is listing order
+        fairShare (bool, dict) : Download files for all model runs at the same rate,
+                        rather than one run after another; may be dict of weights by prefix
+        labelCaps (int, dict) : Most files of any one model run to have queued or
+                        downloading at once; may be dict of caps by prefix
+        progress (float) : Log files done, rate, and ETA every this many seconds
+        metricsFile (str) : Prometheus text-format file (*.prom) to write progress to
+        rateLimit (float) : Most data to download per second over all jobs; MB/s
+        daemon (str, bool) : Socket of a download daemon (see aws_atmo.daemon) to
+                        run the download on, or True for the default socket. All
+                        keywords must then be JSON serializable
 
     Author and History:
         Kyle R. Wodzicki     Created 2019-07-06
@@ -61,7 +96,12 @@ def hrrr( outroot,
 
     log = logging.getLogger(__name__)
 
-    scheduler = NWP_AWS_Scheduler( resource, bucketName, clobber, retries, jobs )
+    options = dict( resource = resource, bucketName = bucketName, clobber = clobber,
+                    retries = retries, jobs = jobs, engine = engine, threads = threads, maxGap = maxGap,
+                    listCache = listCache, order = order,
+                    fairShare = fairShare, labelCaps = labelCaps,
+                    progress = progress, metricsFile = metricsFile,
+                    rateLimit = rateLimit )
 
     if subhourly:
       pattern = 'wrfsubh'
@@ -72,15 +112,22 @@ def hrrr( outroot,
     elif vert_coord == 'surface':
       pattern = 'wrfsfc'
     
-    outdir, nSuccess, nFail, size = scheduler.download('hrrr', domain, pattern,
-        outPathFMT  = outPathFMT,
-        outFileFMT  = outFileFMT,
-        subset      = subset,
-        fcstlen     = fcstlen,
-        fcststep    = fcststep,
-        initstep    = initstep,
-        date1       = date1,
-        date2       = date2,
-        outroot     = outroot)
+    kwargs  = dict( model       = 'hrrr',
+                    domain      = domain,
+                    pattern     = pattern,
+                    outPathFMT  = outPathFMT,
+                    outFileFMT  = outFileFMT,
+                    subset      = subset,
+                    fcstlen     = fcstlen,
+                    fcststep    = fcststep,
+                    initstep    = initstep,
+                    date1       = date1,
+                    date2       = date2,
+                    outroot     = outroot )
 
-    scheduler.close()
+    if daemon:                                                                  # Run on the download daemon rather than starting processes here
+      submit( 'nwp', options, kwargs, SOCKET if daemon is True else daemon )
+    else:
+      scheduler = NWP_AWS_Scheduler( **options )
+      scheduler.download( **kwargs )
+      scheduler.close()
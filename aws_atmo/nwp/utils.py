@@ -11,7 +11,7 @@ def parseIDX( idxData, *args):
   found are returned.
 
   Arguments:
-    idxData (bytes,str) : Data from the idx file
+    idxData (bytes,bytearray,str) : Data from the idx file
     *args (str) : Any number of substrings to match records to
 
   Keyword arguments:
@@ -23,7 +23,7 @@ def parseIDX( idxData, *args):
   """
 
   log = logging.getLogger(__name__)
-  if isinstance(idxData, bytes): idxData = idxData.decode()                     # If the idxData in bytes, decode to string
+  if isinstance(idxData, (bytes, bytearray)): idxData = idxData.decode()        # If the idxData in bytes, decode to string
   pattern = "^.*(?:{}).*$".format( '|'.join( args ) )                           # Generate regex pattern to search for
   matches = re.findall( pattern, idxData, re.MULTILINE )                        # Search the idx data for the patterns
   if len(matches) > 0:                                                          # If at least one (1) match found
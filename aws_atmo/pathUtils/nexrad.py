@@ -2,10 +2,10 @@ import logging
 import os
 from datetime import datetime
 
-from .. import NEXRAD_STATION_IDS, CONFIG
+from .. import getStationIDList, getConfig
 
 ################################################################################
-def nexrad_level2_directory(date, station = NEXRAD_STATION_IDS, root = None):
+def nexrad_level2_directory(date, station = None, root = None):
   """
   Name:
       nexrad_level2_directory
@@ -34,8 +34,9 @@ def nexrad_level2_directory(date, station = NEXRAD_STATION_IDS, root = None):
   """
   log = logging.getLogger(__name__);
 
+  if (station is None): station = getStationIDList()['143']
   if (root is None):
-    for dir, dates in CONFIG['level2_archive'].items():
+    for dir, dates in getConfig()['level2_archive'].items():
       date0 = datetime.strptime( str(dates[0]), '%Y%m%d' )
       date1 = datetime.strptime( str(dates[1]), '%Y%m%d' )
       if (date >= date0) and (date <= date1):
@@ -61,8 +62,8 @@ def nexrad_level3_filepath(date,
         product = None,
         suffix  = '.nc'):
     
-    if (root    is None): root    = CONFIG['defaults']['nexrad_level3_directory']
-    if (version is None): version = CONFIG['version']['nexrad_level3_version']
+    if (root    is None): root    = getConfig()['defaults']['nexrad_level3_directory']
+    if (version is None): version = getConfig()['version']['nexrad_level3_version']
     if (product is None): product = '3d'
     yyyy           = date.strftime('%Y');                        #YYYY string
     yyyymm         = date.strftime('%Y%m')                        #YYYYMM string
@@ -78,7 +79,7 @@ def nexrad_level2_tmp_dirs( **kwargs ):
   root    = kwargs.get('root',    None)
   subdirs = kwargs.get('subdirs', 'netcdf')
   if root is None:
-    root = CONFIG['defaults']['nexrad_level2_tmp_root']
+    root = getConfig()['defaults']['nexrad_level2_tmp_root']
   if not isinstance(statid,  (list,tuple,)):
     statid = [statid]
   if not isinstance(subdirs, (list,tuple,)):
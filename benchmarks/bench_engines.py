@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Compare the process and asyncio download engines
+
+Synthetic NEXRAD Level 2 volumes are served from a local fake S3 with
+per-request latency and per-connection bandwidth limits, then
+downloaded with NEXRAD_AWS_Scheduler using each engine. With
+--backend local, the volumes are written to a temporary directory and
+served by LocalBackend instead, which measures the scheduler and
+engines without any HTTP in the way.
+
+Example:
+  python benchmarks/bench_engines.py --stations 20 --volumes 10 --jobs 6 128 --threads 1 16
+
+"""
+import os, time, json, shutil, tempfile, argparse
+from datetime import datetime
+
+from fake_s3 import FakeS3, nexradObjects, writeObjects
+
+def run( resource, engine, jobs, threads, outroot, date, stations ):
+
+  from aws_atmo.nexrad import NEXRAD_AWS_Scheduler
+
+  scheduler = NEXRAD_AWS_Scheduler( resource, 'noaa-nexrad-level2', False, 3, jobs, engine, threads,
+                                     listCache = False )
+  t0        = time.monotonic()
+  outdir, nSuccess, nFail, size = scheduler.download(
+    date0 = date, station = stations, outroot = outroot )
+  dt        = time.monotonic() - t0
+  scheduler.close()
+  return { 'engine' : engine, 'jobs' : jobs, 'threads' : threads, 'files' : nSuccess,
+           'failed' : nFail, 'bytes' : size, 'seconds' : dt,
+           'MBps' : size / dt / 1.0e6 }
+
+def jobsType( val ):
+  return val if val == 'auto' else int(val)
+
+def main():
+  parser = argparse.ArgumentParser( description = __doc__,
+    formatter_class = argparse.RawDescriptionHelpFormatter )
+  parser.add_argument( '--stations',  type = int,   default = 10 )
+  parser.add_argument( '--volumes',   type = int,   default = 10,  help = 'Volumes per station' )
+  parser.add_argument( '--size',      type = float, default = 2.0, help = 'Volume size in MB' )
+  parser.add_argument( '--latency',   type = float, default = 0.05, help = 'Per-request latency in seconds' )
+  parser.add_argument( '--bandwidth', type = float, default = 10.0, help = 'Per-connection bandwidth in MB/s' )
+  parser.add_argument( '--jobs',      type = jobsType, nargs = '+', default = [4, 64], help = "Concurrent downloads; may be 'auto'" )
+  parser.add_argument( '--threads',   type = int,   nargs = '+', default = [1], help = 'Threads per process for the process engine' )
+  parser.add_argument( '--engines',   type = str,   nargs = '+', default = ['process', 'async'] )
+  parser.add_argument( '--backend',   type = str,   default = 's3', choices = ['s3', 'local'], help = 'Serve volumes from fake S3 or a local directory' )
+  parser.add_argument( '--output',    type = str,   help = 'JSON file to write results to' )
+  args = parser.parse_args()
+
+  date     = datetime(2011, 2, 28)
+  stations = [f'K{i:03d}' for i in range( args.stations )]
+  objects  = nexradObjects( date, stations, args.volumes, int(args.size * 1.0e6) )
+  if args.backend == 'local':
+    from aws_atmo.downloader.backends import LocalBackend
+    server   = None
+    srcroot  = tempfile.mkdtemp()
+    writeObjects( srcroot, objects )
+    resource = LocalBackend( srcroot )
+  else:
+    server   = FakeS3( objects, args.latency, args.bandwidth * 1.0e6 ).start()
+    resource = 's3'
+
+  results  = []
+  try:
+    for engine in args.engines:
+      for jobs in args.jobs:
+        for threads in (args.threads if engine == 'process' else [1]):
+          outroot = tempfile.mkdtemp()
+          try:
+            res = run( resource, engine, jobs, threads, outroot, date, stations )
+          finally:
+            shutil.rmtree( outroot )
+          print( '{engine:>8} jobs={jobs!s:<4} threads={threads:<3d} files={files:<6d} failed={failed:<4d} '
+                 '{seconds:8.2f} s {MBps:8.1f} MB/s'.format( **res ) )
+          results.append( res )
+  finally:
+    if server is None:
+      shutil.rmtree( srcroot )
+    else:
+      server.stop()
+
+  if args.output:
+    with open( args.output, 'w' ) as fid:
+      json.dump( results, fid, indent = 2 )
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Peak memory per transfer of the streaming download path
+
+A synthetic object whose body generates data on demand is downloaded
+with download() for several buffer sizes, and with the old approach
+of reading the whole body into memory before writing it. Peak Python
+memory during each transfer is measured with tracemalloc.
+
+Example:
+  python benchmarks/bench_memory.py --size 256 --bufsize 64 1024 8192
+
+"""
+import io, os, json, tempfile, argparse, tracemalloc
+
+PATTERN = bytes( range(256) ) * 256                                             # 64 KiB block used to generate object data
+
+class SyntheticBody( io.RawIOBase ):
+  """Streaming body producing size bytes without holding them in memory"""
+
+  def __init__(self, size):
+    self._left = size
+
+  def readable(self):
+    return True
+
+  def readinto(self, view):
+    n = min( len(view), self._left )
+    pos = 0
+    while pos < n:
+      m = min( len(PATTERN), n - pos )
+      view[pos:pos+m] = PATTERN[:m]
+      pos += m
+    self._left -= n
+    return n
+
+class SyntheticObject( object ):
+  """Object with the get() interface used by the download functions"""
+
+  def __init__(self, size):
+    self.size = size
+
+  def get(self, Range = None, **kwargs):
+    start, end = 0, self.size-1
+    if Range:
+      start, end = Range.split('=')[1].split('-')
+      start, end = int(start), (int(end) if end else self.size-1)
+    return {'Body' : SyntheticBody( end-start+1 ), 'ContentLength' : end-start+1}
+
+def readAll( obj, path ):
+  """Download as before streaming; hold whole body in memory"""
+
+  with open( path, 'wb' ) as fid:
+    resp = obj.get()
+    data = resp['Body'].read()
+    fid.write( data )
+  return len(data)
+
+def peak( func ):
+  """Peak traced memory while running func; includes any buffer it allocates"""
+
+  tracemalloc.start()
+  tracemalloc.reset_peak()
+  size = func()
+  _, peak = tracemalloc.get_traced_memory()
+  tracemalloc.stop()
+  return size, peak
+
+def main():
+  parser = argparse.ArgumentParser( description = __doc__,
+    formatter_class = argparse.RawDescriptionHelpFormatter )
+  parser.add_argument( '--size',    type = float, default = 128.0, help = 'Object size in MB' )
+  parser.add_argument( '--bufsize', type = int,   nargs = '+', default = [64, 256, 1024, 4096], help = 'Buffer sizes in KB' )
+  parser.add_argument( '--output',  type = str,   help = 'JSON file to write results to' )
+  args = parser.parse_args()
+
+  from aws_atmo.downloader.utils import download
+
+  obj     = SyntheticObject( int(args.size * 1.0e6) )
+  results = []
+  fd, path = tempfile.mkstemp()
+  os.close( fd )
+  try:
+    size, mem = peak( lambda : readAll( obj, path ) )
+    print( f'read whole body     : {size/1.0e6:8.1f} MB, peak {mem/1.0e6:8.2f} MB' )
+    results.append( {'method' : 'read', 'bufsize' : None, 'bytes' : size, 'peak' : mem} )
+    for bufsize in args.bufsize:
+      size, mem = peak( lambda : download( obj, path, buf = bytearray( bufsize * 1024 ) ) )
+      print( f'stream {bufsize:6d} KB buf : {size/1.0e6:8.1f} MB, peak {mem/1.0e6:8.2f} MB' )
+      results.append( {'method' : 'stream', 'bufsize' : bufsize*1024, 'bytes' : size, 'peak' : mem} )
+  finally:
+    os.remove( path )
+
+  if args.output:
+    with open( args.output, 'w' ) as fid:
+      json.dump( results, fid, indent = 2 )
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Compare the orders files are handed to the download processes in
+
+Synthetic NEXRAD Level 2 volumes are served from a local fake S3 and
+downloaded with NEXRAD_AWS_Scheduler using each order. A few volumes
+per station are made much larger than the rest, as happens when a
+storm fills the radar's volume, so that a straggler can set the length
+of the run. Reported for each order:
+
+  first : time until the newest volume of every station is on disk;
+          what an operational user is waiting for
+  makespan : time until every volume is on disk
+
+Times come from the modification times of the downloaded files.
+
+Example:
+  python benchmarks/bench_order.py --stations 10 --volumes 24 --jobs 4
+
+"""
+import os, time, json, shutil, tempfile, argparse
+from datetime import datetime
+
+from fake_s3 import FakeS3, nexradObjects
+
+def run( jobs, order, outroot, date, stations ):
+
+  from aws_atmo.nexrad import NEXRAD_AWS_Scheduler
+
+  scheduler = NEXRAD_AWS_Scheduler( 's3', 'noaa-nexrad-level2', False, 3, jobs,
+                                     listCache = False, order = order )
+  t0        = time.time()
+  outdir, nSuccess, nFail, size = scheduler.download(
+    date0 = date, station = stations, outroot = outroot )
+  scheduler.close()
+
+  newest = {}                                                                   # Time newest volume of each station arrived
+  last   = t0
+  for dirpath, dirnames, filenames in os.walk( outroot ):
+    for fname in filenames:
+      mtime = os.path.getmtime( os.path.join( dirpath, fname ) )
+      last  = max( last, mtime )
+      if fname[:4] in stations and fname > newest.get( fname[:4], ('',) )[0]:
+        newest[ fname[:4] ] = (fname, mtime)
+  first = max( (mtime for _, mtime in newest.values()), default = t0 )
+  return { 'order' : order or 'listing', 'jobs' : jobs, 'files' : nSuccess, 'failed' : nFail,
+           'bytes' : size, 'first' : first - t0, 'makespan' : last - t0 }
+
+def main():
+  parser = argparse.ArgumentParser( description = __doc__,
+    formatter_class = argparse.RawDescriptionHelpFormatter )
+  parser.add_argument( '--stations',  type = int,   default = 10 )
+  parser.add_argument( '--volumes',   type = int,   default = 24,   help = 'Volumes per station' )
+  parser.add_argument( '--size',      type = float, default = 1.0,  help = 'Volume size in MB' )
+  parser.add_argument( '--large',     type = int,   default = 2,    help = 'Number of large volumes per station' )
+  parser.add_argument( '--scale',     type = float, default = 8.0,  help = 'Size of large volumes relative to the rest' )
+  parser.add_argument( '--latency',   type = float, default = 0.02, help = 'Per-request latency in seconds' )
+  parser.add_argument( '--bandwidth', type = float, default = 10.0, help = 'Per-connection bandwidth in MB/s' )
+  parser.add_argument( '--jobs',      type = int,   nargs = '+', default = [4] )
+  parser.add_argument( '--orders',    type = str,   nargs = '+', default = ['listing', 'latest', 'largest'] )
+  parser.add_argument( '--output',    type = str,   help = 'JSON file to write results to' )
+  args = parser.parse_args()
+
+  date     = datetime(2011, 2, 28)
+  stations = [f'K{i:03d}' for i in range( args.stations )]
+  objects  = nexradObjects( date, stations, args.volumes, int(args.size * 1.0e6) )
+  for i, key in enumerate( sorted( objects ) ):                                 # Make a few volumes per station large, late in the listing
+    if i % args.volumes in range( args.volumes // 2, args.volumes // 2 + args.large ):
+      objects[key] = int( objects[key] * args.scale )
+
+  server   = FakeS3( objects, args.latency, args.bandwidth * 1.0e6 ).start()
+  results  = []
+  try:
+    for jobs in args.jobs:
+      for order in args.orders:
+        outroot = tempfile.mkdtemp()
+        try:
+          res = run( jobs, None if order == 'listing' else order, outroot, date, stations )
+        finally:
+          shutil.rmtree( outroot )
+        print( '{order:>8} jobs={jobs:<4d} files={files:<6d} failed={failed:<4d} '
+               'first={first:8.2f} s makespan={makespan:8.2f} s'.format( **res ) )
+        results.append( res )
+  finally:
+    server.stop()
+
+  if args.output:
+    with open( args.output, 'w' ) as fid:
+      json.dump( results, fid, indent = 2 )
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Request count and wall time for GRIB subset downloads
+
+For each idx file, the records matching the subset patterns are found
+with parseIDX and then downloaded from a local fake S3 twice: once the
+old way (one request per record, one after another) and once with the
+ranges merged by planRanges and fetched concurrently. The GRIB object
+served has the record layout described by the idx file.
+
+Real idx files can be given on the command line, e.g., copies of
+  s3://noaa-hrrr-bdp-pds/hrrr.20240101/conus/hrrr.t00z.wrfnatf00.grib2.idx
+  s3://noaa-gfs-bdp-pds/gfs.20240101/00/atmos/gfs.t00z.pgrb2.0p25.f000.idx
+If none are given, HRRR wrfnat shaped idx data are synthesized.
+
+Example:
+  python benchmarks/bench_ranges.py hrrr.t00z.wrfnatf00.grib2.idx -s ':TMP:' ':UGRD:' ':VGRD:'
+
+"""
+import os, time, json, random, hashlib, tempfile, argparse
+
+from fake_s3 import FakeS3
+
+HRRR_VARS = ['PRES', 'CLMR', 'ICMR', 'RWMR', 'SNMR', 'GRLE', 'HGT', 'TMP',
+             'SPFH', 'UGRD', 'VGRD', 'VVEL', 'TKE', 'NCONCD', 'NCCICE',
+             'SPNCR', 'PMTF', 'PMTC', 'MASSDEN']
+
+def synthIDX( nLevels = 50, seed = 0 ):
+  """Build HRRR wrfnat shaped idx text; one record per variable per hybrid level"""
+
+  rng     = random.Random( seed )
+  lines   = []
+  offset  = 0
+  for var in HRRR_VARS:
+    for lev in range( 1, nLevels+1 ):
+      lines.append( f'{len(lines)+1}:{offset}:d=2024010100:{var}:{lev} hybrid level:anl:' )
+      offset += rng.randint( 200_000, 1_500_000 )
+  return os.linesep.join( lines ), offset + 1_000_000
+
+def idxSize( idx ):
+  """Estimate GRIB size from idx; last record given 1 MB"""
+
+  last = idx.strip().splitlines()[-1]
+  return int( last.split(':')[1] ) + 1_000_000
+
+def fetch( obj, ranges, maxGap, rangeJobs ):
+
+  from aws_atmo.downloader.utils import download
+
+  fd, path = tempfile.mkstemp()
+  os.close( fd )
+  try:
+    t0   = time.monotonic()
+    size = download( obj, path, ranges, maxGap, rangeJobs )
+    dt   = time.monotonic() - t0
+    with open( path, 'rb' ) as fid:
+      md5 = hashlib.md5( fid.read() ).hexdigest()
+  finally:
+    os.remove( path )
+  return size, dt, md5
+
+def main():
+  parser = argparse.ArgumentParser( description = __doc__,
+    formatter_class = argparse.RawDescriptionHelpFormatter )
+  parser.add_argument( 'idx',         type = str,   nargs = '*', help = 'idx files to use' )
+  parser.add_argument( '-s', '--subset', type = str, nargs = '+', default = [':TMP:', ':UGRD:', ':VGRD:'] )
+  parser.add_argument( '--gaps',      type = int,   nargs = '+', default = [0, 64*1024, 1024**2], help = 'maxGap values to test' )
+  parser.add_argument( '--rangeJobs', type = int,   default = 8 )
+  parser.add_argument( '--latency',   type = float, default = 0.03, help = 'Per-request latency in seconds' )
+  parser.add_argument( '--bandwidth', type = float, default = 50.0, help = 'Per-connection bandwidth in MB/s' )
+  parser.add_argument( '--output',    type = str,   help = 'JSON file to write results to' )
+  args = parser.parse_args()
+
+  from aws_atmo.nwp.utils import parseIDX
+  from aws_atmo.downloader.utils import planRanges
+  from aws_atmo.downloader.backends import S3Backend
+
+  files = {}
+  for path in args.idx:
+    with open( path ) as fid:
+      idx = fid.read()
+    files[ os.path.basename(path) ] = (idx, idxSize( idx ))
+  if len(files) == 0:
+    files['synthetic.wrfnatf00.grib2.idx'] = synthIDX()
+
+  objects = { key : size for key, (idx, size) in files.items() }
+  server  = FakeS3( objects, args.latency, args.bandwidth * 1.0e6 ).start()
+  bucket  = S3Backend( 'bucket' ).connect()
+
+  results = []
+  try:
+    for key, (idx, size) in files.items():
+      ranges, _ = parseIDX( idx, *args.subset )
+      obj       = bucket.Object( key )
+
+      n0             = server.nRequests
+      size0, dt0, h0 = fetch( obj, ranges, -1, 1 )
+      req0           = server.nRequests - n0
+      print( f'{key} : {len(ranges)} records, {size0/1.0e6:0.1f} MB' )
+      print( f'  serial, unmerged       : {req0:4d} requests {dt0:7.3f} s' )
+      for gap in args.gaps:
+        n0          = server.nRequests
+        size1, dt1, h1 = fetch( obj, ranges, gap, args.rangeJobs )
+        req1        = server.nRequests - n0
+        planned     = len( planRanges( ranges, gap ) )
+        print( f'  maxGap={gap:<9d} jobs={args.rangeJobs:<2d}: {req1:4d} requests {dt1:7.3f} s '
+               f'({dt0/dt1:0.1f}x){"" if h1 == h0 and size1 == size0 else " MISMATCH"}' )
+        results.append( { 'file' : key, 'records' : len(ranges), 'bytes' : size0,
+                          'maxGap' : gap, 'rangeJobs' : args.rangeJobs,
+                          'requestsBefore' : req0, 'secondsBefore' : dt0,
+                          'requestsAfter' : req1, 'plannedAfter' : planned,
+                          'secondsAfter' : dt1, 'identical' : h1 == h0 } )
+  finally:
+    server.stop()
+
+  if args.output:
+    with open( args.output, 'w' ) as fid:
+      json.dump( results, fid, indent = 2 )
+
+if __name__ == "__main__":
+  main()
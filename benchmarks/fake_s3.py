@@ -0,0 +1,236 @@
+"""
+Minimal local S3 stand-in for benchmarking
+
+Serves synthetic objects over HTTP using the subset of the S3 REST API
+used by aws_atmo: ListObjectsV2, GetObject (with Range) and HeadObject.
+A per-request latency and per-connection bandwidth can be set so that
+the effect of concurrency is visible as it would be against the real
+service.
+
+Point boto3 at the server by setting the AWS_ENDPOINT_URL environment
+variable, which is inherited by download processes.
+
+"""
+import os, time, hashlib
+from threading import Thread
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs, unquote
+from xml.sax.saxutils import escape
+
+PATTERN  = bytes( range(256) ) * 4096                                           # 1 MiB of repeating data used for object bodies
+PAGESIZE = 1000                                                                 # Keys per listing page, as S3
+
+class FakeS3Handler( BaseHTTPRequestHandler ):
+
+  protocol_version = 'HTTP/1.1'
+
+  def log_message(self, *args):
+    pass
+
+  def _split(self):
+    url    = urlparse( self.path )
+    parts  = url.path.lstrip('/').split('/', 1)
+    bucket = parts[0]
+    key    = unquote( parts[1] ) if len(parts) > 1 else ''
+    return bucket, key, parse_qs( url.query )
+
+  def _latency(self):
+    if self.server.latency > 0:
+      time.sleep( self.server.latency )
+
+  def _notFound(self):
+    body = b'<Error><Code>NoSuchKey</Code></Error>'
+    self.send_response( 404 )
+    self.send_header( 'Content-Length', str(len(body)) )
+    self.end_headers()
+    self.wfile.write( body )
+
+  def _headers(self, key, size):
+    self.send_header( 'ETag', self.server.etag(key) )
+    self.send_header( 'Last-Modified', 'Mon, 28 Feb 2011 00:00:00 GMT' )
+    self.send_header( 'Accept-Ranges', 'bytes' )
+
+  def do_HEAD(self):
+    bucket, key, _ = self._split()
+    self._latency()
+    self.server.nRequests += 1
+    size = self.server.objects.get( key )
+    if size is None:
+      return self._notFound()
+    self.send_response( 200 )
+    self._headers( key, size )
+    self.send_header( 'Content-Length', str(size) )
+    self.end_headers()
+
+  def do_GET(self):
+    bucket, key, query = self._split()
+    self._latency()
+    self.server.nRequests += 1
+    if key == '':
+      return self._list( query )
+
+    size = self.server.objects.get( key )
+    if size is None:
+      return self._notFound()
+
+    start, end = 0, size-1
+    rng        = self.headers.get('Range')
+    if rng:
+      start, end = rng.split('=')[1].split('-')
+      start      = int(start)
+      end        = int(end) if end != '' else size-1
+      end        = min( end, size-1 )
+      self.send_response( 206 )
+      self.send_header( 'Content-Range', f'bytes {start}-{end}/{size}' )
+    else:
+      self.send_response( 200 )
+    self._headers( key, size )
+    self.send_header( 'Content-Length', str(end-start+1) )
+    self.end_headers()
+    self._send( start, end+1 )
+
+  def _send(self, start, end):
+    """Write object bytes, limited to the per-connection bandwidth"""
+
+    chunk = 64 * 1024
+    rate  = self.server.bandwidth
+    t0    = time.monotonic()
+    sent  = 0
+    pos   = start
+    while pos < end:
+      n    = min( chunk, end - pos )
+      off  = pos % len(PATTERN)
+      data = (PATTERN[off:] + PATTERN[:off])[:n] if off + n > len(PATTERN) else PATTERN[off:off+n]
+      self.wfile.write( data )
+      pos  += n
+      sent += n
+      if rate > 0:
+        wait = sent / rate - (time.monotonic() - t0)
+        if wait > 0: time.sleep( wait )
+
+  def _list(self, query):
+    prefix = query.get('prefix',      [''])[0]
+    after  = query.get('start-after', [''])[0]
+    token  = query.get('continuation-token', [''])[0]
+    after  = max( after, token )
+    keys   = [k for k in self.server.keys if k.startswith(prefix) and k > after]
+    page   = keys[:PAGESIZE]
+    trunc  = len(keys) > PAGESIZE
+    items  = ''.join(
+      '<Contents><Key>{}</Key><Size>{}</Size><ETag>{}</ETag>'
+      '<LastModified>2011-02-28T00:00:00.000Z</LastModified>'
+      '<StorageClass>STANDARD</StorageClass></Contents>'.format(
+        escape(k), self.server.objects[k], escape(self.server.etag(k)) )
+      for k in page )
+    nxt    = f'<NextContinuationToken>{escape(page[-1])}</NextContinuationToken>' if trunc else ''
+    body   = (
+      '<?xml version="1.0" encoding="UTF-8"?>'
+      '<ListBucketResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/">'
+      f'<Name>bucket</Name><Prefix>{escape(prefix)}</Prefix><KeyCount>{len(page)}</KeyCount>'
+      f'<MaxKeys>{PAGESIZE}</MaxKeys><IsTruncated>{str(trunc).lower()}</IsTruncated>'
+      f'{nxt}{items}</ListBucketResult>'
+    ).encode()
+    self.send_response( 200 )
+    self.send_header( 'Content-Type', 'application/xml' )
+    self.send_header( 'Content-Length', str(len(body)) )
+    self.end_headers()
+    self.wfile.write( body )
+
+class FakeS3( ThreadingHTTPServer ):
+  """
+  Threaded HTTP server holding a dict of synthetic objects
+
+  Objects are stored as key -> size; the bodies are generated from a
+  repeating byte pattern so that large datasets cost no memory.
+
+  """
+
+  daemon_threads      = True
+  request_queue_size  = 1024
+
+  def __init__(self, objects, latency = 0.0, bandwidth = 0, port = 0):
+    """
+    Arguments:
+      objects (dict) : Object keys and sizes (bytes)
+
+    Keyword arguments:
+      latency (float) : Delay added to every request; seconds
+      bandwidth (float) : Bytes per second per connection; zero for unlimited
+      port (int) : Port to listen on; zero for any free port
+
+    """
+
+    super().__init__( ('127.0.0.1', port), FakeS3Handler )
+    self.objects   = dict( objects )
+    self.keys      = sorted( self.objects )
+    self.latency   = latency
+    self.bandwidth = bandwidth
+    self.nRequests = 0
+    self._thread   = None
+
+  @property
+  def url(self):
+    return 'http://{}:{}'.format( *self.server_address )
+
+  def etag(self, key):
+    return '"{}"'.format( hashlib.md5( f'{key}{self.objects[key]}'.encode() ).hexdigest() )
+
+  def start(self):
+    """Serve in background thread and point boto3 at the server"""
+
+    self._thread = Thread( target = self.serve_forever, daemon = True )
+    self._thread.start()
+    os.environ['AWS_ENDPOINT_URL']      = self.url
+    os.environ.setdefault( 'AWS_ACCESS_KEY_ID',     'benchmark' )
+    os.environ.setdefault( 'AWS_SECRET_ACCESS_KEY', 'benchmark' )
+    os.environ.setdefault( 'AWS_DEFAULT_REGION',    'us-east-1' )
+    return self
+
+  def stop(self):
+    self.shutdown()
+    self.server_close()
+
+def nexradObjects( date, stations, nVolumes = 12, size = 8 * 1024**2 ):
+  """
+  Build NEXRAD Level 2 shaped keys for the noaa-nexrad-level2 layout
+
+  Arguments:
+    date (datetime) : Date of the volumes
+    stations (list) : Station IDs
+
+  Keyword arguments:
+    nVolumes (int) : Number of volumes per station, spread over the day
+    size (int) : Size of each volume in bytes
+
+  Returns:
+    dict : Keys and sizes
+
+  """
+
+  step    = 86400 // max(nVolumes, 1)
+  objects = {}
+  for station in stations:
+    for i in range( nVolumes ):
+      hh, mm, ss = (i*step) // 3600, (i*step) % 3600 // 60, (i*step) % 60
+      key = f'{date:%Y/%m/%d}/{station}/{station}{date:%Y%m%d}_{hh:02d}{mm:02d}{ss:02d}_V06'
+      objects[key] = size
+  return objects
+
+def writeObjects( root, objects ):
+  """
+  Write synthetic objects to a directory for use with LocalBackend
+
+  Files hold the same data FakeS3 serves, at paths matching the keys.
+
+  Arguments:
+    root (str) : Directory to write objects below
+    objects (dict) : Keys and sizes, e.g., from nexradObjects()
+
+  """
+
+  for key, size in objects.items():
+    path = os.path.join( root, *key.split('/') )
+    os.makedirs( os.path.dirname( path ), exist_ok = True )
+    with open( path, 'wb' ) as fid:
+      for pos in range( 0, size, len(PATTERN) ):
+        fid.write( PATTERN[:min( len(PATTERN), size - pos )] )
@@ -0,0 +1,46 @@
+"""
+Backend serving synthetic objects from memory
+
+Nothing is sent over a network or read from disk, so downloads through
+it measure the overhead of the scheduler and download processes alone.
+
+"""
+import io
+
+from aws_atmo.downloader.backends import Backend, Listing
+
+from fake_s3 import PATTERN
+
+class NullBackend( Backend ):
+
+  def __init__(self, objects, name = 'null'):
+    """
+    Arguments:
+      objects (dict) : Object keys and sizes (bytes); sizes may not be
+        more than len(PATTERN)
+
+    Keyword arguments:
+      name (str) : Name of the bucket
+
+    """
+
+    self.name    = name
+    self.objects = dict( objects )
+    self.keys    = sorted( self.objects )
+
+  def list(self, prefix, startAfter = None, stopAfter = None):
+
+    for key in self.keys:
+      if startAfter is not None and key <= startAfter: continue
+      if stopAfter  is not None and key >  stopAfter:  break
+      if key.startswith( prefix ):
+        yield Listing( key, self.objects[key], '"null"' )
+
+  def head(self, key):
+
+    return Listing( key, self.objects[key], '"null"' )
+
+  def get(self, key, Range = None, IfMatch = None):
+
+    size = self.objects[key]
+    return {'Body' : io.BytesIO( PATTERN[:size] ), 'ContentLength' : size, 'ETag' : '"null"'}
@@ -0,0 +1,515 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for the download pipeline and hot helpers
+
+Runs against a local fake S3 serving synthetic NEXRAD and GRIB shaped
+objects, so no network access is needed. Measures:
+
+  throughput : scheduler throughput as jobs varies
+  filesize   : per-file overhead of many small files vs few large ones
+  parseidx   : parseIDX on full HRRR wrfnat idx data
+  stats      : StatsCollection.__add__ merge cost
+  paths      : nexrad_level2_directory over years of dates
+  queue      : items per second through the scheduler with a no-op
+               backend, with and without batched work items
+  keys       : filtering a synthetic month-long, many-station NEXRAD
+               listing by time, key by key vs in parsed pages
+  batches    : many small sequential downloads, each on a new
+               scheduler vs all on one reused scheduler
+  empty      : downloads of model runs and radar days not yet posted,
+               i.e., empty listings, with and without subsetting
+  resume     : resuming a partial download after the metadata request
+               of an attempt fails or is throttled; raises if partial
+               data are lost or throttling is not reported
+  logging    : per-file cost of the log records a download process
+               makes, shipped one at a time vs level-filtered and in
+               batches, with the handler at WARNING, INFO and DEBUG
+  imports    : python -X importtime of the package modules, --help of
+               the download scripts, and first use of the station list
+               with a cold and a warm parsed-data cache
+
+Results are written as JSON, tagged with the package version, so runs
+from different versions can be compared.
+
+Example:
+  python benchmarks/suite.py --output results-$(date +%Y%m%d).json
+  python benchmarks/suite.py parseidx stats --repeat 10
+
+"""
+import os, sys, time, json, shutil, timeit, platform, tempfile, argparse, subprocess
+from datetime import datetime, timedelta
+
+from fake_s3 import FakeS3, nexradObjects
+from bench_ranges import synthIDX
+
+ROOT    = os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) )   # Repository root; modules and scripts are run from here in subprocesses
+MODULES = ('aws_atmo', 'aws_atmo.nexrad', 'aws_atmo.nwp.gfs', 'aws_atmo.nwp.hrrr')
+SCRIPTS = ('aws_gfs_download', 'aws_hrrr_download')
+
+def timed( func, number, repeat ):
+  """Best time per call of func, in seconds, over repeat runs of number calls"""
+
+  return min( timeit.repeat( func, number = number, repeat = repeat ) ) / number
+
+def download( objects, jobs, latency, bandwidth, engine = 'process', date = datetime(2011, 2, 28) ):
+  """Download all objects from a fresh fake S3 with NEXRAD_AWS_Scheduler"""
+
+  from aws_atmo.nexrad import NEXRAD_AWS_Scheduler
+
+  stations = sorted( set( key.split('/')[3] for key in objects ) )
+  server   = FakeS3( objects, latency, bandwidth ).start()
+  outroot  = tempfile.mkdtemp()
+  try:
+    scheduler = NEXRAD_AWS_Scheduler( 's3', 'noaa-nexrad-level2', False, 3, jobs, engine,
+                                      listCache = False )
+    t0        = time.monotonic()
+    _, nSuccess, nFail, size = scheduler.download( date0 = date, station = stations, outroot = outroot )
+    dt        = time.monotonic() - t0
+    scheduler.close()
+  finally:
+    server.stop()
+    shutil.rmtree( outroot )
+  return { 'files' : nSuccess, 'failed' : nFail, 'bytes' : size, 'seconds' : dt,
+           'MBps' : size / dt / 1.0e6, 'filesPerSecond' : nSuccess / dt }
+
+def benchThroughput( args ):
+
+  objects = nexradObjects( datetime(2011, 2, 28), [f'K{i:03d}' for i in range(args.stations)],
+                           args.volumes, int(args.size * 1.0e6) )
+  results = []
+  for jobs in args.jobs:
+    res = download( objects, jobs, args.latency, args.bandwidth * 1.0e6 )
+    res.update( jobs = jobs )
+    print( '  jobs={jobs:<4d} files={files:<5d} {seconds:7.2f} s {MBps:8.1f} MB/s'.format( **res ) )
+    results.append( res )
+  return results
+
+def benchFileSize( args ):
+
+  total   = int( args.total * 1.0e6 )
+  results = []
+  for nFiles in args.nfiles:
+    objects = nexradObjects( datetime(2011, 2, 28), ['KTLX'], nFiles, total // nFiles )
+    res     = download( objects, args.jobs[-1], args.latency, args.bandwidth * 1.0e6 )
+    res.update( jobs = args.jobs[-1], fileSize = total // nFiles,
+                secondsPerFile = res['seconds'] / max(res['files'], 1) )
+    print( '  files={files:<5d} size={fileSize:<10d} {seconds:7.2f} s {secondsPerFile:8.4f} s/file'.format( **res ) )
+    results.append( res )
+  return results
+
+def benchQueue( args ):
+
+  from aws_atmo.nexrad import NEXRAD_AWS_Scheduler
+  from aws_atmo.downloader import BATCH
+  from null_backend import NullBackend
+
+  date     = datetime(2011, 2, 28)
+  stations = [f'K{i:03d}' for i in range( args.stations )]
+  objects  = nexradObjects( date, stations, args.items // args.stations, 1024 )
+  backend  = NullBackend( objects )
+  results  = []
+  for batch in ((1, 0), BATCH):
+    for jobs in args.jobs:
+      outroot   = tempfile.mkdtemp()
+      try:
+        scheduler = NEXRAD_AWS_Scheduler( backend, None, False, 3, jobs, listCache = False, batch = batch )
+        t0        = time.monotonic()
+        _, nSuccess, nFail, size = scheduler.download( date0 = date, station = stations, outroot = outroot )
+        dt        = time.monotonic() - t0
+        scheduler.close()
+      finally:
+        shutil.rmtree( outroot )
+      print( f'  batch={batch[0]:<4d} jobs={jobs:<4d} files={nSuccess:<6d} {dt:7.2f} s {nSuccess/dt:9.1f} files/s' )
+      results.append( { 'batch' : batch[0], 'jobs' : jobs, 'files' : nSuccess, 'failed' : nFail,
+                        'seconds' : dt, 'filesPerSecond' : nSuccess / dt } )
+  return results
+
+def benchBatches( args ):
+
+  from aws_atmo.nexrad import NEXRAD_AWS_Scheduler
+  from null_backend import NullBackend
+
+  dates   = [datetime(2011, 2, 1) + timedelta(days = i) for i in range( args.batches )]
+  objects = {}
+  for date in dates:
+    objects.update( nexradObjects( date, ['KTLX'], args.volumes, 1024 ) )
+  backend = NullBackend( objects )
+  jobs    = args.jobs[-1]
+  results = []
+  for reuse in (False, True):
+    outroot   = tempfile.mkdtemp()
+    nFiles    = 0
+    try:
+      t0        = time.monotonic()
+      scheduler = None
+      for date in dates:
+        if scheduler is None:
+          scheduler = NEXRAD_AWS_Scheduler( backend, None, False, 3, jobs, listCache = False )
+        _, nSuccess, nFail, size = scheduler.download( date0 = date, station = 'KTLX', outroot = outroot )
+        nFiles   += nSuccess
+        if not reuse:
+          scheduler.close()
+          scheduler = None
+      if scheduler is not None: scheduler.shutdown()
+      dt = time.monotonic() - t0
+    finally:
+      shutil.rmtree( outroot )
+    name = 'reused' if reuse else 'new'
+    print( f'  scheduler={name:<7} jobs={jobs:<4d} batches={len(dates):<5d} files={nFiles:<6d} {dt:7.2f} s {dt/len(dates)*1.0e3:8.1f} ms/batch' )
+    results.append( { 'scheduler' : name, 'jobs' : jobs, 'batches' : len(dates), 'files' : nFiles,
+                      'seconds' : dt, 'secondsPerBatch' : dt / len(dates) } )
+  return results
+
+def benchParseIDX( args ):
+
+  from aws_atmo.nwp.utils import parseIDX
+
+  if args.idx:
+    with open( args.idx ) as fid:
+      idx = fid.read()
+  else:
+    idx, _ = synthIDX( args.levels )
+  nRecords = len( idx.splitlines() )
+  results  = []
+  for subset in ([':TMP:'], [':TMP:', ':UGRD:', ':VGRD:'], [':PRES:', ':HGT:', ':TMP:', ':SPFH:', ':UGRD:', ':VGRD:']):
+    dt = timed( lambda : parseIDX( idx, *subset ), 1, args.repeat )
+    n  = len( parseIDX( idx, *subset )[0] )
+    print( f'  records={nRecords:<6d} patterns={len(subset):<3d} matched={n:<5d} {dt*1.0e3:9.3f} ms' )
+    results.append( { 'records' : nRecords, 'patterns' : len(subset), 'matched' : n, 'seconds' : dt } )
+  return results
+
+def benchStats( args ):
+
+  from aws_atmo.downloader.stats import StatsCollection
+
+  results = []
+  for nLabels in (1, 10, 143, 1000):
+    a, b = StatsCollection(), StatsCollection()
+    for i in range( nLabels ):
+      a[f'K{i:03d}'].success( 1000, 0.1 )
+      b[f'K{i:03d}'].success( 2000, 0.2 )
+      b[f'K{i:03d}'].fail()
+    dt = timed( lambda : a + b, 100, args.repeat )
+    print( f'  labels={nLabels:<5d} {dt*1.0e6:9.2f} us/merge' )
+    results.append( { 'labels' : nLabels, 'seconds' : dt } )
+  return results
+
+def benchPaths( args ):
+
+  from aws_atmo import NEXRAD_STATION_IDS
+  from aws_atmo.pathUtils.nexrad import nexrad_level2_directory
+
+  dates   = [datetime(2000, 1, 1) + timedelta(days = i) for i in range( int(args.years * 365.25) )]
+  results = []
+  for station in ('KHGX', list(NEXRAD_STATION_IDS)):
+    def run():
+      for date in dates:
+        nexrad_level2_directory( date, station, root = '/data/NEXRAD/level2' )
+    dt = timed( run, 1, args.repeat )
+    nStations = 1 if isinstance(station, str) else len(station)
+    print( f'  dates={len(dates):<6d} stations={nStations:<4d} {dt:8.3f} s {dt/len(dates)*1.0e6:9.2f} us/date' )
+    results.append( { 'dates' : len(dates), 'stations' : nStations, 'seconds' : dt } )
+  return results
+
+def benchKeys( args ):
+
+  from aws_atmo.downloader.backends import Listing
+  from aws_atmo.downloader.keyColumns import KeyColumns, epoch
+
+  nDays    = 30
+  stations = [f'K{i:03d}' for i in range( max(1, args.keys // (nDays * args.perday)) )]
+  listing  = []
+  for day in range( nDays ):
+    objs = nexradObjects( datetime(2011, 2, 1) + timedelta(days = day), stations, args.perday, 1000 )
+    listing.extend( Listing( key, size, '"etag"' ) for key, size in objs.items() )
+  date0, date1 = datetime(2011, 2, 10), datetime(2011, 2, 20)
+  page         = 1000
+
+  def perKey():                                                                 # As NEXRAD_AWS_Scheduler.download did
+    n = 0
+    for obj in listing:
+      fBase = obj.key.split('/')[-1]
+      if fBase.endswith('MDM') or fBase.endswith('tar'): continue
+      fDate = datetime.strptime( fBase[4:19], '%Y%m%d_%H%M%S' )
+      if fDate >= date0 and fDate <= date1: n += 1
+    return n
+
+  def columns():
+    n, t0, t1 = 0, epoch( date0 ), epoch( date1 )
+    for i in range( 0, len(listing), page ):
+      cols = KeyColumns( listing[i:i+page] )
+      cols.parseTime()
+      keep = (cols.time >= t0) & (cols.time <= t1) & ~cols.endswith('MDM') & ~cols.endswith('tar')
+      n   += int( (keep & cols.valid).sum() )
+    return n
+
+  results = []
+  for name, func in (('perkey', perKey), ('columns', columns)):
+    dt = timed( func, 1, args.repeat )
+    n  = func()
+    print( f'  {name:<8} keys={len(listing):<8d} kept={n:<7d} {dt:8.3f} s {len(listing)/dt/1.0e6:7.2f} Mkeys/s' )
+    results.append( { 'method' : name, 'keys' : len(listing), 'kept' : n, 'seconds' : dt } )
+  return results
+
+def benchEmpty( args ):
+
+  from aws_atmo.nexrad import NEXRAD_AWS_Scheduler
+  from aws_atmo.nwp import NWP_AWS_Scheduler, HRRR_DEFAULTS
+  from null_backend import NullBackend
+
+  date    = datetime(2011, 2, 28)
+  backend = NullBackend( {} )
+  results = []
+  for name, subset in (('nexrad', None), ('hrrr', None), ('hrrr', ['TMP'])):
+    outroot = tempfile.mkdtemp()
+    try:
+      t0 = time.monotonic()
+      if name == 'nexrad':
+        scheduler = NEXRAD_AWS_Scheduler( backend, None, False, 3, 1, listCache = False )
+        _, nSuccess, nFail, size = scheduler.download( date0 = date, station = 'KTLX', outroot = outroot )
+      else:
+        scheduler = NWP_AWS_Scheduler( backend, None, jobs = 1, listCache = False )
+        _, nSuccess, nFail, size = scheduler.download( 'hrrr', 'conus', 'wrfnat', subset = subset, date1 = date,
+                                                       outroot = outroot, outPathFMT = HRRR_DEFAULTS['outPathFMT'],
+                                                       outFileFMT = HRRR_DEFAULTS['outFileFMT'] )
+      scheduler.close()
+      dt = time.monotonic() - t0
+    finally:
+      shutil.rmtree( outroot )
+    if nSuccess or nFail: raise RuntimeError( f'{name} : files downloaded from an empty listing' )
+    print( f'  {name:<8} subset={bool(subset)!s:<6} files={nSuccess:<3d} {dt:7.2f} s' )
+    results.append( { 'scheduler' : name, 'subset' : bool(subset), 'files' : nSuccess, 'seconds' : dt } )
+  return results
+
+def benchResume( args ):
+
+  from aws_atmo.downloader.backends import LocalBackend
+  from aws_atmo.downloader.utils import download as downloadObject, partPaths
+
+  class FlakyBackend( LocalBackend ):
+    """LocalBackend whose HEAD requests raise the queued errors, then succeed"""
+    def __init__(self, root, errors):
+      super().__init__( root )
+      self.errors = list( errors )
+      self.ranges = []
+    def head(self, key):
+      if self.errors: raise self.errors.pop( 0 )
+      return super().head( key )
+    def get(self, key, Range = None, IfMatch = None):
+      self.ranges.append( Range )
+      return super().get( key, Range = Range, IfMatch = IfMatch )
+
+  from aws_atmo.downloader.retry import Throttled
+
+  class SlowDown( Exception ):
+    """Stand-in for a botocore ClientError carrying a throttling code"""
+    response = { 'Error' : { 'Code' : 'SlowDown' } }
+
+  size, kept = 1024**2, 900 * 1024
+  data    = bytes( range( 256 ) ) * (size // 256)
+  src     = tempfile.mkdtemp()
+  out     = tempfile.mkdtemp()
+  results = []
+  try:
+    with open( os.path.join( src, 'key' ), 'wb' ) as fid:
+      fid.write( data )
+    for name, error in (('connection', ConnectionError( 'Connection reset' )),
+                        ('timeout',    TimeoutError( 'Read timed out' )),
+                        ('throttle',   SlowDown( 'Please reduce your request rate' ))):
+      fpath          = os.path.join( out, name )
+      part, etagFile = partPaths( fpath )
+      backend        = FlakyBackend( src, [error] )
+      with open( part, 'wb' ) as fid:                                           # Partial left by an interrupted download
+        fid.write( data[:kept] )
+      with open( etagFile, 'w' ) as fid:
+        fid.write( LocalBackend( src ).head( 'key' ).e_tag )
+
+      t0      = time.monotonic()
+      try:
+        failed = downloadObject( backend.Object( 'key' ), fpath ) == 0          # Attempt whose HEAD fails
+      except Throttled:                                                         # Throttling must reach the retry backoff
+        failed = name == 'throttle'
+      else:
+        failed = failed and name != 'throttle'
+      partial = os.path.getsize( part ) if os.path.exists( part ) else 0
+      got     = downloadObject( backend.Object( 'key' ), fpath )                # Next attempt
+      dt      = time.monotonic() - t0
+      with open( fpath, 'rb' ) as fid:
+        ok    = fid.read() == data
+      print( f'  {name:<10} failed={failed} partial={partial:<7d} ranges={backend.ranges} size={got} ok={ok} {dt*1.0e3:7.2f} ms' )
+      if not failed or partial != kept or not ok or backend.ranges != [f'bytes={kept}-']:
+        raise RuntimeError( f'{name} : partial data not resumed after failed attempt' )
+      results.append( { 'error' : name, 'failed' : failed, 'partial' : partial, 'seconds' : dt } )
+  finally:
+    shutil.rmtree( src )
+    shutil.rmtree( out )
+  return results
+
+def _logWorker( queue, level, batched, nFiles ):
+  """Log the records a download process makes for nFiles files, shipping them on queue"""
+
+  import logging
+  from logging.handlers import QueueHandler
+  from aws_atmo.handlers import BatchQueueHandler
+
+  log     = logging.getLogger( 'bench.logging' )
+  handler = BatchQueueHandler( queue ) if batched else QueueHandler( queue )
+  log.handlers  = [handler]
+  log.propagate = False
+  log.setLevel( level )
+  for i in range( nFiles ):
+    key = f'2011/02/28/KTLX/KTLX20110228_{i:06d}_V03'
+    log.debug( f'Attempting download to : /data/{key}' )
+    log.debug( f'     Download attempt {1:2d} of {3:2d} : {key}' )
+    log.info( f'     {key} sync complete. Rate: 1.0 MB/s' )
+  handler.flush()
+
+def benchLogging( args ):
+
+  import logging
+  from multiprocessing import Process, Queue
+  from threading import Thread
+  from aws_atmo.handlers import mpLogHandler, shipLevel
+
+  class Counter( logging.Handler ):
+    def __init__(self, level):
+      super().__init__( level )
+      self.count = 0
+    def emit(self, record):
+      self.format( record )
+      self.count += 1
+
+  log = logging.getLogger( 'bench.logging' )
+  log.setLevel( logging.DEBUG )
+  log.propagate = False
+  nFiles  = args.items
+  results = []
+  for name, level, batched in (('unbatched', logging.WARNING, False),
+                               ('batched',   logging.WARNING, True),
+                               ('batched',   logging.INFO,    True),
+                               ('batched',   logging.DEBUG,   True),
+                               ('unbatched', logging.DEBUG,   False)):
+    counter      = Counter( level )
+    log.handlers = [counter]
+    queue  = Queue()
+    thread = Thread( target = mpLogHandler, args = (queue,) )
+    worker = Process( target = _logWorker,                                      # Unbatched ships every record, as before
+                      args = (queue, shipLevel( log ) if batched else logging.DEBUG, batched, nFiles) )
+    thread.start()
+    t0 = time.monotonic()
+    worker.start()
+    worker.join()
+    queue.put( None )
+    thread.join()
+    dt = time.monotonic() - t0
+    queue.close()
+    levelName = logging.getLevelName( level )
+    print( f'  {name:<9} level={levelName:<8} files={nFiles:<6d} records={counter.count:<6d} {dt:7.3f} s {dt/nFiles*1.0e6:8.2f} us/file' )
+    results.append( { 'batched' : batched, 'level' : levelName, 'files' : nFiles, 'records' : counter.count,
+                      'seconds' : dt, 'secondsPerFile' : dt / nFiles } )
+  log.handlers = []
+  return results
+
+def _run( cmd, env = None ):
+  """Run command in a fresh interpreter; wall time in seconds and stderr"""
+
+  env = {**os.environ, **(env or {})}
+  env['PYTHONPATH'] = os.pathsep.join( filter( None, [ROOT, env.get('PYTHONPATH')] ) )
+  t0  = time.perf_counter()
+  res = subprocess.run( [sys.executable, *cmd], env = env, capture_output = True, text = True, check = True )
+  return time.perf_counter() - t0, res.stderr
+
+def _importTime( module ):
+  """Cumulative import time of module from -X importtime; seconds"""
+
+  _, err = _run( ['-X', 'importtime', '-c', f'import {module}'] )
+  for line in err.splitlines():
+    _, cumulative, name = line.split( '|' )                                    # import time: self [us] | cumulative | imported package
+    if name.strip() == module: return int( cumulative ) * 1.0e-6
+  raise RuntimeError( f'No import time reported for {module}' )
+
+def benchImports( args ):
+
+  results = []
+  for module in MODULES:
+    dt = min( _importTime( module ) for i in range( args.repeat ) )
+    print( f'  import {module:<20} {dt*1.0e3:8.1f} ms' )
+    results.append( { 'module' : module, 'seconds' : dt } )
+
+  for script in SCRIPTS:
+    dt = min( _run( [os.path.join( ROOT, 'bin', script ), '--help'] )[0] for i in range( args.repeat ) )
+    print( f'  {script + " --help":<27} {dt*1.0e3:8.1f} ms' )
+    results.append( { 'script' : script, 'seconds' : dt } )
+
+  code  = 'import aws_atmo; aws_atmo.NEXRAD_STATION_IDS; aws_atmo.CONFIG'       # First use parses the YAML files, or reads the cache
+  cache = tempfile.mkdtemp()
+  try:
+    for name in ('cold', 'warm'):
+      times = []
+      for i in range( args.repeat ):
+        if name == 'cold': shutil.rmtree( os.path.join( cache, 'aws_atmo' ), ignore_errors = True )
+        times.append( _run( ['-c', code], {'XDG_CACHE_HOME' : cache} )[0] )
+      dt = min( times )
+      print( f'  station list, {name} cache  {dt*1.0e3:8.1f} ms' )
+      results.append( { 'cache' : name, 'seconds' : dt } )
+  finally:
+    shutil.rmtree( cache )
+  return results
+
+BENCHMARKS = {
+  'throughput' : benchThroughput,
+  'filesize'   : benchFileSize,
+  'parseidx'   : benchParseIDX,
+  'stats'      : benchStats,
+  'paths'      : benchPaths,
+  'queue'      : benchQueue,
+  'keys'       : benchKeys,
+  'batches'    : benchBatches,
+  'empty'      : benchEmpty,
+  'resume'     : benchResume,
+  'logging'    : benchLogging,
+  'imports'    : benchImports,
+}
+
+def main():
+  parser = argparse.ArgumentParser( description = __doc__,
+    formatter_class = argparse.RawDescriptionHelpFormatter )
+  parser.add_argument( 'benchmarks',  type = str,   nargs = '*', help = f'Benchmarks to run; any of {", ".join(BENCHMARKS)}. Default is all' )
+  parser.add_argument( '--stations',  type = int,   default = 10 )
+  parser.add_argument( '--volumes',   type = int,   default = 10,   help = 'Volumes per station' )
+  parser.add_argument( '--size',      type = float, default = 2.0,  help = 'Volume size in MB' )
+  parser.add_argument( '--jobs',      type = int,   nargs = '+', default = [1, 4, 16] )
+  parser.add_argument( '--total',     type = float, default = 64.0, help = 'Total MB for the filesize benchmark' )
+  parser.add_argument( '--items',     type = int,   default = 5000, help = 'Files for the queue benchmark' )
+  parser.add_argument( '--keys',      type = int,   default = 1000000, help = 'Keys in the listing for the keys benchmark' )
+  parser.add_argument( '--perday',    type = int,   default = 288,  help = 'Volumes per station-day for the keys benchmark' )
+  parser.add_argument( '--batches',   type = int,   default = 100,  help = 'Sequential downloads for the batches benchmark' )
+  parser.add_argument( '--nfiles',    type = int,   nargs = '+', default = [4, 64, 512], help = 'Numbers of files for the filesize benchmark' )
+  parser.add_argument( '--latency',   type = float, default = 0.02, help = 'Per-request latency in seconds' )
+  parser.add_argument( '--bandwidth', type = float, default = 50.0, help = 'Per-connection bandwidth in MB/s' )
+  parser.add_argument( '--idx',       type = str,   help = 'Real wrfnat idx file; synthesized if not given' )
+  parser.add_argument( '--levels',    type = int,   default = 50,   help = 'Hybrid levels in synthesized idx data' )
+  parser.add_argument( '--years',     type = float, default = 10.0, help = 'Years of dates for the paths benchmark' )
+  parser.add_argument( '--repeat',    type = int,   default = 5,    help = 'Repeats for timing micro-benchmarks' )
+  parser.add_argument( '--output',    type = str,   help = 'JSON file to write results to' )
+  args = parser.parse_args()
+  for name in args.benchmarks:
+    if name not in BENCHMARKS: parser.error( f'Unknown benchmark : {name}' )
+
+  from aws_atmo import __version__
+
+  output = { 'version'  : __version__,
+             'python'   : sys.version.split()[0],
+             'platform' : platform.platform(),
+             'date'     : datetime.utcnow().isoformat(),
+             'results'  : {} }
+  for name in (args.benchmarks or BENCHMARKS):
+    print( name )
+    output['results'][name] = BENCHMARKS[name]( args )
+
+  if args.output:
+    with open( args.output, 'w' ) as fid:
+      json.dump( output, fid, indent = 2 )
+
+if __name__ == "__main__":
+  main()
@@ -14,10 +14,11 @@ setuptools.setup(
   author_email         = "krwodzicki@gmail.com",
   version              = main_ns['__version__'],
   packages             = setuptools.find_packages(),
-  install_requires     = [ "boto3", "pyyaml"],
+  install_requires     = [ "boto3", "pyyaml", "numpy"],
   include_package_data = True,
    package_data        = {"" : ["data/*.xml", "data/*.txt", "data/*.json", "data/*.yml"]},
   scripts              = ["bin/aws_gfs_download",
-                          "bin/aws_hrrr_download"],
+                          "bin/aws_hrrr_download",
+                          "bin/aws_atmo_daemon"],
   zip_safe             = False,
 )